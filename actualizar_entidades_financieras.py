@@ -181,43 +181,6 @@ class ActualizadorEntidadesFinancieras:
         
         return efc_ejemplo
     
-    def procesar_entidad(self, datos: Dict) -> EntidadFinanciera:
-        """Procesa y crea una entidad financiera desde los datos"""
-        
-        # Limpiar y normalizar datos
-        nombre = datos.get('nombre', '').strip()
-        nombre_comercial = datos.get('nombre_comercial', '').strip()
-        tipo_entidad = datos.get('tipo_entidad', 'Banco').strip()
-        codigo_entidad = datos.get('codigo_entidad', '').strip()
-        
-        # Crear entidad
-        entidad = EntidadFinanciera(
-            nombre=nombre,
-            nombre_comercial=nombre_comercial if nombre_comercial else None,
-            tipo_entidad=tipo_entidad,
-            codigo_entidad=codigo_entidad,
-            estado=datos.get('estado', 'Activo'),
-            fecha_autorizacion=datetime.strptime(datos.get('fecha_autorizacion', '1900-01-01'), '%Y-%m-%d').date() if datos.get('fecha_autorizacion') else None,
-            direccion_completa=datos.get('direccion_completa', ''),
-            direccion=datos.get('direccion', ''),
-            numero=datos.get('numero', ''),
-            codigo_postal=datos.get('codigo_postal', ''),
-            localidad=datos.get('localidad', ''),
-            provincia=datos.get('provincia', ''),
-            comunidad_autonoma=datos.get('comunidad_autonoma', ''),
-            telefono=datos.get('telefono', ''),
-            email=datos.get('email', ''),
-            web=datos.get('web', ''),
-            cif_nif=datos.get('cif_nif', ''),
-            supervisor_principal=datos.get('supervisor_principal', 'Banco de España'),
-            fuente_datos='Banco de España',
-            version_datos=datetime.now().strftime('%Y%m%d'),
-            nombre_busqueda=self.limpiar_texto(nombre),
-            localidad_busqueda=self.limpiar_texto(datos.get('localidad', ''))
-        )
-        
-        return entidad
-    
     def actualizar_base_datos(self, forzar_actualizacion: bool = False) -> Dict:
         """
         Actualiza la base de datos de entidades financieras
@@ -241,55 +204,11 @@ class ActualizadorEntidadesFinancieras:
                         'entidades_actualizadas': 0
                     }
                 
-                entidades_nuevas = 0
-                entidades_actualizadas = 0
-                
-                for datos_entidad in todas_entidades:
-                    codigo_entidad = datos_entidad.get('codigo_entidad')
-                    
-                    if not codigo_entidad:
-                        continue
-                    
-                    # Buscar si ya existe
-                    entidad_existente = EntidadFinanciera.query.filter_by(
-                        codigo_entidad=codigo_entidad
-                    ).first()
-                    
-                    if entidad_existente:
-                        # Actualizar entidad existente
-                        if forzar_actualizacion:
-                            entidad_procesada = self.procesar_entidad(datos_entidad)
-                            
-                            # Actualizar campos
-                            entidad_existente.nombre = entidad_procesada.nombre
-                            entidad_existente.nombre_comercial = entidad_procesada.nombre_comercial
-                            entidad_existente.tipo_entidad = entidad_procesada.tipo_entidad
-                            entidad_existente.estado = entidad_procesada.estado
-                            entidad_existente.direccion_completa = entidad_procesada.direccion_completa
-                            entidad_existente.direccion = entidad_procesada.direccion
-                            entidad_existente.numero = entidad_procesada.numero
-                            entidad_existente.codigo_postal = entidad_procesada.codigo_postal
-                            entidad_existente.localidad = entidad_procesada.localidad
-                            entidad_existente.provincia = entidad_procesada.provincia
-                            entidad_existente.comunidad_autonoma = entidad_procesada.comunidad_autonoma
-                            entidad_existente.telefono = entidad_procesada.telefono
-                            entidad_existente.email = entidad_procesada.email
-                            entidad_existente.web = entidad_procesada.web
-                            entidad_existente.cif_nif = entidad_procesada.cif_nif
-                            entidad_existente.fecha_ultima_actualizacion = datetime.utcnow()
-                            entidad_existente.version_datos = entidad_procesada.version_datos
-                            entidad_existente.nombre_busqueda = entidad_procesada.nombre_busqueda
-                            entidad_existente.localidad_busqueda = entidad_procesada.localidad_busqueda
-                            
-                            entidades_actualizadas += 1
-                    else:
-                        # Crear nueva entidad
-                        nueva_entidad = self.procesar_entidad(datos_entidad)
-                        db.session.add(nueva_entidad)
-                        entidades_nuevas += 1
-                
-                # Commit de cambios
-                db.session.commit()
+                # Upsert por bloques: solo se escriben las entidades nuevas o que han cambiado
+                from utils.upsert_entidades import upsert_entidades
+                resumen = upsert_entidades(todas_entidades, actualizar=forzar_actualizacion)
+                entidades_nuevas = resumen['nuevas']
+                entidades_actualizadas = resumen['actualizadas']
                 
                 resultado = {
                     'success': True,
@@ -297,6 +216,7 @@ class ActualizadorEntidadesFinancieras:
                     'entidades_procesadas': len(todas_entidades),
                     'entidades_nuevas': entidades_nuevas,
                     'entidades_actualizadas': entidades_actualizadas,
+                    'entidades_sin_cambios': resumen['sin_cambios'],
                     'fecha_actualizacion': datetime.now().isoformat()
                 }
                 
@@ -304,6 +224,7 @@ class ActualizadorEntidadesFinancieras:
                 print(f"   - Entidades procesadas: {resultado['entidades_procesadas']}")
                 print(f"   - Entidades nuevas: {resultado['entidades_nuevas']}")
                 print(f"   - Entidades actualizadas: {resultado['entidades_actualizadas']}")
+                print(f"   - Entidades sin cambios: {resultado['entidades_sin_cambios']}")
                 
                 return resultado
                 
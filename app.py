@@ -1,16 +1,24 @@
-from flask import Flask, render_template, request, redirect, session, url_for, flash, send_file
+from flask import Flask, render_template, request, redirect, session, url_for, flash, send_file, Response, stream_with_context, jsonify
 from models import db, User, Banco, AccessLog, FormularioRPC, DatosLector, Procedimiento, EntidadFinanciera, TipoVia
 from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import datetime, timedelta
 import json
-import requests
 import os
 from utils.pdf_generator import PDFGenerator
 from utils.rgpd_destinatarios import PREDEFINED_DESTINATARIOS
+from utils.rgpd_lote import destinatario_desde_entidad
+from utils.catalogo_entidades import catalogo_entidades
+from utils.respuestas_condicionales import respuesta_condicional, etag_catalogo, ultima_modificacion, version_tipos_via
 from utils.email_sender import EmailSender
-from utils.external_queries import consultar_rpc, consultar_boe_tablon, consulta_total_integrada
+from utils.importaciones_diferidas import diferir
 from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
+import click
+import time
+
+# Pilas pesadas que solo usan algunas rutas: se importan en el primer uso
+# (o en el maestro de gunicorn antes del fork, ver gunicorn.conf.py)
+requests = diferir('requests')
 
 # Cargar variables de entorno
 load_dotenv()
@@ -469,8 +477,12 @@ def admin_bancos():
         flash("No tienes permisos para acceder a esta sección.", "danger")
         return redirect(url_for("menu"))
     
-    entidades = EntidadFinanciera.query.order_by(EntidadFinanciera.nombre.asc()).all()
-    return render_template("admin_bancos.html", bancos=entidades)
+    def renderizar():
+        entidades = EntidadFinanciera.query.order_by(EntidadFinanciera.nombre.asc()).all()
+        return render_template("admin_bancos.html", bancos=entidades)
+
+    return respuesta_condicional(etag_catalogo(usuario, "admin_bancos.html"), renderizar,
+                                 last_modified=ultima_modificacion())
 
 
 def _get_entidad_form_from_request(req):
@@ -511,6 +523,7 @@ def admin_crear_banco():
         entidad.direccion_completa = ', '.join([p for p in parts if p])
         db.session.add(entidad)
         db.session.commit()
+        catalogo_entidades.invalidar()
         flash('Entidad creada correctamente.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -536,6 +549,7 @@ def admin_editar_banco(entidad_id):
         parts = [data.get('direccion'), data.get('numero'), data.get('codigo_postal'), data.get('localidad'), data.get('provincia'), data.get('comunidad_autonoma')]
         entidad.direccion_completa = ', '.join([p for p in parts if p])
         db.session.commit()
+        catalogo_entidades.invalidar()
         flash('Entidad actualizada.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -557,6 +571,7 @@ def admin_eliminar_banco(entidad_id):
         entidad = EntidadFinanciera.query.get_or_404(entidad_id)
         db.session.delete(entidad)
         db.session.commit()
+        catalogo_entidades.invalidar()
         flash('Entidad eliminada.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -574,41 +589,15 @@ def admin_export_entidades():
         flash('No tienes permisos.', 'danger')
         return redirect(url_for('menu'))
 
-    entidades = EntidadFinanciera.query.order_by(EntidadFinanciera.nombre.asc()).all()
-    from io import BytesIO
-    import pandas as pd
-    buffer = BytesIO()
-    rows = []
-    for e in entidades:
-        rows.append({
-            'NOMBRE': e.nombre,
-            'NOMBRE_COMERCIAL': e.nombre_comercial,
-            'TIPO_ENTIDAD': e.tipo_entidad,
-            'CODIGO_ENTIDAD': e.codigo_entidad,
-            'DIRECCION': e.direccion,
-            'NUMERO': e.numero,
-            'CODIGO_POSTAL': e.codigo_postal,
-            'LOCALIDAD': e.localidad,
-            'PROVINCIA': e.provincia,
-            'CCAA': e.comunidad_autonoma,
-            'TELEFONO': e.telefono,
-            'WEB': e.web,
-            'EMAIL_DOC9': e.email_doc9,
-            'EMAIL_RGPD': e.email_rgpd,
-            'EMAIL_GENERAL': e.email_general,
-            'ESTADO': e.estado,
-            'SUPERVISOR': e.supervisor_principal,
-        })
+    from utils.exportacion_entidades import FORMATOS
+    from utils.respuestas_condicionales import enviar_exportacion
+    formato = request.args.get('formato', 'xlsx').lower()
+    if formato not in FORMATOS:
+        flash('Formato de exportación no soportado.', 'warning')
+        return redirect(url_for('admin_bancos'))
 
-    df = pd.DataFrame(rows)
-    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='ENTIDADES')
-        ws = writer.sheets['ENTIDADES']
-        for col in ws.iter_cols(min_row=1, max_row=1):
-            for cell in col:
-                cell.font = cell.font.copy(bold=True)
-    buffer.seek(0)
-    return send_file(buffer, as_attachment=True, download_name='entidades_financieras.xlsx', mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    # Un fichero por versión del catálogo y formato, compartido por los workers
+    return enviar_exportacion(formato, 'entidades_financieras')
 
 @app.route("/admin/doc9")
 def admin_doc9():
@@ -655,6 +644,73 @@ def panel_admin():
     formularios = FormularioRPC.query.order_by(FormularioRPC.created_at.desc()).all()
     return render_template("panel_admin.html", formularios=formularios)
 
+@app.route("/admin/formularios/export")
+def admin_export_formularios():
+    """Descarga en streaming los PDF de los formularios RPC filtrados por DNI, usuario o fechas"""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        flash(result, "warning")
+        return redirect(url_for("login"))
+
+    usuario = result
+    if usuario.role != "admin":
+        flash("No tienes permisos para acceder a esta sección.", "danger")
+        return redirect(url_for("menu"))
+
+    from utils.exportacion_lotes import LIMITE_PDF_COMBINADO, iterar_pdfs, stream_zip, stream_pdf_combinado
+
+    def _parse_date(value):
+        if not value:
+            return None
+        for fmt in ("%d-%m-%Y", "%Y-%m-%d"):
+            try:
+                return datetime.strptime(value, fmt)
+            except Exception:
+                continue
+        return None
+
+    query = FormularioRPC.query
+    dni = request.args.get('dni', '').strip().upper()
+    if dni:
+        query = query.filter(FormularioRPC.dni_nie == dni)
+    usuario_filtro = request.args.get('usuario', '').strip()
+    if usuario_filtro:
+        if usuario_filtro.isdigit():
+            query = query.filter(FormularioRPC.usuario_id == int(usuario_filtro))
+        else:
+            query = query.join(User, FormularioRPC.usuario_id == User.id).filter(User.username == usuario_filtro)
+    desde = _parse_date(request.args.get('desde', '').strip())
+    hasta = _parse_date(request.args.get('hasta', '').strip())
+    if desde:
+        query = query.filter(FormularioRPC.created_at >= desde)
+    if hasta:
+        query = query.filter(FormularioRPC.created_at < hasta + timedelta(days=1))
+
+    if not (dni or usuario_filtro or desde or hasta):
+        flash("Indica un DNI/NIE, un usuario o un rango de fechas para exportar.", "warning")
+        return redirect(url_for("panel_admin"))
+
+    # El PDF combinado se monta entero antes de enviar nada: solo para lotes pequeños
+    combinado = request.args.get('formato', 'zip') == 'pdf'
+    if combinado and query.count() > LIMITE_PDF_COMBINADO:
+        app.logger.info(f"Exportación de formularios con más de {LIMITE_PDF_COMBINADO} documentos: se entrega ZIP")
+        combinado = False
+
+    query = query.order_by(FormularioRPC.created_at.asc(), FormularioRPC.id.asc())
+    pdfs = iterar_pdfs(pdf_generator, query)
+    nombre = f"formularios_rpc_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+
+    if combinado:
+        cuerpo, mimetype, nombre = stream_pdf_combinado(pdfs), 'application/pdf', f"{nombre}.pdf"
+    else:
+        cuerpo, mimetype, nombre = stream_zip(pdfs), 'application/zip', f"{nombre}.zip"
+
+    return Response(
+        stream_with_context(cuerpo),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{nombre}"'}
+    )
+
 # Rutas para formularios RPC
 @app.route("/rpc", methods=["GET", "POST"])
 def formulario_rpc():
@@ -774,18 +830,8 @@ def doc9_form():
             flash("No tienes permisos para acceder a este formulario.", "danger")
             return redirect(url_for("menu"))
     
-    # Preparar listas y bancos
-    bancos = EntidadFinanciera.query.order_by(EntidadFinanciera.nombre.asc()).all()
-    bancos_ctx = [{
-        'nombre': b.nombre,
-        'direccion': b.direccion or '',
-        'num': (b.numero if hasattr(b, 'numero') else None) or (b.num if hasattr(b, 'num') else ''),
-        'cp': (b.codigo_postal if hasattr(b, 'codigo_postal') else None) or (b.cp if hasattr(b, 'cp') else ''),
-        'localidad': b.localidad or '',
-        'provincia': b.provincia or '',
-        'ccaa': (b.comunidad_autonoma if hasattr(b, 'comunidad_autonoma') else None) or (b.ccaa if hasattr(b, 'ccaa') else ''),
-        'email_general': (b.email_general or '') or (b.email_doc9 or '')
-    } for b in bancos]
+    # Preparar listas y bancos (instantánea del catálogo, sin consultas)
+    bancos_ctx = catalogo_entidades.snapshot().bancos_doc9
 
     tipos_deuda = [
         "Tarjeta de crédito",
@@ -840,14 +886,16 @@ def doc9_form():
             flash("Acreedor añadido al Documento 9.", "success")
             return redirect(url_for('doc9_form'))
 
-    return render_template(
+    # Los acreedores añadidos en la sesión también forman parte de la página
+    etag = etag_catalogo(usuario, "doc9_form.html", registros)
+    return respuesta_condicional(etag, lambda: render_template(
         "doc9_form.html",
         bancos=bancos_ctx,
         tipos_deuda=tipos_deuda,
         cuotas_opciones=cuotas_opciones,
         garantias_opciones=garantias_opciones,
         registros=registros
-    )
+    ))
 
 @app.route('/doc9_export')
 def doc9_export():
@@ -861,78 +909,19 @@ def doc9_export():
         flash("No hay registros para exportar.", "warning")
         return redirect(url_for('doc9_form'))
 
-    # Patrón fijo de columnas y normalización de datos
-    columnas = [
-        "ACREEDOR",
-        "DOMICILIO Y CORREO ELECTRÓNICO",
-        "NATURALEZA DEL CRÉDITO",
-        "CRÉDITO PENDIENTE",
-        "CUOTAS VENCIDAS",
-        "GARANTÍAS",
-    ]
-
-    filas = []
-    for r in registros:
-        # Convertir importe a número
-        importe_raw = (
-            r.get("Crédito pendiente")
-            or r.get("CRÉDITO PENDIENTE")
-            or r.get("Crédito pendiente (€)")
-            or r.get("CRÉDITO PENDIENTE (€)")
-            or "0"
-        )
-        try:
-            importe_val = float(str(importe_raw).replace('.', '').replace(',', '.'))
-        except Exception:
-            importe_val = 0.0
-        filas.append({
-            "ACREEDOR": r.get("Acreedor") or r.get("ACREEDOR", ""),
-            "DOMICILIO Y CORREO ELECTRÓNICO": r.get("Domicilio y correo electrónico") or r.get("DOMICILIO Y CORREO ELECTRÓNICO", ""),
-            "NATURALEZA DEL CRÉDITO": r.get("Naturaleza del crédito") or r.get("NATURALEZA DEL CRÉDITO", ""),
-            "CRÉDITO PENDIENTE": importe_val,
-            "CUOTAS VENCIDAS": r.get("Cuotas vencidas") or r.get("CUOTAS VENCIDAS", ""),
-            "GARANTÍAS": r.get("Garantías") or r.get("GARANTÍAS", ""),
-        })
+    from utils.doc9_export import exportar, FORMATOS
+    formato = request.args.get('formato', 'xlsx').lower()
+    if formato not in FORMATOS:
+        flash("Formato de exportación no soportado.", "warning")
+        return redirect(url_for('doc9_form'))
 
-    # Exportar a Excel (XLSX)
     from io import BytesIO
-    import pandas as pd
-    output = BytesIO()
-    df = pd.DataFrame(filas, columns=columnas)
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='DOC9')
-        # Formatos y anchos básicos
-        ws = writer.sheets['DOC9']
-        for col_cells in ws.iter_cols(min_row=1, max_row=1):
-            for cell in col_cells:
-                cell.font = cell.font.copy(bold=True)
-        # Anchos aproximados
-        widths = [28, 46, 30, 20, 18, 22]
-        for i, w in enumerate(widths, start=1):
-            ws.column_dimensions[chr(64+i)].width = w
-
-        # Formato numérico para importe (columna D)
-        for cell in ws['D'][1:]:  # excepto cabecera
-            cell.number_format = '#,##0.00'
-
-        # Fila de TOTAL PASIVO
-        total_row = len(filas) + 2  # +1 cabecera, +1 porque Excel es 1-based
-        ws.cell(row=total_row, column=3, value='TOTAL PASIVO')
-        total_cell = ws.cell(row=total_row, column=4)
-        total_cell.value = f"=SUM(D2:D{len(filas)+1})"
-        total_cell.number_format = '#,##0.00'
-        # Negrita en total
-        ws.cell(row=total_row, column=3).font = ws.cell(row=1, column=1).font.copy(bold=True)
-        ws.cell(row=total_row, column=4).font = ws.cell(row=1, column=1).font.copy(bold=True)
-
-    output.seek(0)
-    from flask import send_file
-    filename = "DOC. 9 Lista Acreedores.xlsx"
+    contenido, mimetype, filename = exportar(registros, formato)
     return send_file(
-        output,
+        BytesIO(contenido),
         as_attachment=True,
         download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        mimetype=mimetype
     )
 
 @app.route('/doc9_clear')
@@ -1015,6 +1004,38 @@ def gestion_derechos_opcion_pdf():
 pdf_generator = PDFGenerator()
 email_sender = EmailSender()
 
+import utils.email_sender as _email_sender_module
+
+# Sesiones SMTP persistentes y reutilizadas entre envíos (SMTP_POOL=False para desactivar)
+if os.environ.get('SMTP_POOL', 'True').lower() == 'true':
+    from utils.smtp_pool import activar_pool_smtp
+    if not activar_pool_smtp(_email_sender_module):
+        app.logger.warning("EmailSender no usa smtplib a nivel de módulo; pool SMTP no activado")
+
+# Codificación base64 de adjuntos cacheada por fichero de origen (reenvíos sin recodificar)
+from utils.adjuntos import activar_cache_mime
+activar_cache_mime(_email_sender_module)
+
+# Métricas de duración, tamaño y páginas de cada documento generado / email enviado
+from utils.metricas_documentos import registro_metricas, instrumentar, resumir, cargar_directorio
+registro_metricas.directorio = os.environ.get(
+    'METRICAS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metricas')
+)
+instrumentar(pdf_generator, 'PDFGenerator')
+instrumentar(email_sender, 'EmailSender')
+
+# Cola de emails: las rutas encolan y el worker entrega en segundo plano.
+# OUTBOX_WORKER=hilo arranca un hilo por proceso; 'externo' deja la entrega
+# a `flask outbox-worker` ejecutado como servicio aparte.
+from utils.email_outbox import worker_outbox, encolar_email, encolar_bienvenida
+worker_outbox.configurar(app, email_sender)
+OUTBOX_WORKER = os.environ.get('OUTBOX_WORKER', 'hilo').lower()
+
+@app.before_request
+def iniciar_worker_outbox():
+    if OUTBOX_WORKER == 'hilo':
+        worker_outbox.iniciar()
+
 @app.route("/gestion_derechos_enviar_pdf")
 def gestion_derechos_enviar_pdf():
     access_valid, result = check_user_access()
@@ -1033,14 +1054,12 @@ def gestion_derechos_enviar_pdf():
     try:
         pdf_filename = pdf_generator.generate_rights_pdf(form_data)
         
-        # Enviar por email
+        # Encolar el email; el worker de la cola hace la entrega SMTP
         recipient_email = form_data.get('email', '')
         if recipient_email:
-            success, message = email_sender.send_rights_rgpd_email(recipient_email, form_data, pdf_filename)
-            if success:
-                flash(f"PDF generado y enviado correctamente a {recipient_email}", "success")
-            else:
-                flash(f"PDF generado pero error al enviar email: {message}", "warning")
+            mensaje = encolar_email('send_rights_rgpd_email', recipient_email, recipient_email, form_data, pdf_filename,
+                                    asunto="Solicitud de derechos RGPD", usuario_id=session.get("user_id"))
+            flash(f"PDF generado. Email a {recipient_email} en cola de envío (n.º {mensaje.id}).", "success")
         else:
             flash("PDF generado correctamente", "success")
         
@@ -1114,18 +1133,18 @@ def send_pdf_email(filename):
             flash("No se encontró email del usuario", "danger")
             return redirect(url_for("menu"))
         
-        # Enviar email
-        success, message = email_sender.send_pdf_email(
+        # Encolar email
+        mensaje = encolar_email(
+            'send_pdf_email',
+            user_email,
             user_email,
             f"Documento {filename}",
             f"Se adjunta el documento {filename} generado por el sistema.",
-            filename
+            filename,
+            asunto=f"Documento {filename}",
+            usuario_id=result.id
         )
-        
-        if success:
-            flash(f"Email enviado correctamente a {user_email}", "success")
-        else:
-            flash(f"Error al enviar email: {message}", "danger")
+        flash(f"Email a {user_email} en cola de envío (n.º {mensaje.id}).", "success")
         
     except Exception as e:
         flash(f"Error al enviar email: {str(e)}", "danger")
@@ -1168,11 +1187,18 @@ def datos_procedimiento():
             "tipo_concurso": request.form.get("tipo_concurso"),
         }
 
+        # Juzgado del directorio (nombre canónico e id) si el texto corresponde a uno conocido
+        from juzgados_mercantil_2025 import emparejar_juzgado, id_juzgado
+        juzgado = emparejar_juzgado(procedure_data["juzgado"])
+        if juzgado:
+            procedure_data["juzgado"] = juzgado.nombre
+
         # Guardar también en BD para analítica
         try:
             proc = Procedimiento(
                 num_procedimiento=procedure_data["num_procedimiento"] or "",
                 juzgado=procedure_data["juzgado"] or "",
+                juzgado_id=id_juzgado(juzgado.codigo) if juzgado else None,
                 usuario_id=session.get("user_id")
             )
 
@@ -1197,7 +1223,11 @@ def datos_procedimiento():
             if procedure_data["tipo_concurso"] in ("Con masa", "Sin masa"):
                 proc.tipo_concurso = procedure_data["tipo_concurso"]
 
+            # Rollup de analítica por (juzgado, mes, tipo de concurso) en la misma transacción
+            from utils.rollup_juzgados import registrar_procedimiento
             db.session.add(proc)
+            db.session.flush()
+            registrar_procedimiento(proc)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -1211,13 +1241,22 @@ def datos_procedimiento():
         flash("Datos del procedimiento guardados correctamente.", "success")
         return redirect(url_for("gestion_derechos_opcion_pdf"))
     
-    # Importar lista completa de juzgados mercantiles 2025
-    from juzgados_mercantil_2025 import JUZGADOS_MERCANTILES_2025
-    
-    # Lista de juzgados para el formulario (solo mercantiles)
-    juzgados = JUZGADOS_MERCANTILES_2025
-    
-    return render_template("datos_procedimiento.html", juzgados=juzgados)
+    # Lista de juzgados para el formulario (solo mercantiles), agrupada por provincia
+    from juzgados_mercantil_2025 import JUZGADOS_MERCANTILES_2025, POR_PROVINCIA
+
+    return render_template("datos_procedimiento.html", juzgados=JUZGADOS_MERCANTILES_2025,
+                           juzgados_por_provincia=POR_PROVINCIA)
+
+@app.route("/api/juzgados")
+def api_juzgados():
+    """Directorio de juzgados mercantiles: ?q=texto&provincia=&limite="""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        return jsonify({"error": result}), 401
+    from juzgados_mercantil_2025 import buscar, id_juzgado
+    juzgados = buscar(request.args.get('q', ''), provincia=request.args.get('provincia', '').strip() or None,
+                      limite=request.args.get('limite', type=int))
+    return jsonify({"resultados": [{**j.to_dict(), "id": id_juzgado(j.codigo)} for j in juzgados]})
 
 # Analítica de juzgados (admin)
 @app.route("/admin/juzgados_analytics")
@@ -1238,13 +1277,8 @@ def admin_juzgados_analytics():
     admision_start_str = request.args.get('admision_start', '').strip()
     admision_end_str = request.args.get('admision_end', '').strip()
 
-    query = Procedimiento.query.filter(
-        Procedimiento.fecha_presentacion_demanda.isnot(None),
-        Procedimiento.fecha_admision.isnot(None),
-        Procedimiento.juzgado.isnot(None)
-    )
-
     from datetime import datetime as _dt
+    from utils.analitica_juzgados import condiciones_fechas, resumen_por_juzgado, total_procedimientos
     filtro_aplicado = False
     presentacion_start = None
     presentacion_end = None
@@ -1273,43 +1307,20 @@ def admin_juzgados_analytics():
             presentacion_start, presentacion_end = presentacion_end, presentacion_start
         if admision_start and admision_end and admision_start > admision_end:
             admision_start, admision_end = admision_end, admision_start
-
-        # Aplicar filtros independientes
-        if presentacion_start:
-            query = query.filter(Procedimiento.fecha_presentacion_demanda >= presentacion_start)
-            filtro_aplicado = True
-        if presentacion_end:
-            query = query.filter(Procedimiento.fecha_presentacion_demanda <= presentacion_end)
-            filtro_aplicado = True
-        if admision_start:
-            query = query.filter(Procedimiento.fecha_admision >= admision_start)
-            filtro_aplicado = True
-        if admision_end:
-            query = query.filter(Procedimiento.fecha_admision <= admision_end)
-            filtro_aplicado = True
     except Exception:
         flash("Formato de fechas inválido. Use DD-MM-AAAA.", "warning")
 
-    registros = query.all()
-
-    from collections import defaultdict
-    import math
-
-    dias_por_juzgado = defaultdict(list)
-    for r in registros:
-        dias = (r.fecha_admision - r.fecha_presentacion_demanda).days
-        if dias is not None and dias >= 0:
-            dias_por_juzgado[r.juzgado].append(dias)
-
-    promedios = []
-    for juz, lista in dias_por_juzgado.items():
-        if lista:
-            avg = sum(lista) / len(lista)
-            promedios.append({
-                "juzgado": juz,
-                "promedio_dias": round(avg, 1),
-                "muestras": len(lista)
-            })
+    # Con meses completos de presentación y sin filtro de admisión bastan las filas de rollup;
+    # si no, filtros, agregados y percentiles se resuelven en SQL (una fila por juzgado)
+    from utils.rollup_juzgados import rollup_construido, rango_en_meses, resumen_desde_rollups
+    condiciones = condiciones_fechas(presentacion_start, presentacion_end, admision_start, admision_end)
+    filtro_aplicado = bool(condiciones)
+    meses = rango_en_meses(presentacion_start, presentacion_end)
+    if rollup_construido() and meses and not (admision_start or admision_end):
+        promedios, total_registros = resumen_desde_rollups(*meses)
+    else:
+        promedios = resumen_por_juzgado(condiciones)
+        total_registros = total_procedimientos(condiciones)
 
     # Ordenar y seleccionar top 6
     mas_rapidos = sorted(promedios, key=lambda x: x["promedio_dias"])[:6]
@@ -1319,7 +1330,7 @@ def admin_juzgados_analytics():
         "admin_juzgados_analytics.html",
         mas_rapidos=mas_rapidos,
         mas_lentos=mas_lentos,
-        total_registros=len(registros),
+        total_registros=total_registros,
         presentacion_start=presentacion_start.strftime('%d-%m-%Y') if presentacion_start else '',
         presentacion_end=presentacion_end.strftime('%d-%m-%Y') if presentacion_end else '',
         admision_start=admision_start.strftime('%d-%m-%Y') if admision_start else '',
@@ -1327,6 +1338,49 @@ def admin_juzgados_analytics():
         filtro_aplicado=filtro_aplicado
     )
 
+@app.route("/api/analitica/juzgados/series")
+def api_series_juzgados():
+    """
+    Series temporales para el panel: ?resolucion=semana|mes|trimestre&desde=&hasta=
+    &juzgado=1,2&tipo_concurso=&max_puntos=. Respuesta columnar (eje ``periodos``
+    y listas alineadas por juzgado).
+    """
+    access_valid, result = check_user_access()
+    if not access_valid:
+        return jsonify({"error": result}), 401
+    if result.role != "admin":
+        return jsonify({"error": "No tienes permisos para acceder a esta sección."}), 403
+
+    from datetime import datetime as _dt
+    from utils.series_juzgados import MAX_PUNTOS, RESOLUCIONES, ALIAS_RESOLUCION, series_juzgados
+
+    def _parse_date(value):
+        for fmt in ("%d-%m-%Y", "%Y-%m-%d"):
+            try:
+                return _dt.strptime(value, fmt).date()
+            except ValueError:
+                continue
+        raise ValueError(value)
+
+    resolucion = request.args.get('resolucion', 'mes').strip().lower()
+    resolucion = ALIAS_RESOLUCION.get(resolucion, resolucion)
+    if resolucion not in RESOLUCIONES:
+        return jsonify({"error": f"Resolución no válida. Use {', '.join(RESOLUCIONES)}."}), 400
+    try:
+        desde = _parse_date(request.args['desde'].strip()) if request.args.get('desde', '').strip() else None
+        hasta = _parse_date(request.args['hasta'].strip()) if request.args.get('hasta', '').strip() else None
+        juzgado_ids = sorted({int(v) for v in request.args.get('juzgado', '').split(',') if v.strip()})
+    except ValueError:
+        return jsonify({"error": "Filtros inválidos. Fechas en DD-MM-AAAA y juzgados como ids separados por comas."}), 400
+    if desde and hasta and desde > hasta:
+        desde, hasta = hasta, desde
+    tipo_concurso = request.args.get('tipo_concurso')
+    max_puntos = min(max(request.args.get('max_puntos', MAX_PUNTOS, type=int), 2), 1000)
+
+    datos = series_juzgados(resolucion, desde, hasta, juzgado_ids or None,
+                            tipo_concurso.strip() if tipo_concurso is not None else None, max_puntos)
+    return jsonify(datos)
+
 # Rutas para crear usuario
 @app.route("/crear_usuario", methods=["GET", "POST"])
 def crear_usuario():
@@ -1529,31 +1583,15 @@ def admin_crear_usuario():
         
         flash(f"Usuario '{username}' creado correctamente.", "success")
 
-        # Si se generó contraseña, enviar email de bienvenida
+        # Si se generó contraseña, encolar email de bienvenida. La contraseña
+        # temporal no viaja por la cola: el worker la genera al entregarlo
         if generated_password and email:
-            subject = "Bienvenido - Credenciales de acceso"
             # Si existe plantilla DOCX, la usamos como HTML
-            docx_path = os.path.join(BASE_DIR, 'static', 'email_templates', 'bienvenida.docx')
+            docx_path = os.path.join(app.root_path, 'static', 'email_templates', 'bienvenida.docx')
             try:
-                if os.path.exists(docx_path):
-                    html, inline_images = email_sender.render_email_from_docx(docx_path, {
-                        'nombre': nombre,
-                        'apellidos': apellidos,
-                        'username': username,
-                        'password_temporal': generated_password,
-                    })
-                    email_sender.send_notification_email(email, subject, html, html=True, inline_images=inline_images)
-                else:
-                    body = (
-                        f"Hola {nombre} {apellidos},\n\n"
-                        f"Se ha creado tu usuario en el sistema.\n\n"
-                        f"Usuario: {username}\n"
-                        f"Contraseña temporal: {generated_password}\n\n"
-                        f"Por seguridad, cambia tu contraseña tras iniciar sesión."
-                    )
-                    email_sender.send_notification_email(email, subject, body)
+                encolar_bienvenida(nuevo_usuario, docx_path=docx_path)
             except Exception:
-                pass
+                db.session.rollback()
         
     except Exception as e:
         db.session.rollback()
@@ -1562,6 +1600,40 @@ def admin_crear_usuario():
     return redirect(url_for("admin_usuarios"))
 
 
+@app.route("/admin/lectores/importar", methods=["POST"])
+def admin_importar_lectores():
+    """Alta masiva de lectores desde un fichero CSV/XLSX subido en el panel de usuarios"""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        flash(result, "warning")
+        return redirect(url_for("login"))
+
+    if result.role != "admin":
+        flash("No tienes permisos para crear usuarios.", "danger")
+        return redirect(url_for("admin_usuarios"))
+
+    fichero = request.files.get('fichero')
+    if not fichero or not fichero.filename:
+        flash("Selecciona un fichero CSV o XLSX.", "warning")
+        return redirect(url_for("admin_usuarios"))
+    if not fichero.filename.lower().endswith(('.csv', '.xlsx', '.xlsm')):
+        flash("Formato no soportado. Usa CSV o XLSX.", "warning")
+        return redirect(url_for("admin_usuarios"))
+
+    # La petición solo guarda el fichero; el alta se hace fuera de ella
+    from utils.importacion_lectores import guardar_pendiente, procesar_en_segundo_plano
+    try:
+        nombre = guardar_pendiente(fichero.stream, fichero.filename,
+                                   enviar_bienvenida=request.form.get('enviar_bienvenida', '1') == '1')
+    except Exception as e:
+        flash(f"Error al guardar el fichero de lectores: {str(e)}", "danger")
+        return redirect(url_for("admin_usuarios"))
+    procesar_en_segundo_plano(app)
+
+    flash(f"Fichero {fichero.filename} recibido. Los lectores se darán de alta en segundo plano "
+          f"(resultado en instance/importaciones_lectores/procesados/{nombre}.resultado.json).", "success")
+    return redirect(url_for("admin_usuarios", role="lector"))
+
 @app.route("/admin/usuarios/<int:user_id>/editar", methods=["POST"])
 def admin_editar_usuario(user_id: int):
     access_valid, result = check_user_access()
@@ -1639,6 +1711,41 @@ def derechos_rgpd():
     
     return render_template("derechos_rgpd.html")
 
+@app.route("/api/entidades/buscar")
+def api_buscar_entidades():
+    """Autocompletado de entidades: ?q=texto&limite=N (sin acentos ni mayúsculas)"""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        return jsonify({"error": result}), 401
+    from utils.buscador_entidades import buscar_entidades, LIMITE_POR_DEFECTO
+    consulta = request.args.get('q', '').strip()
+    limite = request.args.get('limite', LIMITE_POR_DEFECTO, type=int)
+    return jsonify({"consulta": consulta, "resultados": buscar_entidades(consulta, limite)})
+
+@app.route("/api/codigos_postales/<cp>")
+def api_codigo_postal(cp):
+    """Localidades, provincia y CCAA de un código postal (autorrelleno de formularios)"""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        return jsonify({"error": result}), 401
+    from utils.codigos_postales import servicio_codigos_postales
+    datos = servicio_codigos_postales.resolver(cp)
+    if not datos["codigo_postal"]:
+        return jsonify({"error": "Código postal no válido."}), 400
+    return jsonify(datos)
+
+@app.route("/api/codigos_postales/buscar")
+def api_buscar_localidades():
+    """Localidades por prefijo (sin acentos) con sus códigos postales: ?q=&provincia=&limite="""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        return jsonify({"error": result}), 401
+    from utils.codigos_postales import servicio_codigos_postales, LIMITE_POR_DEFECTO
+    consulta = request.args.get('q', '').strip()
+    provincia = request.args.get('provincia', '').strip() or None
+    limite = request.args.get('limite', LIMITE_POR_DEFECTO, type=int)
+    return jsonify({"consulta": consulta, "resultados": servicio_codigos_postales.buscar(consulta, limite, provincia)})
+
 @app.route("/derecho_acceso", methods=["GET", "POST"])
 def derecho_acceso():
     access_valid, result = check_user_access()
@@ -1688,19 +1795,7 @@ def derecho_acceso():
                 if banco_id:
                     b = EntidadFinanciera.query.get(int(banco_id))
                     if b:
-                        destinatario = {
-                            "clave": "banco",
-                            "nombre": b.nombre,
-                            "email": b.email_rgpd or b.email_general or "",
-                            "tipo_via": "",
-                            "via": b.direccion or b.direccion_completa or "",
-                            "numero": b.numero or "",
-                            "extras": "",
-                            "cp": b.codigo_postal or "",
-                            "localidad": b.localidad or "",
-                            "provincia": b.provincia or "",
-                            "ccaa": b.comunidad_autonoma or "",
-                        }
+                        destinatario = destinatario_desde_entidad(b)
             except Exception:
                 pass
         else:
@@ -1728,10 +1823,13 @@ def derecho_acceso():
         except Exception as e:
             flash(f"Error al generar PDF: {str(e)}", "danger")
     
-    # bancos para selector
-    bancos = EntidadFinanciera.query.order_by(EntidadFinanciera.nombre.asc()).all()
-    tipos_via = TipoVia.query.filter_by(activo=True).order_by(TipoVia.nombre.asc()).all()
-    return render_template("derecho_acceso.html", datos=datos, usuario=usuario, bancos=bancos, tipos_via=tipos_via)
+    def renderizar():
+        # bancos para selector (instantánea compartida del catálogo)
+        bancos = catalogo_entidades.entradas()
+        tipos_via = TipoVia.query.filter_by(activo=True).order_by(TipoVia.nombre.asc()).all()
+        return render_template("derecho_acceso.html", datos=datos, usuario=usuario, bancos=bancos, tipos_via=tipos_via)
+
+    return respuesta_condicional(etag_catalogo(usuario, "derecho_acceso.html", datos, version_tipos_via()), renderizar)
 
 @app.route("/derecho_supresion", methods=["GET", "POST"])
 def derecho_supresion():
@@ -1780,19 +1878,7 @@ def derecho_supresion():
                 if banco_id:
                     b = EntidadFinanciera.query.get(int(banco_id))
                     if b:
-                        destinatario = {
-                            "clave": "banco",
-                            "nombre": b.nombre,
-                            "email": b.email_rgpd or b.email_general or "",
-                            "tipo_via": "",
-                            "via": b.direccion or b.direccion_completa or "",
-                            "numero": b.numero or "",
-                            "extras": "",
-                            "cp": b.codigo_postal or "",
-                            "localidad": b.localidad or "",
-                            "provincia": b.provincia or "",
-                            "ccaa": b.comunidad_autonoma or "",
-                        }
+                        destinatario = destinatario_desde_entidad(b)
             except Exception:
                 pass
         else:
@@ -1819,9 +1905,13 @@ def derecho_supresion():
         except Exception as e:
             flash(f"Error al generar PDF: {str(e)}", "danger")
     
-    bancos = EntidadFinanciera.query.order_by(EntidadFinanciera.nombre.asc()).all()
-    tipos_via = TipoVia.query.filter_by(activo=True).order_by(TipoVia.nombre.asc()).all()
-    return render_template("derecho_supresion.html", datos=datos, usuario=usuario, bancos=bancos, tipos_via=tipos_via)
+    def renderizar():
+        # bancos para selector (instantánea compartida del catálogo)
+        bancos = catalogo_entidades.entradas()
+        tipos_via = TipoVia.query.filter_by(activo=True).order_by(TipoVia.nombre.asc()).all()
+        return render_template("derecho_supresion.html", datos=datos, usuario=usuario, bancos=bancos, tipos_via=tipos_via)
+
+    return respuesta_condicional(etag_catalogo(usuario, "derecho_supresion.html", datos, version_tipos_via()), renderizar)
 
 @app.route("/derecho_acceso_completado/<filename>")
 def derecho_acceso_completado(filename):
@@ -1841,6 +1931,65 @@ def derecho_supresion_completado(filename):
     
     return render_template("derecho_completado.html", filename=filename, tipo="supresion")
 
+@app.route("/derechos_rgpd/lote", methods=["POST"])
+def derechos_rgpd_lote():
+    """Genera en una sola petición las cartas RGPD de un solicitante para varios destinatarios"""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        flash(result, "warning")
+        return redirect(url_for("login"))
+
+    usuario = result
+    from utils.rgpd_lote import generar_lote_rgpd, empaquetar_zip, combinar_pdfs, TIPOS_LOTE
+
+    tipo = request.form.get("tipo", "acceso")
+    if tipo not in TIPOS_LOTE:
+        flash("Tipo de solicitud RGPD no válido.", "warning")
+        return redirect(url_for("derechos_rgpd"))
+
+    solicitante = {campo: request.form.get(campo, "") for campo in ["nombre", "apellidos", "dni_nie", "email", "telefono", "direccion"]}
+    if usuario.role == "lector" and "datos_lector" in session:
+        datos_lector = session["datos_lector"]
+        for campo in ["nombre", "apellidos", "email", "telefono", "direccion"]:
+            solicitante[campo] = solicitante[campo] or datos_lector.get(campo, "") or ""
+    elif not solicitante["dni_nie"] and usuario.dni_nie:
+        solicitante["dni_nie"] = usuario.dni_nie
+
+    # Destinos (destino_tipo, destinatario): predefinidos (Equifax/ASNEF, Badexcug) y entidades financieras por id
+    destinos = []
+    for clave in request.form.getlist("destinos_predefinidos"):
+        if clave in PREDEFINED_DESTINATARIOS:
+            destinos.append((clave, PREDEFINED_DESTINATARIOS[clave].copy()))
+
+    banco_ids = []
+    for banco_id in request.form.getlist("destino_banco"):
+        try:
+            banco_ids.append(int(banco_id))
+        except (TypeError, ValueError):
+            continue
+    if banco_ids:
+        entidades = EntidadFinanciera.query.filter(EntidadFinanciera.id.in_(banco_ids)).order_by(EntidadFinanciera.nombre.asc()).all()
+        destinos.extend(("banco", destinatario_desde_entidad(e)) for e in entidades)
+
+    if not destinos:
+        flash("Selecciona al menos un destinatario.", "warning")
+        return redirect(url_for("derechos_rgpd"))
+
+    resultados = generar_lote_rgpd(pdf_generator, solicitante, destinos, tipo=tipo)
+    fallidos = [d.get("nombre", "") for d, filename, error in resultados if not filename]
+    if len(fallidos) == len(resultados):
+        flash("No se pudo generar ninguna carta del lote.", "danger")
+        return redirect(url_for("derechos_rgpd"))
+    if fallidos:
+        app.logger.warning(f"Lote RGPD con errores para: {', '.join(fallidos)}")
+
+    sufijo = solicitante["dni_nie"] or "solicitante"
+    if request.form.get("formato", "zip") == "pdf":
+        return send_file(combinar_pdfs(resultados), as_attachment=True,
+                         download_name=f"rgpd_{tipo}_{sufijo}.pdf", mimetype="application/pdf")
+    return send_file(empaquetar_zip(resultados), as_attachment=True,
+                     download_name=f"rgpd_{tipo}_{sufijo}.zip", mimetype="application/zip")
+
 @app.route("/registro_concursal", methods=["GET", "POST"])
 def registro_concursal():
     """Formulario para solicitud de registro en el Registro Público Concursal"""
@@ -1897,7 +2046,7 @@ def registro_concursal():
             try:
                 # Generar documento DOCX y convertir a PDF
                 from utils.docx_generator import DocxGenerator
-                docx_generator = DocxGenerator()
+                docx_generator = instrumentar(DocxGenerator(), 'DocxGenerator')
                 docx_filename, pdf_filename = docx_generator.generate_registro_concursal_docx(datos, datos_procedimiento)
                 
                 if pdf_filename:
@@ -1909,14 +2058,12 @@ def registro_concursal():
             except Exception as e:
                 flash(f"Error al generar documento: {str(e)}", "danger")
     
-    # Obtener juzgados mercantiles
-    juzgados = Procedimiento.query.with_entities(
-        Procedimiento.juzgado_id, 
-        Procedimiento.juzgado_nombre
-    ).distinct().filter(
-        Procedimiento.juzgado_nombre.isnot(None),
-        Procedimiento.juzgado_nombre != ""
-    ).order_by(Procedimiento.juzgado_nombre.asc()).all()
+    # Obtener juzgados mercantiles (dimensión de juzgados)
+    from models import JuzgadoMercantil
+    juzgados = JuzgadoMercantil.query.with_entities(
+        JuzgadoMercantil.id.label("juzgado_id"),
+        JuzgadoMercantil.nombre.label("juzgado_nombre")
+    ).order_by(JuzgadoMercantil.provincia.asc(), JuzgadoMercantil.numero.asc()).all()
     
     return render_template("registro_concursal.html", datos=datos, usuario=usuario, juzgados=juzgados)
 
@@ -1970,8 +2117,7 @@ def send_registro_concursal_pdf_email(filename):
             flash("Archivo no encontrado", "danger")
             return redirect(url_for("error"))
         
-        # Enviar email con el documento adjunto
-        email_sender = EmailSender()
+        # Encolar email con el documento adjunto
         subject = "Documento de Registro Concursal - Deudout Abogados"
         body = f"""
         Hola {usuario.nombre or usuario.username},
@@ -1984,17 +2130,17 @@ def send_registro_concursal_pdf_email(filename):
         Equipo de Deudout Abogados
         """
         
-        success = email_sender.send_notification_email(
+        mensaje = encolar_email(
+            'send_notification_email',
+            usuario.email,
             to_email=usuario.email,
             subject=subject,
             body=body,
-            attachment_path=pdf_path
+            attachment_path=pdf_path,
+            asunto=subject,
+            usuario_id=usuario.id
         )
-        
-        if success:
-            flash(f"Documento PDF enviado por email a {usuario.email}", "success")
-        else:
-            flash("Error al enviar el email", "danger")
+        flash(f"Documento PDF en cola de envío a {usuario.email} (n.º {mensaje.id}).", "success")
             
         return redirect(url_for("registro_concursal_completado", filename=filename))
         
@@ -2032,6 +2178,7 @@ def consulta_cliente():
             resultados_local = buscar_en_base_local(dni_busqueda)
             
             # 2. Consulta al RPC
+            from utils.external_queries import consultar_rpc
             resultados_rpc, mensaje_rpc = consultar_rpc(dni_busqueda)
             
             # 3. Consulta BOE y Tablón Edictal
@@ -2146,9 +2293,204 @@ def buscar_en_base_local(dni_nie):
 def error():
     return render_template("error.html")
 
+@app.route("/admin/metricas_documentos")
+def admin_metricas_documentos():
+    """Resumen JSON de tiempos, tamaños y fallos por generador y plantilla"""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        return jsonify({"error": result}), 401
+    if result.role != "admin":
+        return jsonify({"error": "No tienes permisos para acceder a esta sección."}), 403
+
+    # ?ambito=global combina las instantáneas volcadas por todos los workers
+    if request.args.get('ambito') == 'global':
+        try:
+            registro_metricas.volcar()
+        except OSError:
+            pass
+        series = cargar_directorio(registro_metricas.directorio)
+    else:
+        series = registro_metricas.instantanea()
+    return jsonify({"pid": os.getpid(), "metricas": resumir(series)})
+
+@app.route("/outbox/<int:mensaje_id>/estado")
+def outbox_estado(mensaje_id):
+    """Estado de entrega de un email encolado (propio o cualquiera si es admin)"""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        return jsonify({"error": result}), 401
+    from models import EmailOutbox
+    mensaje = EmailOutbox.query.get_or_404(mensaje_id)
+    if result.role != "admin" and mensaje.usuario_id != result.id:
+        return jsonify({"error": "No tienes permisos para consultar este envío."}), 403
+    return jsonify(mensaje.to_dict())
+
+@app.route("/admin/outbox")
+def admin_outbox():
+    """Resumen de la cola de emails y últimos mensajes, filtrables por estado"""
+    access_valid, result = check_user_access()
+    if not access_valid:
+        return jsonify({"error": result}), 401
+    if result.role != "admin":
+        return jsonify({"error": "No tienes permisos para acceder a esta sección."}), 403
+    from models import EmailOutbox
+    from utils.email_outbox import resumen_estados
+    query = EmailOutbox.query
+    estado = request.args.get('estado', '').strip()
+    if estado:
+        query = query.filter(EmailOutbox.estado == estado)
+    mensajes = query.order_by(EmailOutbox.created_at.desc()).limit(100).all()
+    return jsonify({"estados": resumen_estados(), "mensajes": [m.to_dict() for m in mensajes]})
+
+@app.route("/admin/outbox/<int:mensaje_id>/reintentar", methods=["POST"])
+def admin_outbox_reintentar(mensaje_id):
+    access_valid, result = check_user_access()
+    if not access_valid:
+        return jsonify({"error": result}), 401
+    if result.role != "admin":
+        return jsonify({"error": "No tienes permisos para acceder a esta sección."}), 403
+    from models import EmailOutbox
+    from utils.email_outbox import reintentar
+    mensaje = db.get_or_404(EmailOutbox, mensaje_id)
+    try:
+        return jsonify(reintentar(mensaje).to_dict())
+    except ValueError as e:
+        return jsonify({"error": str(e), "estado": mensaje.estado}), 409
+
+@app.cli.command("outbox-worker")
+@click.option("--una-vez", is_flag=True, help="Procesa un único lote y termina.")
+def outbox_worker_cli(una_vez):
+    """Entrega los emails pendientes de la cola (servicio aparte u OUTBOX_WORKER=externo)"""
+    from utils.email_outbox import procesar_outbox
+    if una_vez:
+        print(f"📬 {procesar_outbox(email_sender)}")
+        return
+    print("📬 Worker de la cola de emails en marcha (Ctrl+C para salir)")
+    worker_outbox.iniciar()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+@app.cli.command("importar-lectores")
+@click.option("--recuperar", is_flag=True, help="Devuelve a pendientes los ficheros que quedaron a medias.")
+def importar_lectores_cli(recuperar):
+    """Procesa los ficheros de lectores subidos desde el panel que sigan pendientes"""
+    from utils.importacion_lectores import procesar_pendientes
+    resultados = procesar_pendientes(recuperar=recuperar)
+    if not resultados:
+        print("👥 No hay ficheros de lectores pendientes")
+    for nombre, resultado in resultados:
+        if isinstance(resultado, dict):
+            print(f"✅ {nombre}: {resultado['creados']} creados, {resultado['emails_encolados']} emails en cola, "
+                  f"{len(resultado['omitidos'])} filas omitidas")
+            if resultado['sin_acceso']:
+                print(f"   ⚠️  {len(resultado['sin_acceso'])} cuentas sin contraseña (asígnala desde "
+                      f"Administración > Usuarios): {', '.join(u for _, u in resultado['sin_acceso'][:20])}")
+        else:
+            print(f"❌ {nombre}: {resultado}")
+
+@app.cli.command("metricas-documentos")
+def metricas_documentos_cli():
+    """Muestra las plantillas más lentas a partir de las métricas volcadas por los workers"""
+    filas = resumir(cargar_directorio(registro_metricas.directorio))
+    if not filas:
+        print("📊 No hay métricas registradas todavía.")
+        return
+    print(f"{'Generador':<18} {'Plantilla':<42} {'N':>6} {'media ms':>9} {'p95 ms':>8} {'KiB':>8} {'fallos':>7}")
+    for f in filas:
+        kib = f"{f['media_bytes'] / 1024:.1f}" if f['media_bytes'] is not None else "-"
+        print(f"{f['generador']:<18} {f['plantilla'][:42]:<42} {f['llamadas']:>6} "
+              f"{f['media_ms'] or 0:>9.1f} {f['p95_ms'] or 0:>8.1f} {kib:>8} {sum(f['fallos'].values()):>7}")
+
+@app.cli.command("perfil-importacion")
+@click.option("--modulo", default="app", help="Módulo cuyo tiempo de importación se mide.")
+@click.option("--top", default=25, help="Número de módulos a mostrar.")
+def perfil_importacion_cli(modulo, top):
+    """Mide con `python -X importtime` qué importaciones dominan el arranque"""
+    from utils.importaciones_diferidas import perfil_importacion, registro_importaciones
+    total, filas = perfil_importacion(modulo, top=top, cwd=os.path.dirname(os.path.abspath(__file__)))
+    print(f"⏱️  import {modulo}: {total:.1f} ms")
+    print(f"{'Módulo':<50} {'propio ms':>10} {'acumulado ms':>13}")
+    for nombre, propio, acumulado, nivel in filas:
+        print(f"{('  ' * nivel + nombre)[:50]:<50} {propio:>10.1f} {acumulado:>13.1f}")
+    print("\nImportaciones diferidas registradas:")
+    for nombre, motivo in registro_importaciones.modulos.items():
+        print(f"  {nombre:<28} {motivo}")
+
+@app.cli.command("migrar-juzgados")
+@click.option("--todos", is_flag=True, help="Volver a emparejar también los procedimientos que ya tienen juzgado_id.")
+@click.option("--bloque", default=500, help="Filas por sentencia UPDATE.")
+def migrar_juzgados_cli(todos, bloque):
+    """Crea la dimensión de juzgados y rellena Procedimiento.juzgado_id"""
+    from utils.migracion_juzgados import migrar
+    resultado = migrar(tamano_bloque=bloque, todos=todos)
+    print(f"🏛️  Esquema: {', '.join(resultado['esquema']) or 'sin cambios'}")
+    dimension = resultado['dimension']
+    print(f"   Juzgados: {dimension['total']} ({dimension['nuevos']} nuevos, {dimension['actualizados']} actualizados)")
+    relleno = resultado['relleno']
+    print(f"✅ Textos distintos: {relleno['textos']} | emparejados: {relleno['emparejados']} | "
+          f"filas actualizadas: {relleno['filas_actualizadas']}")
+    if relleno['sin_emparejar']:
+        print("⚠️  Sin emparejar (revisar a mano):")
+        for texto, filas in sorted(relleno['sin_emparejar'].items(), key=lambda x: -x[1]):
+            print(f"   {filas:>5}  {texto!r}")
+
+    # El rollup agrupa por juzgado_id: rehacerlo si han cambiado asignaciones
+    from utils.rollup_juzgados import rollup_construido, reconstruir
+    if relleno['filas_actualizadas'] and rollup_construido():
+        print(f"📈 Rollup reconstruido: {reconstruir()['filas']} filas")
+
+@app.cli.command("rollup-juzgados")
+@click.option("--bloque", default=500, help="Filas por inserción.")
+def rollup_juzgados_cli(bloque):
+    """Reconstruye el rollup de tiempos de admisión por juzgado, mes y tipo de concurso"""
+    from utils.rollup_juzgados import reconstruir
+    inicio = time.perf_counter()
+    resultado = reconstruir(tamano_bloque=bloque)
+    print(f"📈 Rollup reconstruido en {time.perf_counter() - inicio:.2f} s: "
+          f"{resultado['procedimientos']} procedimientos en {resultado['filas']} filas")
+
+@app.cli.command("exportar-parquet")
+@click.option("--tabla", "tablas", multiple=True, help="Tabla a exportar (repetible): procedimiento, formulario_rpc, access_log.")
+@click.option("--destino", default=None, help="Directorio de salida (por defecto PARQUET_EXPORT_DIR o instance/exportaciones_parquet).")
+@click.option("--completo", is_flag=True, help="Borra lo exportado y vuelve a exportar desde el principio.")
+@click.option("--bloque", default=50000, help="Filas leídas por consulta.")
+@click.option("--datos-personales", type=click.Choice(["seudonimizar", "excluir"]), default=None,
+              help="Nombre, DNI/NIE, usuario, IP y ubicación: seudonimizar (requiere PARQUET_SEUDONIMO_CLAVE) "
+                   "o excluir. Por defecto seudonimiza si hay clave y si no excluye. Las observaciones "
+                   "(texto libre) se excluyen siempre.")
+def exportar_parquet_cli(tablas, destino, completo, bloque, datos_personales):
+    """Exporta tablas operativas a Parquet particionado por mes (incremental por id)"""
+    from utils.exportacion_parquet import DIRECTORIO, TABLAS, exportar
+    desconocidas = [t for t in tablas if t not in TABLAS]
+    if desconocidas:
+        print(f"❌ Tablas no exportables: {', '.join(desconocidas)}. Opciones: {', '.join(TABLAS)}")
+        return
+    inicio = time.perf_counter()
+    try:
+        resultados = exportar(list(tablas) or None, destino, tamano_bloque=bloque, completo=completo,
+                              datos_personales=datos_personales)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    for resultado in resultados:
+        print(f"📦 {resultado['tabla']}: {resultado['filas']} filas nuevas en {resultado['ficheros']} ficheros "
+              f"(ids {resultado['desde_id'] + 1}-{resultado['hasta_id']})" if resultado['filas']
+              else f"📦 {resultado['tabla']}: sin filas nuevas (última id {resultado['hasta_id']})")
+        if resultado['tardias']:
+            print(f"   ↩️  {resultado['tardias']} filas confirmadas tarde por debajo de la marca")
+        if resultado['datos_personales']:
+            print(f"   🔒 Datos personales: {resultado['datos_personales']}")
+    print(f"✅ Exportación en {destino or DIRECTORIO} ({time.perf_counter() - inicio:.2f} s)")
+
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        from utils.migracion_juzgados import asegurar_esquema, sincronizar_juzgados
+        asegurar_esquema()
+        sincronizar_juzgados()
         crear_usuario_admin()
     
     # En desarrollo
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark del separador de direcciones.
+
+Genera un conjunto sintético (y reproducible) de direcciones con el formato
+de los listados de entidades y compara:
+
+- fila a fila con ``iterrows`` (como lo hacía separar_direcciones_especifico),
+- por bloques vectorizados en un solo proceso,
+- por bloques repartidos en un pool de procesos.
+
+Uso: python benchmark_direcciones.py [filas] [--guardar fixture.csv]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+from utils.separador_direcciones import TIPOS_VIA, separar_direccion, separar_en_paralelo
+
+VIAS = ["MAYOR", "DE LA PAZ", "GRAN VÍA", "SAN FRANCISCO", "DEL CARMEN", "REAL", "DE ANDALUCÍA",
+        "JUAN CARLOS I", "DE LA CONSTITUCIÓN", "NUEVA", "DEL MAR", "SANTA ANA"]
+POBLACIONES = [("29120", "Alhaurín de la Torre", "Málaga"), ("28013", "Madrid", "Madrid"),
+               ("08028", "Barcelona", "Barcelona"), ("46002", "Valencia", "Valencia"),
+               ("41001", "Sevilla", "Sevilla"), ("48005", "Bilbao", "Vizcaya"),
+               ("15003", "A Coruña", "A Coruña"), ("03007", "Alicante", "Alicante")]
+
+
+def generar_fixture(filas, semilla=2025):
+    rnd = random.Random(semilla)
+    variantes = [v for lista in TIPOS_VIA.values() for v in lista]
+    nombres, direcciones = [], []
+    for i in range(filas):
+        cp, poblacion, provincia = rnd.choice(POBLACIONES)
+        via = f"{rnd.choice(variantes)} {rnd.choice(VIAS)} {rnd.randint(1, 250)}"
+        if rnd.random() < 0.8:
+            direccion = f"{via}, {cp}. {poblacion}. {provincia}."
+        else:
+            direccion = f"{via} {cp} {poblacion} ({provincia})"
+        nombres.append(f"ENTIDAD {i:06d}")
+        direcciones.append(direccion)
+    return pd.DataFrame({"Nombre": nombres, "Direccion": direcciones})
+
+
+def medir(nombre, funcion, filas):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    duracion = time.perf_counter() - inicio
+    print(f"{nombre:<34} {duracion:>9.2f} s {filas / duracion:>12,.0f} filas/s")
+    return resultado
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    filas = int(args[0]) if args else 100_000
+
+    print("📍 Benchmark del separador de direcciones")
+    print("=" * 62)
+    df = generar_fixture(filas)
+    print(f"Filas: {filas:,}   CPUs: {os.cpu_count()}")
+    if "--guardar" in sys.argv:
+        ruta = sys.argv[sys.argv.index("--guardar") + 1]
+        df.to_csv(ruta, index=False)
+        print(f"Fixture guardado en {ruta}")
+    print("-" * 62)
+
+    fila_a_fila = medir("iterrows + separar_direccion",
+                        lambda: [separar_direccion(row["Direccion"]) for _, row in df.iterrows()], filas)
+    un_proceso = medir("vectorizado, 1 proceso",
+                       lambda: pd.concat(separar_en_paralelo(df, "Nombre", "Direccion", procesos=1)), filas)
+    medir(f"vectorizado, {os.cpu_count()} procesos",
+          lambda: pd.concat(separar_en_paralelo(df, "Nombre", "Direccion")), filas)
+
+    # Las dos implementaciones deben dar el mismo resultado
+    esperado = pd.DataFrame(fila_a_fila)
+    obtenido = un_proceso[["Tipo_Via", "Nombre_Via", "Numero", "CP", "Poblacion", "Provincia"]]
+    obtenido.columns = list(esperado.columns)
+    diferencias = (esperado.reset_index(drop=True) != obtenido.astype(object).reset_index(drop=True)).any(axis=1).sum()
+    print("-" * 62)
+    print(f"Filas con resultado distinto entre implementaciones: {diferencias}")
+
+
+if __name__ == "__main__":
+    main()
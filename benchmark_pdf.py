@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de los generadores PDF.
+
+Mide, por método ``generate_*_pdf``, el tiempo y la memoria asignada
+(tracemalloc) del primer documento de un PDFGenerator recién creado (registro
+de fuentes, carga de imágenes y estilos) y la media por documento una vez
+caliente.
+
+Uso: python benchmark_pdf.py [iteraciones]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.pdf_generator import PDFGenerator
+
+SOLICITANTE = {
+    "nombre": "Juan",
+    "apellidos": "Pérez García",
+    "dni": "12345678Z",
+    "dni_nie": "12345678Z",
+    "email": "juan.perez@email.com",
+    "telefono": "600123456",
+    "direccion": "Calle Mayor 123, Madrid",
+}
+
+DESTINATARIO = {
+    "clave": "otros",
+    "nombre": "BANCO DE PRUEBAS, S.A.",
+    "email": "protecciondatos@banco.com",
+    "tipo_via": "Calle",
+    "via": "Mayor",
+    "numero": "1",
+    "extras": "",
+    "cp": "28013",
+    "localidad": "Madrid",
+    "provincia": "Madrid",
+    "ccaa": "Madrid",
+}
+
+CASOS = {
+    "generate_form_generic_pdf": SOLICITANTE,
+    "generate_form_rpc_pdf": {**SOLICITANTE, "observaciones": "Prueba", "tipo_concurso": "Sin masa", "fecha_presentacion": "2025-01-15"},
+    "generate_rights_pdf": {**SOLICITANTE, "tratamiento": "D.", "cp": "28013", "localidad": "Madrid", "provincia": "Madrid"},
+    "generate_rgpd_acceso_pdf": {**SOLICITANTE, "motivo": "acceso", "destinatario": DESTINATARIO},
+    "generate_rgpd_supresion_pdf": {**SOLICITANTE, "motivo": "supresion", "destinatario": DESTINATARIO},
+}
+
+
+def medir(generador, metodo, datos, iteraciones):
+    """Devuelve (ms por documento, KiB asignados por documento, KiB pico)"""
+    funcion = getattr(generador, metodo)
+    generados = []
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        generados.append(funcion(dict(datos)))
+    duracion = time.perf_counter() - inicio
+    actual, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for filename in generados:
+        ruta = os.path.join("static", "pdfs", filename or "")
+        if filename and os.path.exists(ruta):
+            os.remove(ruta)
+
+    return duracion * 1000 / iteraciones, actual / 1024 / iteraciones, pico / 1024
+
+
+def main():
+    iteraciones = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print("📄 Benchmark de generadores PDF")
+    print("=" * 78)
+    print(f"Iteraciones por método: {iteraciones}")
+    print(f"\n   {'Método':<32} {'1er doc ms':>10} {'ms/doc':>10} {'KiB/doc':>10} {'KiB pico':>10}")
+
+    for metodo, datos in CASOS.items():
+        # Generador nuevo por método: el primer documento paga la inicialización
+        generador = PDFGenerator()
+        if not hasattr(generador, metodo):
+            continue
+        try:
+            primero, _, _ = medir(generador, metodo, datos, 1)
+            ms, kib, pico = medir(generador, metodo, datos, iteraciones)
+            print(f"   {metodo:<32} {primero:>10.2f} {ms:>10.2f} {kib:>10.1f} {pico:>10.1f}")
+        except Exception as e:
+            print(f"   {metodo:<32} ❌ {e}")
+
+
+if __name__ == "__main__":
+    main()
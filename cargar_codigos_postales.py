@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Carga masiva de la tabla CodigoPostal desde el fichero de Correos (CSV/XLSX).
+
+Uso: python cargar_codigos_postales.py archivo.csv [--reemplazar]
+
+Columnas reconocidas: CP / CODIGO_POSTAL, LOCALIDAD / POBLACION / MUNICIPIO,
+PROVINCIA y CCAA (si faltan provincia o comunidad se deducen del CP).
+Sin --reemplazar solo se añaden los pares (CP, localidad) que no existan.
+"""
+
+import sys
+import time
+from app import app
+from utils.codigos_postales import cargar_fichero, servicio_codigos_postales
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    print("📮 Carga de códigos postales")
+    print("=" * 60)
+    inicio = time.perf_counter()
+    with app.app_context():
+        try:
+            resumen = cargar_fichero(args[0], reemplazar="--reemplazar" in sys.argv)
+        except Exception as e:
+            print(f"❌ Error durante la carga: {e}")
+            sys.exit(1)
+
+        print(f"\n✅ Carga completada en {time.perf_counter() - inicio:.2f} s:")
+        print(f"   - Filas leídas: {resumen['leidas']}")
+        print(f"   - Filas válidas (CP + localidad, sin duplicados): {resumen['validas']}")
+        print(f"   - Registros creados: {resumen['insertadas']}")
+        print(f"   - Ya existentes (omitidos): {resumen['existentes']}")
+
+        indice = servicio_codigos_postales.indice()
+        print(f"\n📊 Índice: {len(indice)} códigos postales, {len(indice.localidades)} localidades")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,17 @@ worker_connections = int(os.environ.get('WORKER_CONNECTIONS', '1000'))
 max_requests = int(os.environ.get('MAX_REQUESTS', '1000'))
 max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', '50'))
 
+# ===== PRECARGA DE MÓDULOS PESADOS =====
+# Con preload_app la aplicación se importa en el maestro; when_ready importa
+# además las pilas diferidas (pandas, openpyxl, requests...) antes de crear
+# los workers, que las heredan por fork. PRELOAD_MODULES=mod1,mod2 limita la
+# lista; PRELOAD_MODULES=none la desactiva.
+def when_ready(server):
+    from utils.importaciones_diferidas import registro_importaciones, modulos_a_precalentar
+    tiempos = registro_importaciones.precalentar(modulos_a_precalentar())
+    for nombre, ms in tiempos.items():
+        server.log.info(f"Precarga {nombre}: {ms} ms" if isinstance(ms, float) else f"Precarga {nombre}: {ms}")
+
 # ===== CONFIGURACIÓN DE LOGGING =====
 accesslog = os.environ.get('GUNICORN_ACCESS_LOG', "/var/log/gunicorn/access.log")
 errorlog = os.environ.get('GUNICORN_ERROR_LOG', "/var/log/gunicorn/error.log")
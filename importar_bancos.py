@@ -1,115 +1,52 @@
 #!/usr/bin/env python3
 """
 Script para importar entidades bancarias desde archivo XLS
+
+Uso: python importar_bancos.py [archivo.xlsx|archivo.csv] [--entidades]
+(sin argumentos pregunta por los archivos del directorio actual)
 """
 
-import pandas as pd
+import sys
+import time
 from app import app, db
 from models import Banco
 import os
 
-def importar_bancos_desde_xls(archivo_xls):
-    """Importa bancos desde un archivo XLS"""
+def _mostrar_resumen(resumen, inicio):
+    print(f"\n✅ Importación completada en {time.perf_counter() - inicio:.2f} s:")
+    print(f"   - Filas leídas: {resumen['leidas']}")
+    print(f"   - Registros creados: {resumen['insertadas']}")
+    print(f"   - Existentes (omitidos, clave '{resumen['clave']}'): {resumen['existentes']}")
+    print(f"   - Duplicados en el archivo (omitidos): {resumen['duplicadas']}")
+    if resumen.get('por_nombre'):
+        print(f"   - Sin código, cotejadas por nombre: {resumen['por_nombre']}")
+    print(f"   - Sin nombre (omitidos): {resumen['sin_clave']}")
+
+def importar_archivo(archivo, destino='banco'):
+    """Importa un XLS/XLSX/CSV en Banco ('banco') o EntidadFinanciera ('entidad')"""
+    from utils.importacion_entidades import leer_fichero, importar_dataframe
     try:
-        # Leer el archivo XLS
-        df = pd.read_excel(archivo_xls)
-        
+        inicio = time.perf_counter()
+        df = leer_fichero(archivo)
         print(f"Archivo leído correctamente. Filas encontradas: {len(df)}")
         print(f"Columnas detectadas: {list(df.columns)}")
-        
-        # Mostrar las primeras filas para verificar
-        print("\nPrimeras 5 filas del archivo:")
-        print(df.head())
-        
-        # Mapeo de columnas (ajustar según tu archivo)
-        # Asumiendo que tienes columnas como: Nombre, Dirección, Número, CP, Localidad, Provincia, CCAA
-        mapeo_columnas = {
-            'nombre': ['Nombre', 'BANCO', 'ENTIDAD', 'NOMBRE_BANCO', 'BANCO_NOMBRE'],
-            'direccion': ['Dirección', 'DIRECCION', 'DIR', 'CALLE', 'DIRECCION_BANCO'],
-            'num': ['Número', 'NUM', 'NUMERO', 'Nº', 'NUMERO_BANCO'],
-            'cp': ['CP', 'Código Postal', 'CODIGO_POSTAL', 'POSTAL', 'CP_BANCO'],
-            'localidad': ['Localidad', 'LOCALIDAD', 'CIUDAD', 'POBLACION', 'LOCALIDAD_BANCO'],
-            'provincia': ['Provincia', 'PROVINCIA', 'PROV', 'PROVINCIA_BANCO'],
-            'ccaa': ['CCAA', 'Comunidad Autónoma', 'COMUNIDAD', 'AUTONOMA', 'CCAA_BANCO']
-        }
-        
-        # Encontrar las columnas correctas
-        columnas_encontradas = {}
-        for campo, posibles_nombres in mapeo_columnas.items():
-            for nombre in posibles_nombres:
-                if nombre in df.columns:
-                    columnas_encontradas[campo] = nombre
-                    break
-        
-        print(f"\nColumnas mapeadas: {columnas_encontradas}")
-        
-        # Verificar que tenemos al menos el nombre
-        if 'nombre' not in columnas_encontradas:
-            print("ERROR: No se encontró columna de nombre del banco")
-            print("Columnas disponibles:", list(df.columns))
-            return False
-        
-        # Importar datos
-        bancos_creados = 0
-        bancos_existentes = 0
-        
-        for index, row in df.iterrows():
-            nombre = str(row[columnas_encontradas['nombre']]).strip()
-            
-            # Verificar si el banco ya existe
-            banco_existente = Banco.query.filter_by(nombre=nombre).first()
-            if banco_existente:
-                bancos_existentes += 1
-                continue
-            
-            # Crear nuevo banco
-            nuevo_banco = Banco(
-                nombre=nombre,
-                direccion=str(row.get(columnas_encontradas.get('direccion', ''), '')).strip(),
-                num=str(row.get(columnas_encontradas.get('num', ''), '')).strip(),
-                cp=str(row.get(columnas_encontradas.get('cp', ''), '')).strip(),
-                localidad=str(row.get(columnas_encontradas.get('localidad', ''), '')).strip(),
-                provincia=str(row.get(columnas_encontradas.get('provincia', ''), '')).strip(),
-                ccaa=str(row.get(columnas_encontradas.get('ccaa', ''), '')).strip()
-            )
-            
-            db.session.add(nuevo_banco)
-            bancos_creados += 1
-            
-            # Mostrar progreso cada 100 bancos
-            if bancos_creados % 100 == 0:
-                print(f"Procesados {bancos_creados} bancos...")
-        
-        # Guardar cambios
-        db.session.commit()
-        
-        print(f"\n✅ Importación completada:")
-        print(f"   - Bancos creados: {bancos_creados}")
-        print(f"   - Bancos existentes (omitidos): {bancos_existentes}")
-        print(f"   - Total procesados: {bancos_creados + bancos_existentes}")
-        
+
+        resumen = importar_dataframe(df, destino=destino)
+        _mostrar_resumen(resumen, inicio)
         return True
-        
+
     except Exception as e:
         print(f"❌ Error durante la importación: {str(e)}")
         db.session.rollback()
         return False
 
+def importar_bancos_desde_xls(archivo_xls):
+    """Importa bancos desde un archivo XLS"""
+    return importar_archivo(archivo_xls, destino='banco')
+
 def importar_bancos_desde_csv(archivo_csv):
     """Importa bancos desde un archivo CSV"""
-    try:
-        # Leer el archivo CSV
-        df = pd.read_csv(archivo_csv, encoding='utf-8')
-        
-        print(f"Archivo CSV leído correctamente. Filas encontradas: {len(df)}")
-        print(f"Columnas detectadas: {list(df.columns)}")
-        
-        # Usar la misma lógica que para XLS
-        return importar_bancos_desde_xls(archivo_csv)
-        
-    except Exception as e:
-        print(f"❌ Error leyendo archivo CSV: {str(e)}")
-        return False
+    return importar_archivo(archivo_csv, destino='banco')
 
 def mostrar_bancos_existentes():
     """Muestra los bancos existentes en la base de datos"""
@@ -125,6 +62,12 @@ def mostrar_bancos_existentes():
             print(f"  ... y {len(bancos) - 10} más")
 
 if __name__ == "__main__":
+    # Uso directo: python importar_bancos.py archivo.xlsx [--entidades]
+    if len(sys.argv) > 1:
+        destino = 'entidad' if '--entidades' in sys.argv[2:] else 'banco'
+        with app.app_context():
+            sys.exit(0 if importar_archivo(sys.argv[1], destino=destino) else 1)
+
     with app.app_context():
         print("🏦 Importador de Entidades Bancarias")
         print("=" * 50)
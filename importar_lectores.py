@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Script para dar de alta lectores en bloque desde un archivo CSV/XLSX
+
+Uso: python importar_lectores.py lectores.xlsx [--sin-bienvenida]
+"""
+
+import sys
+import time
+from app import app
+from utils.importacion_lectores import leer_filas, importar_lectores
+
+def main():
+    if len(sys.argv) < 2:
+        print("Uso: python importar_lectores.py <archivo.csv|archivo.xlsx> [--sin-bienvenida]")
+        sys.exit(1)
+
+    archivo = sys.argv[1]
+    enviar_bienvenida = '--sin-bienvenida' not in sys.argv[2:]
+
+    with app.app_context():
+        print("👥 Importador de Lectores")
+        print("=" * 50)
+
+        inicio = time.perf_counter()
+        with open(archivo, 'rb') as f:
+            filas = leer_filas(f, archivo)
+        print(f"Archivo leído correctamente. Filas encontradas: {len(filas)}")
+
+        try:
+            resumen = importar_lectores(filas, enviar_bienvenida=enviar_bienvenida)
+        except Exception as e:
+            print(f"❌ Error durante la importación: {str(e)}")
+            sys.exit(1)
+
+        print(f"\n✅ Importación completada en {time.perf_counter() - inicio:.2f} s:")
+        print(f"   - Lectores creados: {resumen['creados']}")
+        print(f"   - Datos de lector creados: {resumen['datos_creados']}")
+        print(f"   - Emails de bienvenida en cola: {resumen['emails_encolados']}")
+        if resumen['sin_acceso']:
+            print(f"   - ⚠️  Cuentas sin contraseña (asígnala desde Administración > Usuarios): "
+                  f"{len(resumen['sin_acceso'])}")
+            for fila, username in resumen['sin_acceso'][:20]:
+                print(f"     * Fila {fila}: {username}")
+            if len(resumen['sin_acceso']) > 20:
+                print(f"     ... y {len(resumen['sin_acceso']) - 20} más")
+        print(f"   - Filas omitidas: {len(resumen['omitidos'])}")
+        for fila, motivo in resumen['omitidos'][:20]:
+            print(f"     * Fila {fila}: {motivo}")
+        if len(resumen['omitidos']) > 20:
+            print(f"     ... y {len(resumen['omitidos']) - 20} más")
+
+if __name__ == "__main__":
+    main()
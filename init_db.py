@@ -5,6 +5,13 @@ from datetime import datetime
 
 with app.app_context():
     db.create_all()
+    # Columna juzgado_id en bases anteriores y dimensión de juzgados
+    from utils.migracion_juzgados import asegurar_esquema, sincronizar_juzgados
+    asegurar_esquema()
+    sincronizar_juzgados()
+    # Rollup de analítica de juzgados (a partir de aquí se mantiene al guardar procedimientos)
+    from utils.rollup_juzgados import reconstruir
+    reconstruir()
     # Crea un usuario admin si no existe
     if not User.query.filter_by(username="admin").first():
         admin = User(
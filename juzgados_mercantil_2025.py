@@ -187,48 +187,243 @@ JUZGADOS_MERCANTILES_2025 = [
     "Juzgado de lo Mercantil nº 1 de Melilla"
 ]
 
+# ===== DIRECTORIO ESTRUCTURADO =====
+# Cada nombre se analiza una sola vez al importar el módulo. Los índices por
+# código, provincia y token normalizado permiten búsquedas O(1)/O(k) sin
+# recorrer la lista. La referencia estable de cada juzgado es su código
+# ("madrid-3"), no su posición en la lista: el id numérico lo asigna la tabla
+# juzgado_mercantil al sincronizar (utils.migracion_juzgados) y se lee de ella.
+
+import difflib
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, asdict
+
+# Sedes que no son capital de provincia (o cuyo nombre no coincide con ella)
+PROVINCIA_DE_SEDE = {
+    "Bilbao": "Vizcaya",
+    "San Sebastián": "Guipúzcoa",
+    "Vigo": "Pontevedra",
+    "Oviedo": "Asturias",
+    "Gijón": "Asturias",
+    "Pamplona": "Navarra",
+    "Palma de Mallorca": "Islas Baleares",
+    "Las Palmas de Gran Canaria": "Las Palmas",
+    "Logroño": "La Rioja",
+}
+
+# Palabras que aparecen en todos los nombres y no sirven para buscar
+_PALABRAS_COMUNES = {"juzgado", "de", "lo", "mercantil", "n", "no", "num", "numero"}
+
+_RE_JUZGADO = re.compile(r"^Juzgado de lo Mercantil nº (\d+) de (.+)$")
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni signos ('Nº 1 de Málaga' -> 'n 1 de malaga')"""
+    texto = unicodedata.normalize("NFD", str(texto or "").replace("º", " ").replace("ª", " "))
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^\w\s]", " ", texto).split())
+
+
+def _slug(texto):
+    return normalizar(texto).replace(" ", "-")
+
+
+@dataclass(frozen=True)
+class Juzgado:
+    codigo: str
+    numero: int
+    sede: str
+    provincia: str
+    nombre: str
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def _construir_directorio(nombres):
+    juzgados = []
+    for nombre in nombres:
+        match = _RE_JUZGADO.match(nombre)
+        if not match:
+            raise ValueError(f"Nombre de juzgado no reconocido: {nombre}")
+        numero, sede = int(match.group(1)), match.group(2)
+        juzgados.append(Juzgado(
+            codigo=f"{_slug(sede)}-{numero}",
+            numero=numero,
+            sede=sede,
+            provincia=PROVINCIA_DE_SEDE.get(sede, sede),
+            nombre=nombre,
+        ))
+    return tuple(juzgados)
+
+
+JUZGADOS = _construir_directorio(JUZGADOS_MERCANTILES_2025)
+
+POR_CODIGO = {j.codigo: j for j in JUZGADOS}
+POR_NOMBRE = {normalizar(j.nombre): j for j in JUZGADOS}
+POR_PROVINCIA = {}
+for _j in JUZGADOS:
+    POR_PROVINCIA.setdefault(_j.provincia, []).append(_j)
+
+_ORDEN = {j.codigo: i for i, j in enumerate(JUZGADOS)}
+
+# prefijo de token -> códigos (el vocabulario es pequeño: se indexan todos los prefijos)
+_INDICE_PREFIJOS = {}
+for _j in JUZGADOS:
+    _tokens = set(normalizar(f"{_j.nombre} {_j.provincia}").split()) - _PALABRAS_COMUNES
+    for _token in _tokens:
+        for _n in range(1, len(_token) + 1):
+            _INDICE_PREFIJOS.setdefault(_token[:_n], set()).add(_j.codigo)
+_INDICE_PREFIJOS = {k: frozenset(v) for k, v in _INDICE_PREFIJOS.items()}
+del _j, _tokens, _token, _n
+
+
+# ===== IDS DE LA TABLA juzgado_mercantil =====
+# Se cargan en memoria la primera vez y se recargan si se pide un id o código
+# desconocido (como mucho cada RECARGA_IDS segundos), p. ej. tras sincronizar
+# juzgados nuevos desde otro proceso.
+RECARGA_IDS = 60
+
+_ids = {'por_codigo': {}, 'por_id': {}, 'cargado': None}
+_ids_lock = threading.Lock()
+
+
+def recargar_ids():
+    """Relee de la tabla los pares id <-> código (requiere contexto de aplicación)"""
+    from models import db, JuzgadoMercantil
+
+    filas = db.session.query(JuzgadoMercantil.id, JuzgadoMercantil.codigo).all()
+    with _ids_lock:
+        _ids['por_codigo'] = {codigo: id_ for id_, codigo in filas}
+        _ids['por_id'] = {id_: POR_CODIGO[codigo] for id_, codigo in filas if codigo in POR_CODIGO}
+        _ids['cargado'] = time.monotonic()
+
+
+def _ids_actuales(forzar=False):
+    cargado = _ids['cargado']
+    if cargado is None or (forzar and time.monotonic() - cargado > RECARGA_IDS):
+        recargar_ids()
+    return _ids
+
+
+def id_juzgado(codigo):
+    """Id en la tabla juzgado_mercantil del juzgado con ese código; None si no está sincronizado"""
+    id_ = _ids_actuales()['por_codigo'].get(codigo)
+    if id_ is None:
+        id_ = _ids_actuales(forzar=True)['por_codigo'].get(codigo)
+    return id_
+
+
+def obtener_juzgado(juzgado_id):
+    """Juzgado por id de la tabla o por código ('madrid-3'); None si no existe"""
+    if isinstance(juzgado_id, str) and not juzgado_id.isdigit():
+        return POR_CODIGO.get(juzgado_id)
+    try:
+        juzgado_id = int(juzgado_id)
+    except (TypeError, ValueError):
+        return None
+    juzgado = _ids_actuales()['por_id'].get(juzgado_id)
+    if juzgado is None:
+        juzgado = _ids_actuales(forzar=True)['por_id'].get(juzgado_id)
+    return juzgado
+
+
+def resolver_juzgado(texto):
+    """Juzgado cuyo nombre completo coincide con ``texto`` (sin acentos ni mayúsculas)"""
+    return POR_NOMBRE.get(normalizar(texto))
+
+
+def buscar(termino, provincia=None, limite=None):
+    """
+    Juzgados en los que cada palabra de ``termino`` es prefijo de alguna palabra
+    del nombre, sede o provincia ('mercantil 3 madr' -> nº 3 de Madrid).
+    """
+    tokens = [t for t in normalizar(termino).split() if t not in _PALABRAS_COMUNES]
+    if tokens:
+        codigos = None
+        for token in tokens:
+            encontrados = _INDICE_PREFIJOS.get(token, frozenset())
+            codigos = encontrados if codigos is None else codigos & encontrados
+            if not codigos:
+                return []
+        resultados = [POR_CODIGO[c] for c in sorted(codigos, key=_ORDEN.get)]
+    else:
+        resultados = list(JUZGADOS)  # vacío o solo palabras comunes: coinciden todos
+    if provincia:
+        resultados = [j for j in resultados if normalizar(j.provincia) == normalizar(provincia)]
+    return resultados[:limite] if limite else resultados
+
+
+_JUZGADOS_POR_SEDE = Counter(j.sede for j in JUZGADOS)
+# Claves cortas para tolerar erratas: "sede numero" y, si la sede tiene un único juzgado, "sede"
+_CLAVES_CON_NUMERO = {f"{normalizar(j.sede)} {j.numero}": j for j in JUZGADOS}
+_CLAVES_SEDE_UNICA = {normalizar(j.sede): j for j in JUZGADOS if _JUZGADOS_POR_SEDE[j.sede] == 1}
+
+
+def emparejar_juzgado(texto, umbral=0.85):
+    """
+    Juzgado del directorio que corresponde a un texto libre ('JM 3 Madrid',
+    'Mercantil nº1 Bilbao', 'juzgado mercantil de gijon', 'Mercantil 2 Madird').
+    Devuelve None si no hay un candidato claro.
+    """
+    juzgado = resolver_juzgado(texto)
+    if juzgado or not normalizar(texto):
+        return juzgado
+
+    # 'n1' / 'nº1' -> 'n 1'
+    normalizado = re.sub(r"(\d+)", r" \1 ", normalizar(texto))
+    tokens = [t for t in normalizado.split() if t not in _PALABRAS_COMUNES and t != "jm"]
+    numeros = {int(t) for t in tokens if t.isdigit()}
+    palabras = [t for t in tokens if not t.isdigit()]
+    if not palabras or len(numeros) > 1:
+        return None
+
+    # 1) Índice de prefijos: cada palabra debe aparecer en el nombre, sede o provincia
+    candidatos = buscar(" ".join(palabras))
+    if numeros:
+        candidatos = [j for j in candidatos if j.numero in numeros]
+    if len(candidatos) > 1:
+        # 'palma 1' casa por prefijo con Palma de Mallorca y Las Palmas: preferir palabras completas
+        exactos = [j for j in candidatos if set(palabras) <= set(normalizar(f"{j.sede} {j.provincia}").split())]
+        candidatos = exactos or candidatos
+    if len(candidatos) == 1 and (numeros or _JUZGADOS_POR_SEDE[candidatos[0].sede] == 1):
+        return candidatos[0]
+
+    # 2) Erratas: la clave más parecida, solo si destaca sobre la segunda
+    if numeros:
+        claves = {c: j for c, j in _CLAVES_CON_NUMERO.items() if j.numero in numeros}
+    else:
+        claves = _CLAVES_SEDE_UNICA
+    clave = " ".join(palabras + [str(n) for n in numeros])
+    parecidos = sorted(((difflib.SequenceMatcher(None, clave, c).ratio(), c) for c in claves), reverse=True)[:2]
+    if parecidos and parecidos[0][0] >= umbral and (len(parecidos) == 1 or parecidos[0][0] - parecidos[1][0] >= 0.05):
+        return claves[parecidos[0][1]]
+    return None
+
+
 # Función para obtener juzgados por provincia
 def obtener_juzgados_por_provincia():
     """Retorna un diccionario con los juzgados organizados por provincia"""
-    juzgados_por_provincia = {}
-    
-    for juzgado in JUZGADOS_MERCANTILES_2025:
-        # Extraer la provincia del nombre del juzgado
-        if " de " in juzgado:
-            provincia = juzgado.split(" de ")[-1]
-        else:
-            provincia = "Otros"
-        
-        if provincia not in juzgados_por_provincia:
-            juzgados_por_provincia[provincia] = []
-        
-        juzgados_por_provincia[provincia].append(juzgado)
-    
-    return juzgados_por_provincia
+    return {provincia: [j.nombre for j in juzgados] for provincia, juzgados in POR_PROVINCIA.items()}
 
 # Función para obtener juzgados con búsqueda
 def buscar_juzgados(termino):
-    """Busca juzgados que contengan el término especificado"""
-    termino = termino.lower()
-    resultados = []
-    
-    for juzgado in JUZGADOS_MERCANTILES_2025:
-        if termino in juzgado.lower():
-            resultados.append(juzgado)
-    
-    return resultados
+    """Nombres de los juzgados que encuentra ``buscar(termino)``"""
+    return [j.nombre for j in buscar(termino)]
 
 # Función para obtener estadísticas
 def obtener_estadisticas_juzgados():
     """Retorna estadísticas sobre los juzgados mercantiles"""
-    juzgados_por_provincia = obtener_juzgados_por_provincia()
-    
     return {
-        "total_juzgados": len(JUZGADOS_MERCANTILES_2025),
-        "total_provincias": len(juzgados_por_provincia),
+        "total_juzgados": len(JUZGADOS),
+        "total_provincias": len(POR_PROVINCIA),
         "provincias_con_mas_juzgados": sorted(
-            juzgados_por_provincia.items(), 
-            key=lambda x: len(x[1]), 
+            ((provincia, [j.nombre for j in juzgados]) for provincia, juzgados in POR_PROVINCIA.items()),
+            key=lambda x: len(x[1]),
             reverse=True
         )[:5]
     }
@@ -244,12 +439,5 @@ if __name__ == "__main__":
         print(f"   {provincia}: {len(juzgados)} juzgados")
     
     print(f"\n📋 Lista completa de juzgados:")
-    for i, juzgado in enumerate(JUZGADOS_MERCANTILES_2025, 1):
-        print(f"   {i:2d}. {juzgado}")
-
-
-
-
-
-
-
+    for i, juzgado in enumerate(JUZGADOS, 1):
+        print(f"   {i:2d}. [{juzgado.codigo}] {juzgado.nombre} ({juzgado.provincia})")
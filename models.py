@@ -207,11 +207,25 @@ class FormularioRPC(db.Model):
     
     usuario = db.relationship('User', backref='formularios_rpc')
 
+class JuzgadoMercantil(db.Model):
+    """Dimensión de juzgados del directorio juzgados_mercantil_2025 (clave estable: codigo)"""
+    __tablename__ = 'juzgado_mercantil'
+    id = db.Column(db.Integer, primary_key=True)
+    codigo = db.Column(db.String(60), nullable=False, unique=True)  # 'madrid-3'
+    numero = db.Column(db.Integer, nullable=False)
+    sede = db.Column(db.String(100), nullable=False)
+    provincia = db.Column(db.String(100), nullable=False, index=True)
+    nombre = db.Column(db.String(200), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'<JuzgadoMercantil {self.codigo}>'
+
 class Procedimiento(db.Model):
     """Almacena datos de procedimiento por juzgado para métricas."""
     id = db.Column(db.Integer, primary_key=True)
     num_procedimiento = db.Column(db.String(50), nullable=False)
-    juzgado = db.Column(db.String(200), nullable=False)
+    juzgado = db.Column(db.String(200), nullable=False)  # Texto tal como se introdujo
+    juzgado_id = db.Column(db.Integer, db.ForeignKey('juzgado_mercantil.id'))  # None si no se pudo emparejar
 
     # Fechas clave del procedimiento
     fecha_epi = db.Column(db.Date)  # Ya existente en el formulario
@@ -227,6 +241,11 @@ class Procedimiento(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     usuario = db.relationship('User', backref='procedimientos')
+    juzgado_mercantil = db.relationship('JuzgadoMercantil', backref='procedimientos')
+
+    __table_args__ = (
+        db.Index('ix_procedimiento_juzgado_fechas', 'juzgado_id', 'fecha_presentacion_demanda', 'fecha_admision'),
+    )
 
     def tiempo_admision_dias(self):
         """Retorna días entre presentación de demanda y admisión, si ambas existen."""
@@ -234,6 +253,27 @@ class Procedimiento(db.Model):
             return (self.fecha_admision - self.fecha_presentacion_demanda).days
         return None
 
+class RollupJuzgadoMes(db.Model):
+    """Agregados de tiempos de admisión por (juzgado, mes de presentación, tipo de concurso)"""
+    __tablename__ = 'rollup_juzgado_mes'
+    id = db.Column(db.Integer, primary_key=True)
+    juzgado_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = sin emparejar (ver juzgado_texto)
+    juzgado_texto = db.Column(db.String(200), nullable=False, default='')
+    mes = db.Column(db.String(7), nullable=False)  # 'AAAA-MM' de fecha_presentacion_demanda
+    tipo_concurso = db.Column(db.String(20), nullable=False, default='')
+
+    total = db.Column(db.Integer, nullable=False, default=0)  # Con ambas fechas (incluye plazos negativos)
+    muestras = db.Column(db.Integer, nullable=False, default=0)  # Con plazo >= 0
+    suma_dias = db.Column(db.BigInteger, nullable=False, default=0)
+    suma_cuadrados = db.Column(db.BigInteger, nullable=False, default=0)
+    histograma = db.Column(db.Text, nullable=False, default='{}')  # JSON {dias: procedimientos}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('juzgado_id', 'juzgado_texto', 'mes', 'tipo_concurso', name='uq_rollup_juzgado_mes'),
+        db.Index('ix_rollup_juzgado_mes_mes', 'mes'),
+    )
+
 class DatosLector(db.Model):
     """Modelo para almacenar los datos de los lectores filtrados por DNI/NIE"""
     id = db.Column(db.Integer, primary_key=True)
@@ -248,4 +288,46 @@ class DatosLector(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def __repr__(self):
-        return f'<DatosLector {self.dni_nie} - {self.nombre} {self.apellidos}>'
\ No newline at end of file
+        return f'<DatosLector {self.dni_nie} - {self.nombre} {self.apellidos}>'
+
+class EmailOutbox(db.Model):
+    """Cola transaccional de emails: las rutas insertan y un worker entrega por SMTP"""
+    id = db.Column(db.Integer, primary_key=True)
+    metodo = db.Column(db.String(50), nullable=False)  # Método de EmailSender (o manejador) a invocar
+    destinatario = db.Column(db.String(120), nullable=False)
+    asunto = db.Column(db.String(200))
+    payload = db.Column(db.Text, nullable=False)  # JSON {"args": [...], "kwargs": {...}}
+
+    # Estado de entrega: 'pendiente', 'enviando', 'enviado', 'fallido' (dead letter)
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    max_intentos = db.Column(db.Integer, nullable=False, default=5)
+    proximo_intento = db.Column(db.DateTime, default=datetime.utcnow)
+    ultimo_error = db.Column(db.Text)
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    enviado_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_estado_proximo', 'estado', 'proximo_intento'),
+    )
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.metodo} -> {self.destinatario} [{self.estado}]>'
+
+    def to_dict(self):
+        """Estado de entrega para la interfaz"""
+        return {
+            'id': self.id,
+            'destinatario': self.destinatario,
+            'asunto': self.asunto,
+            'estado': self.estado,
+            'intentos': self.intentos,
+            'max_intentos': self.max_intentos,
+            'proximo_intento': self.proximo_intento.isoformat() if self.proximo_intento else None,
+            'ultimo_error': self.ultimo_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'enviado_at': self.enviado_at.isoformat() if self.enviado_at else None,
+        }
@@ -404,53 +404,11 @@ def poblar_entidades_financieras():
         try:
             print("🏦 Poblando base de datos de entidades financieras...")
             
-            entidades_creadas = 0
-            entidades_existentes = 0
-            
-            for datos in entidades_data:
-                # Verificar si ya existe
-                entidad_existente = EntidadFinanciera.query.filter_by(
-                    codigo_entidad=datos['codigo_entidad']
-                ).first()
-                
-                if entidad_existente:
-                    entidades_existentes += 1
-                    continue
-                
-                # Crear nueva entidad
-                entidad = EntidadFinanciera(
-                    nombre=datos['nombre'],
-                    nombre_comercial=datos.get('nombre_comercial'),
-                    tipo_entidad=datos['tipo_entidad'],
-                    codigo_entidad=datos['codigo_entidad'],
-                    estado=datos['estado'],
-                    fecha_autorizacion=datetime.strptime(datos['fecha_autorizacion'], '%Y-%m-%d').date(),
-                    direccion_completa=datos['direccion_completa'],
-                    direccion=datos['direccion'],
-                    numero=datos['numero'],
-                    codigo_postal=datos['codigo_postal'],
-                    localidad=datos['localidad'],
-                    provincia=datos['provincia'],
-                    comunidad_autonoma=datos['comunidad_autonoma'],
-                    telefono=datos.get('telefono'),
-                    email_doc9=datos.get('email_doc9'),
-                    email_rgpd=datos.get('email_rgpd'),
-                    email_general=datos.get('email_general'),
-                    web=datos.get('web'),
-                    cif_nif=datos.get('cif_nif'),
-                    supervisor_principal='Banco de España',
-                    fuente_datos='Banco de España',
-                    version_datos=datetime.now().strftime('%Y%m%d'),
-                    nombre_busqueda=limpiar_texto(datos['nombre']),
-                    localidad_busqueda=limpiar_texto(datos['localidad']),
-                    provincia_busqueda=limpiar_texto(datos['provincia'])
-                )
-                
-                db.session.add(entidad)
-                entidades_creadas += 1
-            
-            # Commit de cambios
-            db.session.commit()
+            # Inserción por bloques de las que faltan (una consulta para saber cuáles existen)
+            from utils.upsert_entidades import upsert_entidades
+            resumen = upsert_entidades(entidades_data, actualizar=False)
+            entidades_creadas = resumen['nuevas']
+            entidades_existentes = resumen['sin_cambios']
             
             print(f"✅ Base de datos poblada exitosamente:")
             print(f"   - Entidades creadas: {entidades_creadas}")
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Prueba de la exportación del Documento 9 con datos que contienen marcado.
+
+Uso: python -m pytest test_doc9_export.py
+"""
+
+import io
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PyPDF2 import PdfReader
+
+from utils.doc9_export import exportar
+
+REGISTROS = [
+    {
+        "Acreedor": "Banco A <b>x & Cía",
+        "Domicilio y correo electrónico": "Calle 1 <info@banco.es>",
+        "Naturaleza del crédito": "Préstamo > 3 años",
+        "Crédito pendiente": "1234.56",
+        "Cuotas vencidas": "2",
+        "Garantías": "",
+    },
+]
+
+
+def test_pdf_conserva_caracteres_de_marcado():
+    contenido, mimetype, nombre = exportar(REGISTROS, "pdf")
+
+    assert mimetype == "application/pdf"
+    assert nombre.endswith(".pdf")
+    texto = "".join(pagina.extract_text() for pagina in PdfReader(io.BytesIO(contenido)).pages)
+    texto = " ".join(texto.split())
+    for esperado in ("Banco A <b>x & Cía", "Calle 1 <info@banco.es>", "Préstamo > 3 años", "1.234,56"):
+        assert esperado in texto
+
+
+def test_csv_no_escapa_los_datos():
+    contenido, _, _ = exportar(REGISTROS, "csv")
+
+    texto = contenido.decode("utf-8")
+    assert "Calle 1 <info@banco.es>" in texto
+    assert "Banco A <b>x & Cía" in texto
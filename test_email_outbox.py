@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Prueba de la cola de emails contra un stub SMTP local.
+
+Levanta un servidor SMTP en un puerto libre (aiosmtpd, o smtpd en Python
+< 3.12), encola un email de bienvenida y ejecuta ``procesar_outbox`` con un
+emisor que habla SMTP de verdad con el stub.
+
+Uso: python -m pytest test_email_outbox.py
+"""
+
+import email
+import email.policy
+import os
+import re
+import smtplib
+import socket
+import sys
+import threading
+import time
+from email.message import EmailMessage
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from models import db, User, EmailOutbox
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class StubSMTP:
+    """Servidor SMTP local que guarda los mensajes recibidos en ``self.mensajes``"""
+
+    def __init__(self):
+        self.puerto = _puerto_libre()
+        self.mensajes = []
+        self._parar = None
+
+    def __enter__(self):
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError:
+            Controller = None
+
+        if Controller is not None:
+            stub = self
+
+            class Manejador:
+                async def handle_DATA(self, server, session, envelope):
+                    stub.mensajes.append((envelope.rcpt_tos, envelope.content))
+                    return '250 OK'
+
+            controlador = Controller(Manejador(), hostname='127.0.0.1', port=self.puerto)
+            controlador.start()
+            self._parar = controlador.stop
+            return self
+
+        import warnings
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            import asyncore
+            import smtpd
+        stub = self
+
+        class Servidor(smtpd.SMTPServer):
+            def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+                stub.mensajes.append((rcpttos, data))
+
+        servidor = Servidor(('127.0.0.1', self.puerto), None, decode_data=False)
+        hilo = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.05}, daemon=True)
+        hilo.start()
+
+        def parar():
+            servidor.close()
+            hilo.join(timeout=2)
+
+        self._parar = parar
+        return self
+
+    def __exit__(self, *exc):
+        self._parar()
+
+
+class EmisorSMTP:
+    """Emisor mínimo con la interfaz de EmailSender que usa la cola"""
+
+    def __init__(self, puerto):
+        self.puerto = puerto
+
+    def send_notification_email(self, to_email, subject, body, html=False, inline_images=None):
+        mensaje = EmailMessage()
+        mensaje['From'] = 'noreply@example.com'
+        mensaje['To'] = to_email
+        mensaje['Subject'] = subject
+        mensaje.set_content(body, subtype='html' if html else 'plain')
+        try:
+            with smtplib.SMTP('127.0.0.1', self.puerto, timeout=5) as smtp:
+                smtp.send_message(mensaje)
+        except OSError as e:
+            return False, str(e)
+        return True, 'Enviado'
+
+
+@pytest.fixture
+def contexto():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        usuario = User(username='lector1', password_hash=generate_password_hash('desconocida'), role='lector',
+                       nombre='Ana', apellidos='Núñez', email='ana@example.com')
+        db.session.add(usuario)
+        db.session.commit()
+        yield usuario
+        db.session.remove()
+
+
+def _esperar(condicion, segundos=3):
+    limite = time.monotonic() + segundos
+    while not condicion() and time.monotonic() < limite:
+        time.sleep(0.02)
+
+
+def test_bienvenida_se_entrega_sin_guardar_la_contrasena(contexto):
+    from utils.email_outbox import encolar_bienvenida, procesar_outbox, ESTADO_ENVIADO
+
+    usuario = contexto
+    mensaje = encolar_bienvenida(usuario)
+    assert 'desconocida' not in mensaje.payload
+    assert 'Contraseña' not in mensaje.payload
+
+    with StubSMTP() as stub:
+        resumen = procesar_outbox(EmisorSMTP(stub.puerto))
+        _esperar(lambda: stub.mensajes)
+
+    assert resumen == {'enviados': 1, 'reintentos': 0, 'fallidos': 0}
+    assert len(stub.mensajes) == 1
+    destinatarios, contenido = stub.mensajes[0]
+    assert destinatarios == ['ana@example.com']
+    cuerpo = email.message_from_bytes(contenido, policy=email.policy.default).get_content()
+    password = re.search(r'Contraseña temporal: (\w+)', cuerpo).group(1)
+
+    fila = db.session.get(EmailOutbox, mensaje.id)
+    assert fila.estado == ESTADO_ENVIADO
+    assert password not in fila.payload
+    assert check_password_hash(db.session.get(User, usuario.id).password_hash, password)
+
+
+def test_fallo_definitivo_no_cambia_la_contrasena(contexto):
+    from utils.email_outbox import encolar_bienvenida, procesar_outbox, ESTADO_FALLIDO
+
+    usuario = contexto
+    hash_inicial = usuario.password_hash
+    mensaje = encolar_bienvenida(usuario)
+    mensaje.max_intentos = 1
+    db.session.commit()
+
+    # Nadie escucha en el puerto: el envío falla y el mensaje pasa a dead letter
+    resumen = procesar_outbox(EmisorSMTP(_puerto_libre()))
+
+    assert resumen == {'enviados': 0, 'reintentos': 0, 'fallidos': 1}
+    fila = db.session.get(EmailOutbox, mensaje.id)
+    assert fila.estado == ESTADO_FALLIDO
+    assert fila.ultimo_error
+    assert db.session.get(User, usuario.id).password_hash == hash_inicial
+
+
+def test_reintentar_solo_mensajes_fallidos(contexto):
+    from utils.email_outbox import (encolar_bienvenida, procesar_outbox, reintentar,
+                                    ESTADO_ENVIADO, ESTADO_ENVIANDO, ESTADO_FALLIDO, ESTADO_PENDIENTE)
+
+    usuario = contexto
+    fallido = encolar_bienvenida(usuario)
+    fallido.max_intentos = 1
+    db.session.commit()
+    procesar_outbox(EmisorSMTP(_puerto_libre()))
+    assert db.session.get(EmailOutbox, fallido.id).estado == ESTADO_FALLIDO
+
+    reintentar(fallido)
+    fila = db.session.get(EmailOutbox, fallido.id)
+    assert fila.estado == ESTADO_PENDIENTE
+    assert fila.intentos == 0
+
+    # Un mensaje ya entregado no vuelve a la cola (ni cambia otra vez la contraseña)
+    with StubSMTP() as stub:
+        procesar_outbox(EmisorSMTP(stub.puerto))
+        _esperar(lambda: stub.mensajes)
+    hash_entregado = db.session.get(User, usuario.id).password_hash
+    with pytest.raises(ValueError):
+        reintentar(fila)
+    assert db.session.get(EmailOutbox, fallido.id).estado == ESTADO_ENVIADO
+    assert db.session.get(User, usuario.id).password_hash == hash_entregado
+
+    # Ni uno que un worker está entregando
+    enviando = encolar_bienvenida(usuario)
+    enviando.estado = ESTADO_ENVIANDO
+    db.session.commit()
+    with pytest.raises(ValueError):
+        reintentar(enviando)
+    assert db.session.get(EmailOutbox, enviando.id).estado == ESTADO_ENVIANDO
@@ -0,0 +1,121 @@
+"""
+Codificación base64 cacheada de los adjuntos de los emails salientes.
+
+Un reenvío del mismo documento reutiliza el texto base64 ya calculado en lugar
+de recodificar el PDF. La clave es el contenido (tamaño y resumen BLAKE2b), así
+que dos ficheros distintos nunca comparten entrada. Solo se cachean las partes
+cuyo tamaño coincide con el de algún fichero que la cola registra con
+``adjuntos_en_envio``; el resto (imágenes en línea, adjuntos generados en
+memoria) se codifica sin caché.
+"""
+
+import base64
+import hashlib
+import os
+import threading
+import types
+from collections import OrderedDict
+from contextlib import contextmanager
+from email import encoders
+
+CACHE_MIME_MAX_BYTES = int(os.environ.get('ADJUNTOS_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+_en_envio = threading.local()
+
+
+def _bencode(data):
+    """base64 con saltos de línea MIME, igual que email.encoders"""
+    return base64.encodebytes(data or b'').decode('ascii')
+
+
+def clave_fichero(ruta):
+    """(ruta absoluta, mtime en ns, tamaño) o None si el fichero no existe"""
+    try:
+        estado = os.stat(ruta)
+    except OSError:
+        return None
+    return os.path.abspath(ruta), estado.st_mtime_ns, estado.st_size
+
+
+@contextmanager
+def adjuntos_en_envio(rutas):
+    """Registra, para el hilo actual, los ficheros que se adjuntan en este envío"""
+    tamanos = set()
+    for ruta in rutas:
+        clave = clave_fichero(ruta) if ruta else None
+        if clave:
+            tamanos.add(clave[2])
+    anterior = getattr(_en_envio, 'tamanos', None)
+    _en_envio.tamanos = tamanos
+    try:
+        yield
+    finally:
+        _en_envio.tamanos = anterior
+
+
+def _clave_registrada(data):
+    """(tamaño, resumen) de ``data`` si su tamaño es el de un fichero registrado, o None"""
+    data = data or b''
+    if len(data) not in (getattr(_en_envio, 'tamanos', None) or ()):
+        return None
+    return len(data), hashlib.blake2b(data, digest_size=20).digest()
+
+
+class CacheBase64:
+    """LRU acotada en bytes: (tamaño, resumen del contenido) -> texto base64 con saltos de línea MIME"""
+
+    def __init__(self, max_bytes=CACHE_MIME_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def codificar(self, data, clave=None):
+        if clave is None:
+            return _bencode(data)
+        with self._lock:
+            codificado = self._entradas.get(clave)
+            if codificado is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return codificado
+        codificado = _bencode(data)
+        with self._lock:
+            self.fallos += 1
+            if clave not in self._entradas and len(codificado) <= self.max_bytes:
+                self._entradas[clave] = codificado
+                self._bytes += len(codificado)
+                while self._bytes > self.max_bytes:
+                    _, antiguo = self._entradas.popitem(last=False)
+                    self._bytes -= len(antiguo)
+        return codificado
+
+
+cache_base64 = CacheBase64()
+
+
+def encode_base64(msg):
+    """Igual que ``email.encoders.encode_base64`` pero reutilizando la codificación cacheada"""
+    orig = msg.get_payload(decode=True)
+    msg.set_payload(cache_base64.codificar(orig, _clave_registrada(orig)))
+    msg['Content-Transfer-Encoding'] = 'base64'
+
+
+def _crear_fachada_encoders():
+    fachada = types.ModuleType('encoders')
+    fachada.__dict__.update({k: v for k, v in vars(encoders).items() if not k.startswith('__')})
+    fachada.encode_base64 = encode_base64
+    return fachada
+
+
+encoders_cacheados = _crear_fachada_encoders()
+
+
+def activar_cache_mime(modulo):
+    """Hace que ``modulo`` (p. ej. utils.email_sender) use la codificación cacheada"""
+    if getattr(modulo, 'encoders', None) is encoders:
+        modulo.encoders = encoders_cacheados
+        return True
+    return False
@@ -0,0 +1,129 @@
+"""
+Analítica de tiempos de admisión por juzgado calculada en la base de datos.
+
+Una sola consulta agrupada devuelve, por juzgado, el número de
+procedimientos, la media, la mediana y el percentil 90 de los días entre
+``fecha_presentacion_demanda`` y ``fecha_admision``; a Python solo llegan las
+filas de resumen (una por juzgado).
+
+Los percentiles se calculan con funciones de ventana (ROW_NUMBER / COUNT OVER,
+disponibles en SQLite >= 3.25, PostgreSQL y MySQL 8): la consulta devuelve los
+dos valores que rodean la posición del percentil y aquí se interpolan igual
+que ``percentile_cont``.
+
+Agrupación: ``juzgado_id`` (dimensión de juzgados); los procedimientos aún sin
+emparejar se agrupan por el texto libre.
+"""
+
+import math
+
+from sqlalchemy import and_, case, func, literal_column, select
+
+from models import db, Procedimiento
+
+PERCENTILES = {'mediana': 0.5, 'p90': 0.9}
+
+
+def expresion_dias(dialecto=None):
+    """Días entre presentación y admisión como expresión SQL del motor en uso"""
+    dialecto = dialecto or db.engine.dialect.name
+    presentacion, admision = Procedimiento.fecha_presentacion_demanda, Procedimiento.fecha_admision
+    if dialecto == 'sqlite':
+        return func.julianday(admision) - func.julianday(presentacion)
+    if dialecto in ('mysql', 'mariadb'):
+        return func.datediff(admision, presentacion)
+    # PostgreSQL: date - date ya es un entero de días
+    return admision - presentacion
+
+
+def condiciones_base():
+    return [
+        Procedimiento.fecha_presentacion_demanda.isnot(None),
+        Procedimiento.fecha_admision.isnot(None),
+        Procedimiento.juzgado.isnot(None),
+    ]
+
+
+def condiciones_fechas(presentacion_start=None, presentacion_end=None, admision_start=None, admision_end=None):
+    """Filtros de rango (ya validados) sobre las dos fechas"""
+    condiciones = []
+    if presentacion_start:
+        condiciones.append(Procedimiento.fecha_presentacion_demanda >= presentacion_start)
+    if presentacion_end:
+        condiciones.append(Procedimiento.fecha_presentacion_demanda <= presentacion_end)
+    if admision_start:
+        condiciones.append(Procedimiento.fecha_admision >= admision_start)
+    if admision_end:
+        condiciones.append(Procedimiento.fecha_admision <= admision_end)
+    return condiciones
+
+
+def _posicion(n, p):
+    """Posición (base 1) del percentil p entre n valores ordenados"""
+    return 1 + p * (n - 1)
+
+
+def sentencia_resumen(condiciones=(), dialecto=None):
+    dias = expresion_dias(dialecto)
+    texto_sin_emparejar = case((Procedimiento.juzgado_id.is_(None), Procedimiento.juzgado), else_=None)
+    base = select(
+        Procedimiento.juzgado_id.label('juzgado_id'),
+        texto_sin_emparejar.label('juzgado_texto'),
+        dias.label('dias'),
+    ).where(*condiciones_base(), *condiciones, dias >= 0).subquery('base')
+
+    grupo = (base.c.juzgado_id, base.c.juzgado_texto)
+    numerada = select(
+        *grupo,
+        base.c.dias,
+        func.row_number().over(partition_by=grupo, order_by=base.c.dias).label('rn'),
+        func.count(literal_column('1')).over(partition_by=grupo).label('n'),
+    ).subquery('numerada')
+
+    rn, n, valor = numerada.c.rn, numerada.c.n, numerada.c.dias
+    columnas = [
+        numerada.c.juzgado_id,
+        numerada.c.juzgado_texto,
+        func.max(n).label('muestras'),
+        func.avg(valor).label('media'),
+    ]
+    for nombre, p in PERCENTILES.items():
+        posicion = _posicion(n, p)
+        # Valores en floor(posición) y ceil(posición), sin funciones de redondeo no portables
+        columnas.append(func.max(case((and_(rn <= posicion, rn + 1 > posicion), valor))).label(f'{nombre}_bajo'))
+        columnas.append(func.max(case((and_(rn >= posicion, rn - 1 < posicion), valor))).label(f'{nombre}_alto'))
+    return select(*columnas).group_by(numerada.c.juzgado_id, numerada.c.juzgado_texto)
+
+
+def _interpolar(bajo, alto, n, p):
+    if bajo is None:
+        return alto
+    if alto is None:
+        return bajo
+    fraccion = _posicion(n, p) - math.floor(_posicion(n, p))
+    return float(bajo) + fraccion * (float(alto) - float(bajo))
+
+
+def resumen_por_juzgado(condiciones=()):
+    """[{'juzgado', 'juzgado_id', 'muestras', 'promedio_dias', 'mediana_dias', 'p90_dias'}]"""
+    from juzgados_mercantil_2025 import obtener_juzgado
+
+    filas = []
+    for fila in db.session.execute(sentencia_resumen(condiciones)).mappings():
+        juzgado = obtener_juzgado(fila['juzgado_id']) if fila['juzgado_id'] is not None else None
+        n = fila['muestras']
+        resumen = {
+            'juzgado': juzgado.nombre if juzgado else fila['juzgado_texto'],
+            'juzgado_id': fila['juzgado_id'],
+            'muestras': n,
+            'promedio_dias': round(float(fila['media']), 1),
+        }
+        for nombre, p in PERCENTILES.items():
+            resumen[f'{nombre}_dias'] = round(_interpolar(fila[f'{nombre}_bajo'], fila[f'{nombre}_alto'], n, p), 1)
+        filas.append(resumen)
+    return filas
+
+
+def total_procedimientos(condiciones=()):
+    """Procedimientos con ambas fechas que cumplen los filtros (incluye plazos negativos)"""
+    return db.session.query(func.count(Procedimiento.id)).filter(*condiciones_base(), *condiciones).scalar()
@@ -0,0 +1,116 @@
+"""
+Búsqueda por prefijo (typeahead) en el catálogo de entidades financieras.
+
+El índice se construye una vez por versión del catálogo a partir de la
+instantánea de ``utils.catalogo_entidades``: una lista ordenada de claves
+normalizadas (sin acentos, minúsculas) para el nombre, el nombre comercial,
+cada palabra de ambos y el código de entidad. Una consulta es una búsqueda
+binaria más un recorrido corto por las claves que empiezan por el prefijo.
+
+Orden de los resultados: código exacto, nombre que empieza por el texto,
+nombre comercial que empieza por el texto, alguna palabra que empieza por el
+texto; a igualdad, por nombre.
+"""
+
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+LIMITE_POR_DEFECTO = 10
+LIMITE_MAXIMO = 50
+# Claves recorridas como máximo por consulta (prefijos de una letra)
+MAX_RECORRIDO = 2000
+
+RANGO_CODIGO = 0
+RANGO_NOMBRE = 1
+RANGO_COMERCIAL = 2
+RANGO_PALABRA = 3
+
+_RE_NO_ALFANUMERICO = re.compile(r'[^\w\s]')
+_RE_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar_busqueda(texto):
+    """Igual que limpiar_texto de los scripts de carga: sin acentos, minúsculas y sin signos"""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = _RE_NO_ALFANUMERICO.sub(' ', texto.lower())
+    return _RE_ESPACIOS.sub(' ', texto).strip()
+
+
+class IndicePrefijos:
+    """Array ordenado de (clave, rango, posición en el catálogo)"""
+
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        self.entradas = snapshot.entradas
+        claves = []
+        for pos, entrada in enumerate(self.entradas):
+            if entrada.codigo_entidad:
+                claves.append((normalizar_busqueda(entrada.codigo_entidad), RANGO_CODIGO, pos))
+            for texto, rango in ((entrada.nombre, RANGO_NOMBRE), (entrada.nombre_comercial, RANGO_COMERCIAL)):
+                normalizado = normalizar_busqueda(texto)
+                if not normalizado:
+                    continue
+                claves.append((normalizado, rango, pos))
+                palabras = normalizado.split(' ')
+                for i in range(1, len(palabras)):
+                    claves.append((' '.join(palabras[i:]), RANGO_PALABRA, pos))
+        claves.sort()
+        self._claves = [c[0] for c in claves]
+        self._datos = [(c[1], c[2]) for c in claves]
+
+    def buscar(self, consulta, limite=LIMITE_POR_DEFECTO):
+        """Entradas del catálogo que casan con ``consulta``, ordenadas por relevancia"""
+        prefijo = normalizar_busqueda(consulta)
+        if not prefijo:
+            return []
+        mejores = {}
+        inicio = bisect_left(self._claves, prefijo)
+        for i in range(inicio, min(len(self._claves), inicio + MAX_RECORRIDO)):
+            clave = self._claves[i]
+            if not clave.startswith(prefijo):
+                break
+            rango, pos = self._datos[i]
+            if rango == RANGO_CODIGO and clave != prefijo:
+                rango = RANGO_PALABRA
+            if rango < mejores.get(pos, RANGO_PALABRA + 1):
+                mejores[pos] = rango
+        ordenados = sorted(mejores.items(), key=lambda item: (item[1], item[0]))
+        return [self.entradas[pos] for pos, _ in ordenados[:limite]]
+
+
+_indice = None
+_lock = threading.Lock()
+
+
+def indice_actual(catalogo=None):
+    """Índice de la versión vigente del catálogo (se reconstruye solo si cambió)"""
+    global _indice
+    if catalogo is None:
+        from utils.catalogo_entidades import catalogo_entidades as catalogo
+    snapshot = catalogo.snapshot()
+    indice = _indice
+    if indice is None or indice.version != snapshot.version:
+        with _lock:
+            if _indice is None or _indice.version != snapshot.version:
+                _indice = IndicePrefijos(snapshot)
+            indice = _indice
+    return indice
+
+
+def buscar_entidades(consulta, limite=LIMITE_POR_DEFECTO):
+    """Resultados listos para JSON"""
+    limite = max(1, min(int(limite or LIMITE_POR_DEFECTO), LIMITE_MAXIMO))
+    return [{
+        'id': e.id,
+        'nombre': e.nombre,
+        'nombre_comercial': e.nombre_comercial,
+        'codigo_entidad': e.codigo_entidad,
+        'tipo_entidad': e.tipo_entidad,
+        'localidad': e.localidad,
+        'provincia': e.provincia,
+    } for e in indice_actual().buscar(consulta, limite)]
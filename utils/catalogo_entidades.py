@@ -0,0 +1,108 @@
+"""
+Instantánea en memoria del catálogo de entidades financieras.
+
+Los formularios (Doc. 9, derechos de acceso y supresión) solo necesitan unos
+pocos campos de cada entidad para el selector. En lugar de cargar todas las
+columnas de todas las entidades en cada petición, cada proceso guarda una
+instantánea compacta y ya ordenada.
+
+La instantánea lleva un número de versión que vive en un fichero marcador
+(``instance/catalogo_entidades.version``): las rutas de administración y los
+scripts de carga llaman a ``invalidar()`` tras escribir, y el resto de
+procesos (workers de gunicorn) detectan el cambio con un ``stat`` y recargan
+con una única consulta en la siguiente petición.
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_VERSION = os.environ.get(
+    'CATALOGO_VERSION_FILE', os.path.join(BASE_DIR, 'instance', 'catalogo_entidades.version')
+)
+
+# Solo los campos que usan los selectores y los destinatarios de los formularios
+CAMPOS = (
+    'id', 'nombre', 'nombre_comercial', 'codigo_entidad', 'tipo_entidad',
+    'direccion', 'numero', 'codigo_postal', 'localidad', 'provincia', 'comunidad_autonoma',
+    'email_doc9', 'email_rgpd', 'email_general',
+)
+
+EntradaCatalogo = namedtuple('EntradaCatalogo', CAMPOS)
+
+
+class SnapshotCatalogo:
+    """Vista inmutable del catálogo para una versión concreta"""
+
+    def __init__(self, version, entradas):
+        self.version = version
+        self.entradas = tuple(entradas)
+        # Formato que espera doc9_form.html
+        self.bancos_doc9 = tuple({
+            'nombre': e.nombre,
+            'direccion': e.direccion or '',
+            'num': e.numero or '',
+            'cp': e.codigo_postal or '',
+            'localidad': e.localidad or '',
+            'provincia': e.provincia or '',
+            'ccaa': e.comunidad_autonoma or '',
+            'email_general': e.email_general or e.email_doc9 or '',
+        } for e in self.entradas)
+
+    def __len__(self):
+        return len(self.entradas)
+
+
+class CatalogoEntidades:
+    """Instantánea compartida por las rutas de un proceso, versionada entre procesos"""
+
+    def __init__(self, ruta_version=RUTA_VERSION):
+        self.ruta_version = ruta_version
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def version(self):
+        """Versión publicada (mtime del marcador en ns; 0 si aún no existe)"""
+        try:
+            return os.stat(self.ruta_version).st_mtime_ns
+        except OSError:
+            return 0
+
+    def invalidar(self):
+        """Publica una versión nueva; todos los procesos recargarán en su próximo acceso"""
+        os.makedirs(os.path.dirname(self.ruta_version), exist_ok=True)
+        tmp = f"{self.ruta_version}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp, self.ruta_version)
+        # Algunos sistemas de ficheros tienen mtime de baja resolución: forzar que avance
+        anterior = self._snapshot.version if self._snapshot else 0
+        if self.version() <= anterior:
+            os.utime(self.ruta_version, ns=(anterior + 1, anterior + 1))
+        self._snapshot = None
+
+    def _cargar(self, version):
+        from models import db, EntidadFinanciera
+
+        columnas = [getattr(EntidadFinanciera, c) for c in CAMPOS]
+        filas = db.session.query(*columnas).order_by(EntidadFinanciera.nombre.asc(), EntidadFinanciera.id.asc()).all()
+        return SnapshotCatalogo(version, (EntradaCatalogo(*fila) for fila in filas))
+
+    def snapshot(self):
+        version = self.version()
+        actual = self._snapshot
+        if actual is not None and actual.version == version:
+            return actual
+        with self._lock:
+            actual = self._snapshot
+            if actual is None or actual.version != version:
+                actual = self._snapshot = self._cargar(version)
+        return actual
+
+    def entradas(self):
+        return self.snapshot().entradas
+
+
+catalogo_entidades = CatalogoEntidades()
@@ -0,0 +1,313 @@
+"""
+Resolución de códigos postales para autocompletar formularios.
+
+La tabla CodigoPostal se carga una vez por proceso en estructuras compactas:
+
+- ``_cps``: ``array('I')`` ordenado con el CP de cada fila y ``_filas``
+  (``array('I')`` paralelo) con el índice de su localidad en ``localidades``
+  (tuplas (localidad, provincia, ccaa) sin repetir). Un CP se resuelve con
+  dos búsquedas binarias.
+- Índice inverso: claves normalizadas (sin acentos) de cada localidad y de
+  cada palabra de su nombre, ordenadas, para buscar por prefijo.
+
+Como el catálogo de entidades, la versión vive en un fichero marcador
+(``instance/codigos_postales.version``) que toca el cargador masivo; cada
+worker recarga en su siguiente consulta.
+
+Si un CP no está en la tabla, la provincia y la comunidad se deducen de sus
+dos primeras cifras.
+"""
+
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from utils.buscador_entidades import normalizar_busqueda
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_VERSION = os.environ.get(
+    'CODIGOS_POSTALES_VERSION_FILE', os.path.join(BASE_DIR, 'instance', 'codigos_postales.version')
+)
+TAMANO_BLOQUE = 5000
+LIMITE_POR_DEFECTO = 10
+LIMITE_MAXIMO = 50
+
+# Dos primeras cifras del CP -> (provincia, comunidad autónoma)
+PROVINCIAS = {
+    '01': ('Álava', 'País Vasco'), '02': ('Albacete', 'Castilla-La Mancha'),
+    '03': ('Alicante', 'Comunidad Valenciana'), '04': ('Almería', 'Andalucía'),
+    '05': ('Ávila', 'Castilla y León'), '06': ('Badajoz', 'Extremadura'),
+    '07': ('Islas Baleares', 'Islas Baleares'), '08': ('Barcelona', 'Cataluña'),
+    '09': ('Burgos', 'Castilla y León'), '10': ('Cáceres', 'Extremadura'),
+    '11': ('Cádiz', 'Andalucía'), '12': ('Castellón', 'Comunidad Valenciana'),
+    '13': ('Ciudad Real', 'Castilla-La Mancha'), '14': ('Córdoba', 'Andalucía'),
+    '15': ('A Coruña', 'Galicia'), '16': ('Cuenca', 'Castilla-La Mancha'),
+    '17': ('Girona', 'Cataluña'), '18': ('Granada', 'Andalucía'),
+    '19': ('Guadalajara', 'Castilla-La Mancha'), '20': ('Guipúzcoa', 'País Vasco'),
+    '21': ('Huelva', 'Andalucía'), '22': ('Huesca', 'Aragón'),
+    '23': ('Jaén', 'Andalucía'), '24': ('León', 'Castilla y León'),
+    '25': ('Lleida', 'Cataluña'), '26': ('La Rioja', 'La Rioja'),
+    '27': ('Lugo', 'Galicia'), '28': ('Madrid', 'Madrid'),
+    '29': ('Málaga', 'Andalucía'), '30': ('Murcia', 'Murcia'),
+    '31': ('Navarra', 'Navarra'), '32': ('Ourense', 'Galicia'),
+    '33': ('Asturias', 'Asturias'), '34': ('Palencia', 'Castilla y León'),
+    '35': ('Las Palmas', 'Canarias'), '36': ('Pontevedra', 'Galicia'),
+    '37': ('Salamanca', 'Castilla y León'), '38': ('Santa Cruz de Tenerife', 'Canarias'),
+    '39': ('Cantabria', 'Cantabria'), '40': ('Segovia', 'Castilla y León'),
+    '41': ('Sevilla', 'Andalucía'), '42': ('Soria', 'Castilla y León'),
+    '43': ('Tarragona', 'Cataluña'), '44': ('Teruel', 'Aragón'),
+    '45': ('Toledo', 'Castilla-La Mancha'), '46': ('Valencia', 'Comunidad Valenciana'),
+    '47': ('Valladolid', 'Castilla y León'), '48': ('Vizcaya', 'País Vasco'),
+    '49': ('Zamora', 'Castilla y León'), '50': ('Zaragoza', 'Aragón'),
+    '51': ('Ceuta', 'Ceuta'), '52': ('Melilla', 'Melilla'),
+}
+
+# Alias de columnas de los ficheros de Correos / INE
+COLUMNAS_FICHERO = {
+    'codigo_postal': ['CODIGO_POSTAL', 'codigo_postal', 'CP', 'Código Postal', 'CodigoPostal', 'COD_POSTAL'],
+    'localidad': ['LOCALIDAD', 'localidad', 'Localidad', 'POBLACION', 'Población', 'poblacion',
+                  'MUNICIPIO', 'Municipio', 'municipio_nombre', 'NOMBRE'],
+    'provincia': ['PROVINCIA', 'provincia', 'Provincia', 'provincia_nombre'],
+    'comunidad_autonoma': ['CCAA', 'COMUNIDAD_AUTONOMA', 'comunidad_autonoma', 'Comunidad Autónoma', 'COMUNIDAD'],
+}
+
+
+def normalizar_cp(valor):
+    """'8028' / '08028.0' / ' 08028 ' -> '08028'; '' si no es un CP válido"""
+    texto = str(valor or '').strip()
+    if texto.endswith('.0'):
+        texto = texto[:-2]
+    if not texto.isdigit() or len(texto) > 5:
+        return ''
+    texto = texto.zfill(5)
+    return texto if texto[:2] in PROVINCIAS else ''
+
+
+def provincia_de_cp(cp):
+    """(provincia, ccaa) deducidas de las dos primeras cifras"""
+    return PROVINCIAS.get(normalizar_cp(cp)[:2], ('', ''))
+
+
+class IndiceCodigosPostales:
+    """Mapa CP -> localidades y búsqueda inversa por prefijo de localidad"""
+
+    def __init__(self, version, filas):
+        self.version = version
+        self.localidades = []
+        ids = {}
+        pares = []
+        for cp, localidad, provincia, ccaa in filas:
+            clave = (localidad, provincia, ccaa)
+            if clave not in ids:
+                ids[clave] = len(self.localidades)
+                self.localidades.append(clave)
+            pares.append((int(cp), ids[clave]))
+        pares = sorted(set(pares))
+        self._cps = array('I', (p[0] for p in pares))
+        self._filas = array('I', (p[1] for p in pares))
+
+        # CPs de cada localidad, para la búsqueda inversa
+        por_localidad = sorted((loc, cp) for cp, loc in pares)
+        self._loc_ids = array('I', (p[0] for p in por_localidad))
+        self._loc_cps = array('I', (p[1] for p in por_localidad))
+
+        claves = []
+        for loc_id, (localidad, _, _) in enumerate(self.localidades):
+            normalizado = normalizar_busqueda(localidad)
+            if not normalizado:
+                continue
+            claves.append((normalizado, 0, loc_id))
+            palabras = normalizado.split(' ')
+            for i in range(1, len(palabras)):
+                claves.append((' '.join(palabras[i:]), 1, loc_id))
+        claves.sort()
+        self._claves = [c[0] for c in claves]
+        self._datos = [(c[1], c[2]) for c in claves]
+        self.cargado_en = time.time()
+
+    def __len__(self):
+        return len(self._cps)
+
+    def _localidad(self, loc_id):
+        localidad, provincia, ccaa = self.localidades[loc_id]
+        return {'localidad': localidad, 'provincia': provincia, 'comunidad_autonoma': ccaa}
+
+    def resolver(self, cp):
+        """Localidades de un CP (lista vacía si no existe)"""
+        cp = normalizar_cp(cp)
+        if not cp:
+            return []
+        n = int(cp)
+        inicio, fin = bisect_left(self._cps, n), bisect_right(self._cps, n)
+        return [self._localidad(self._filas[i]) for i in range(inicio, fin)]
+
+    def cps_de_localidad(self, loc_id):
+        inicio, fin = bisect_left(self._loc_ids, loc_id), bisect_right(self._loc_ids, loc_id)
+        return [f"{self._loc_cps[i]:05d}" for i in range(inicio, fin)]
+
+    def buscar(self, consulta, limite=LIMITE_POR_DEFECTO, provincia=None):
+        """Localidades cuyo nombre (o alguna palabra) empieza por ``consulta``"""
+        prefijo = normalizar_busqueda(consulta)
+        if not prefijo:
+            return []
+        provincia = normalizar_busqueda(provincia) if provincia else None
+        mejores = {}
+        inicio = bisect_left(self._claves, prefijo)
+        for i in range(inicio, len(self._claves)):
+            if not self._claves[i].startswith(prefijo):
+                break
+            rango, loc_id = self._datos[i]
+            if provincia and normalizar_busqueda(self.localidades[loc_id][1]) != provincia:
+                continue
+            if rango < mejores.get(loc_id, 2):
+                mejores[loc_id] = rango
+        ordenados = sorted(mejores.items(), key=lambda item: (item[1], self._claves_orden(item[0])))
+        return [{**self._localidad(loc_id), 'codigos_postales': self.cps_de_localidad(loc_id)}
+                for loc_id, _ in ordenados[:limite]]
+
+    def _claves_orden(self, loc_id):
+        localidad, provincia, _ = self.localidades[loc_id]
+        return (len(localidad), localidad, provincia)
+
+
+class ServicioCodigosPostales:
+    """Índice compartido por las rutas de un proceso, versionado entre procesos"""
+
+    def __init__(self, ruta_version=RUTA_VERSION):
+        self.ruta_version = ruta_version
+        self._indice = None
+        self._lock = threading.Lock()
+        self.recargas = 0
+
+    def version(self):
+        try:
+            return os.stat(self.ruta_version).st_mtime_ns
+        except OSError:
+            return 0
+
+    def invalidar(self):
+        os.makedirs(os.path.dirname(self.ruta_version), exist_ok=True)
+        tmp = f"{self.ruta_version}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp, self.ruta_version)
+        anterior = self._indice.version if self._indice else 0
+        if self.version() <= anterior:
+            os.utime(self.ruta_version, ns=(anterior + 1, anterior + 1))
+        self._indice = None
+
+    def _cargar(self, version):
+        from models import db, CodigoPostal
+
+        filas = db.session.query(
+            CodigoPostal.codigo_postal, CodigoPostal.localidad, CodigoPostal.provincia, CodigoPostal.comunidad_autonoma
+        ).all()
+        self.recargas += 1
+        return IndiceCodigosPostales(version, ((cp, l, p, c) for cp, l, p, c in filas if normalizar_cp(cp)))
+
+    def indice(self):
+        version = self.version()
+        actual = self._indice
+        if actual is not None and actual.version == version:
+            return actual
+        with self._lock:
+            actual = self._indice
+            if actual is None or actual.version != version:
+                actual = self._indice = self._cargar(version)
+        return actual
+
+    def resolver(self, cp):
+        """{'codigo_postal', 'localidades', 'provincia', 'comunidad_autonoma'} para autocompletar"""
+        cp = normalizar_cp(cp)
+        provincia, ccaa = PROVINCIAS.get(cp[:2], ('', ''))
+        localidades = self.indice().resolver(cp) if cp else []
+        if localidades:
+            provincia = localidades[0]['provincia']
+            ccaa = localidades[0]['comunidad_autonoma']
+        return {'codigo_postal': cp, 'localidades': localidades, 'provincia': provincia, 'comunidad_autonoma': ccaa}
+
+    def buscar(self, consulta, limite=LIMITE_POR_DEFECTO, provincia=None):
+        limite = max(1, min(int(limite or LIMITE_POR_DEFECTO), LIMITE_MAXIMO))
+        return self.indice().buscar(consulta, limite, provincia)
+
+
+servicio_codigos_postales = ServicioCodigosPostales()
+
+
+def _columna_texto(serie):
+    serie = serie.astype('string').fillna('').str.strip()
+    return serie.mask(serie.str.lower().isin(['nan', 'none', 'null']), '')
+
+
+def normalizar_fichero(df):
+    """DataFrame del fichero -> columnas de CodigoPostal, limpias y sin duplicados"""
+    import pandas as pd
+    from utils.importacion_entidades import mapear_columnas, texto_busqueda
+
+    mapa = mapear_columnas(df, COLUMNAS_FICHERO)
+    if 'codigo_postal' not in mapa or 'localidad' not in mapa:
+        raise ValueError(f"Se necesitan columnas de CP y localidad. Columnas disponibles: {list(df.columns)}")
+
+    datos = pd.DataFrame({campo: _columna_texto(df[columna]) for campo, columna in mapa.items()})
+    datos['codigo_postal'] = datos['codigo_postal'].map(normalizar_cp)
+    datos = datos[(datos['codigo_postal'] != '') & (datos['localidad'] != '')].copy()
+
+    deducidas = datos['codigo_postal'].str[:2].map(PROVINCIAS)
+    for campo, posicion in (('provincia', 0), ('comunidad_autonoma', 1)):
+        por_cp = deducidas.map(lambda p: p[posicion] if isinstance(p, tuple) else '')
+        if campo in datos:
+            datos[campo] = datos[campo].mask(datos[campo] == '', por_cp)
+        else:
+            datos[campo] = por_cp
+
+    datos['localidad_busqueda'] = texto_busqueda(datos['localidad'])
+    datos['provincia_busqueda'] = texto_busqueda(datos['provincia'])
+    return datos.drop_duplicates(subset=['codigo_postal', 'localidad_busqueda'])
+
+
+def cargar_dataframe(df, reemplazar=False, tamano_bloque=TAMANO_BLOQUE, fuente='Correos España', version=None):
+    """
+    Inserta por bloques los pares (CP, localidad) que aún no existen.
+    Con ``reemplazar`` vacía antes la tabla (todo en la misma transacción).
+
+    Retorna {'leidas', 'validas', 'insertadas', 'existentes'}.
+    """
+    from datetime import datetime
+    from models import db, CodigoPostal
+
+    datos = normalizar_fichero(df)
+    validas = len(datos)
+    version = version or datetime.now().strftime('%Y%m%d')
+
+    try:
+        if reemplazar:
+            db.session.query(CodigoPostal).delete(synchronize_session=False)
+            existentes = set()
+        else:
+            existentes = set(db.session.query(CodigoPostal.codigo_postal, CodigoPostal.localidad_busqueda).all())
+        claves = list(zip(datos['codigo_postal'], datos['localidad_busqueda']))
+        nuevas = datos[[clave not in existentes for clave in claves]]
+
+        ahora = datetime.utcnow()
+        registros = nuevas.assign(pais='España', fuente_datos=fuente, version_datos=version,
+                                  created_at=ahora, updated_at=ahora).to_dict('records')
+        for i in range(0, len(registros), tamano_bloque):
+            db.session.bulk_insert_mappings(CodigoPostal, registros[i:i + tamano_bloque])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if registros or reemplazar:
+        servicio_codigos_postales.invalidar()
+
+    return {'leidas': len(df), 'validas': validas, 'insertadas': len(registros),
+            'existentes': validas - len(registros)}
+
+
+def cargar_fichero(ruta, **kwargs):
+    from utils.importacion_entidades import leer_fichero
+
+    return cargar_dataframe(leer_fichero(ruta), **kwargs)
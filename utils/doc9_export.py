@@ -0,0 +1,177 @@
+"""
+Exportación del Documento 9 (lista de acreedores) sin pandas.
+
+Las filas de la sesión se normalizan una vez a tuplas y se escriben
+directamente en el formato pedido:
+
+- xlsx: XlsxWriter en memoria, con formatos, anchos y fila TOTAL PASIVO
+  (=SUM con el valor ya calculado, para visores que no recalculan);
+- pdf: tabla ReportLab apaisada con la misma fila de total;
+- csv: separador ';' y coma decimal, como lo abre Excel en español.
+"""
+
+import csv
+import io
+import re
+from xml.sax.saxutils import escape
+
+COLUMNAS = [
+    ("ACREEDOR", 28),
+    ("DOMICILIO Y CORREO ELECTRÓNICO", 46),
+    ("NATURALEZA DEL CRÉDITO", 30),
+    ("CRÉDITO PENDIENTE", 20),
+    ("CUOTAS VENCIDAS", 18),
+    ("GARANTÍAS", 22),
+]
+CABECERAS = [c[0] for c in COLUMNAS]
+COLUMNA_IMPORTE = 3
+ETIQUETA_TOTAL = "TOTAL PASIVO"
+NOMBRE_FICHERO = "DOC. 9 Lista Acreedores"
+
+FORMATOS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Claves con las que se han guardado los campos en la sesión a lo largo del tiempo
+_CLAVES = [
+    ("Acreedor", "ACREEDOR"),
+    ("Domicilio y correo electrónico", "DOMICILIO Y CORREO ELECTRÓNICO"),
+    ("Naturaleza del crédito", "NATURALEZA DEL CRÉDITO"),
+    ("Crédito pendiente", "CRÉDITO PENDIENTE", "Crédito pendiente (€)", "CRÉDITO PENDIENTE (€)"),
+    ("Cuotas vencidas", "CUOTAS VENCIDAS"),
+    ("Garantías", "GARANTÍAS"),
+]
+
+_DECIMAL_CON_PUNTO = re.compile(r"^-?\d+\.\d{1,2}$")
+
+
+def parsear_importe(valor):
+    """Importe a float aceptando '1234.56' (formato guardado) y '1.234,56'"""
+    texto = str(valor or "").replace("€", "").replace(" ", "").strip()
+    if not texto:
+        return 0.0
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    elif not _DECIMAL_CON_PUNTO.match(texto):
+        texto = texto.replace(".", "")
+    try:
+        return float(texto)
+    except ValueError:
+        return 0.0
+
+
+def _campo(registro, claves):
+    for clave in claves:
+        valor = registro.get(clave)
+        if valor:
+            return valor
+    return ""
+
+
+def normalizar_registros(registros):
+    """Lista de tuplas en el orden de COLUMNAS, con el importe como float"""
+    filas = []
+    for r in registros:
+        fila = [_campo(r, claves) for claves in _CLAVES]
+        fila[COLUMNA_IMPORTE] = parsear_importe(fila[COLUMNA_IMPORTE] or "0")
+        filas.append(tuple(fila))
+    return filas
+
+
+def total_pasivo(filas):
+    return round(sum(f[COLUMNA_IMPORTE] for f in filas), 2)
+
+
+def escribir_xlsx(filas):
+    import xlsxwriter
+
+    salida = io.BytesIO()
+    wb = xlsxwriter.Workbook(salida, {"in_memory": True})
+    ws = wb.add_worksheet("DOC9")
+    negrita = wb.add_format({"bold": True})
+    importe = wb.add_format({"num_format": "#,##0.00"})
+    importe_negrita = wb.add_format({"num_format": "#,##0.00", "bold": True})
+
+    for i, (_, ancho) in enumerate(COLUMNAS):
+        ws.set_column(i, i, ancho, importe if i == COLUMNA_IMPORTE else None)
+    ws.write_row(0, 0, CABECERAS, negrita)
+    for n, fila in enumerate(filas, start=1):
+        ws.write_row(n, 0, fila)
+
+    fila_total = len(filas) + 1
+    ws.write(fila_total, COLUMNA_IMPORTE - 1, ETIQUETA_TOTAL, negrita)
+    ws.write_formula(fila_total, COLUMNA_IMPORTE, f"=SUM(D2:D{len(filas) + 1})",
+                     importe_negrita, total_pasivo(filas))
+    wb.close()
+    return salida.getvalue()
+
+
+def _importe_es(valor):
+    """1234.5 -> '1.234,50'"""
+    return f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def escribir_csv(filas):
+    salida = io.StringIO()
+    salida.write("\ufeff")
+    writer = csv.writer(salida, delimiter=";")
+    writer.writerow(CABECERAS)
+    for fila in filas:
+        writer.writerow([_importe_es(v) if i == COLUMNA_IMPORTE else v for i, v in enumerate(fila)])
+    writer.writerow(["", "", ETIQUETA_TOTAL, _importe_es(total_pasivo(filas)), "", ""])
+    return salida.getvalue().encode("utf-8")
+
+
+def escribir_pdf(filas):
+    # Paragraph interpreta su texto como marcado: se escapa para que '<', '>' y
+    # '&' de los datos (p. ej. "Banco <info@banco.es>") salgan tal cual
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    estilos = getSampleStyleSheet()
+    celda = ParagraphStyle("CeldaDoc9", parent=estilos["Normal"], fontSize=8, leading=10)
+    titulo = ParagraphStyle("TituloDoc9", parent=estilos["Heading1"], alignment=TA_CENTER, fontSize=14,
+                            spaceAfter=12)
+
+    salida = io.BytesIO()
+    doc = SimpleDocTemplate(salida, pagesize=landscape(A4), leftMargin=1.5 * cm, rightMargin=1.5 * cm,
+                            topMargin=1.5 * cm, bottomMargin=1.5 * cm, title=NOMBRE_FICHERO)
+    ancho_util = landscape(A4)[0] - 3 * cm
+    total_anchos = sum(a for _, a in COLUMNAS)
+    anchos = [ancho_util * a / total_anchos for _, a in COLUMNAS]
+
+    datos = [CABECERAS]
+    for fila in filas:
+        datos.append([_importe_es(v) if i == COLUMNA_IMPORTE else Paragraph(escape(str(v)), celda)
+                      for i, v in enumerate(fila)])
+    datos.append(["", "", ETIQUETA_TOTAL, _importe_es(total_pasivo(filas)), "", ""])
+
+    tabla = Table(datos, colWidths=anchos, repeatRows=1)
+    tabla.setStyle(TableStyle([
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 8),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E6E6E6")),
+        ("GRID", (0, 0), (-1, -2), 0.5, colors.grey),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("ALIGN", (COLUMNA_IMPORTE, 1), (COLUMNA_IMPORTE, -1), "RIGHT"),
+        ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+        ("LINEABOVE", (COLUMNA_IMPORTE - 1, -1), (COLUMNA_IMPORTE, -1), 1, colors.black),
+    ]))
+    doc.build([Paragraph("DOCUMENTO 9 - LISTA DE ACREEDORES", titulo),
+               Spacer(1, 0.3 * cm), tabla])
+    return salida.getvalue()
+
+
+def exportar(registros, formato="xlsx"):
+    """Devuelve (bytes, mimetype, nombre_fichero)"""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+    filas = normalizar_registros(registros)
+    escritor = {"xlsx": escribir_xlsx, "pdf": escribir_pdf, "csv": escribir_csv}[formato]
+    return escritor(filas), FORMATOS[formato], f"{NOMBRE_FICHERO}.{formato}"
@@ -0,0 +1,327 @@
+"""
+Cola transaccional de emails (outbox) con entrega SMTP en segundo plano.
+
+Las rutas llaman a ``encolar_email`` (una inserción y vuelven al instante).
+Un worker vacía la cola: reclama cada mensaje con un UPDATE condicional
+(varios workers de gunicorn no envían dos veces el mismo), reintenta con
+backoff exponencial y marca como 'fallido' (dead letter) al agotar intentos.
+
+La cola no guarda credenciales: el email de bienvenida ('bienvenida') solo
+lleva el usuario; la contraseña temporal se genera al entregarlo y su hash se
+guarda en la misma transacción que marca el mensaje como enviado.
+
+Prueba local contra un stub SMTP:
+    python -m aiosmtpd -n -l localhost:1025
+    SMTP_ENABLED=True SMTP_SERVER=localhost SMTP_PORT=1025 SMTP_USE_TLS=False \
+        flask outbox-worker --una-vez
+y de forma automática en test_email_outbox.py.
+"""
+
+import json
+import os
+import random
+import secrets
+import string
+import threading
+from datetime import datetime, timedelta
+
+from models import db, EmailOutbox
+from utils.adjuntos import adjuntos_en_envio
+
+PDF_DIR = os.path.join('static', 'pdfs')
+
+ESTADO_PENDIENTE = 'pendiente'
+ESTADO_ENVIANDO = 'enviando'
+ESTADO_ENVIADO = 'enviado'
+ESTADO_FALLIDO = 'fallido'
+
+MAX_INTENTOS = int(os.environ.get('OUTBOX_MAX_INTENTOS', '5'))
+BACKOFF_BASE_SEGUNDOS = int(os.environ.get('OUTBOX_BACKOFF_BASE', '30'))
+BACKOFF_MAX_SEGUNDOS = int(os.environ.get('OUTBOX_BACKOFF_MAX', '3600'))
+# Mensajes 'enviando' más antiguos que esto se consideran de un worker caído
+BLOQUEO_EXPIRA_SEGUNDOS = int(os.environ.get('OUTBOX_BLOQUEO_EXPIRA', '600'))
+
+
+def _enviar_desde_docx(email_sender, to_email, subject, docx_path, contexto):
+    """Renderiza una plantilla DOCX como HTML y la envía (email de bienvenida)"""
+    html, inline_images = email_sender.render_email_from_docx(docx_path, contexto)
+    return email_sender.send_notification_email(to_email, subject, html, html=True, inline_images=inline_images)
+
+
+def password_temporal(longitud=10):
+    alfabeto = string.ascii_letters + string.digits
+    return ''.join(secrets.choice(alfabeto) for _ in range(longitud))
+
+
+def _enviar_bienvenida(email_sender, to_email, username, subject, docx_path=None):
+    """
+    Genera la contraseña temporal en el momento del envío y solo si el envío
+    va bien deja su hash en la sesión (se confirma al marcar el mensaje).
+    """
+    from werkzeug.security import generate_password_hash
+    from models import User
+
+    usuario = User.query.filter_by(username=username).first()
+    if usuario is None:
+        raise ValueError(f"El usuario {username} ya no existe")
+
+    password = password_temporal()
+    if docx_path and os.path.exists(docx_path):
+        resultado = _enviar_desde_docx(email_sender, to_email, subject, docx_path, {
+            'nombre': usuario.nombre,
+            'apellidos': usuario.apellidos,
+            'username': usuario.username,
+            'password_temporal': password,
+        })
+    else:
+        body = (
+            f"Hola {usuario.nombre} {usuario.apellidos},\n\n"
+            f"Se ha creado tu usuario en el sistema.\n\n"
+            f"Usuario: {usuario.username}\n"
+            f"Contraseña temporal: {password}\n\n"
+            f"Por seguridad, cambia tu contraseña tras iniciar sesión."
+        )
+        resultado = email_sender.send_notification_email(to_email, subject, body)
+
+    if _motivo_fallo(resultado) is None:
+        usuario.password_hash = generate_password_hash(password)
+    return resultado
+
+
+# Manejadores que no son un método directo de EmailSender
+MANEJADORES = {
+    'docx': _enviar_desde_docx,
+    'bienvenida': _enviar_bienvenida,
+}
+
+
+def encolar_bienvenida(usuario, docx_path=None, asunto="Bienvenido - Credenciales de acceso"):
+    """Encola el email de bienvenida de un usuario (sin contraseña en la cola)"""
+    return encolar_email('bienvenida', usuario.email, usuario.email, usuario.username, asunto,
+                         docx_path=docx_path, asunto=asunto, usuario_id=usuario.id)
+
+
+def datos_mensaje(metodo, destinatario, *args, asunto=None, usuario_id=None, max_intentos=None, **kwargs):
+    """Columnas de una fila de la cola (sirve para inserciones masivas con bulk_insert_mappings)"""
+    ahora = datetime.utcnow()
+    return {
+        'metodo': metodo,
+        'destinatario': destinatario,
+        'asunto': (asunto or '')[:200],
+        'payload': json.dumps({'args': list(args), 'kwargs': kwargs}, default=str),
+        'estado': ESTADO_PENDIENTE,
+        'intentos': 0,
+        'max_intentos': max_intentos or MAX_INTENTOS,
+        'proximo_intento': ahora,
+        'usuario_id': usuario_id,
+        'created_at': ahora,
+        'updated_at': ahora,
+    }
+
+
+def encolar_email(metodo, destinatario, *args, asunto=None, usuario_id=None, max_intentos=None, **kwargs):
+    """
+    Inserta un mensaje en la cola y devuelve la fila creada.
+
+    ``metodo`` es un método de EmailSender (p. ej. 'send_notification_email')
+    o una clave de MANEJADORES; ``args``/``kwargs`` deben ser serializables
+    en JSON y se pasan tal cual en el momento de la entrega.
+    """
+    mensaje = EmailOutbox(**datos_mensaje(metodo, destinatario, *args, asunto=asunto, usuario_id=usuario_id,
+                                          max_intentos=max_intentos, **kwargs))
+    db.session.add(mensaje)
+    db.session.commit()
+    worker_outbox.despertar()
+    return mensaje
+
+
+def calcular_backoff(intentos):
+    """Segundos hasta el siguiente intento: base * 2^(n-1) con jitter, acotado"""
+    espera = min(BACKOFF_MAX_SEGUNDOS, BACKOFF_BASE_SEGUNDOS * (2 ** max(0, intentos - 1)))
+    return espera * random.uniform(0.8, 1.2)
+
+
+def _liberar_bloqueos_caducados(ahora):
+    limite = ahora - timedelta(seconds=BLOQUEO_EXPIRA_SEGUNDOS)
+    liberados = EmailOutbox.query.filter(
+        EmailOutbox.estado == ESTADO_ENVIANDO,
+        EmailOutbox.updated_at < limite
+    ).update({'estado': ESTADO_PENDIENTE, 'updated_at': ahora}, synchronize_session=False)
+    # Sin filas liberadas no hay nada que confirmar (evita una escritura por ciclo y worker)
+    if liberados:
+        db.session.commit()
+    else:
+        db.session.rollback()
+
+
+def _reclamar(lote, ahora):
+    """Marca como 'enviando' hasta ``lote`` mensajes vencidos y devuelve sus ids"""
+    candidatos = [fila.id for fila in db.session.query(EmailOutbox.id).filter(
+        EmailOutbox.estado == ESTADO_PENDIENTE,
+        EmailOutbox.proximo_intento <= ahora
+    ).order_by(EmailOutbox.proximo_intento.asc(), EmailOutbox.id.asc()).limit(lote).all()]
+
+    reclamados = []
+    for mensaje_id in candidatos:
+        actualizados = EmailOutbox.query.filter(
+            EmailOutbox.id == mensaje_id,
+            EmailOutbox.estado == ESTADO_PENDIENTE
+        ).update({'estado': ESTADO_ENVIANDO, 'updated_at': ahora}, synchronize_session=False)
+        if actualizados == 1:
+            reclamados.append(mensaje_id)
+    db.session.commit()
+    return reclamados
+
+
+def _rutas_adjuntos(metodo, args, kwargs):
+    """Ficheros que adjunta el envío (para la caché de codificación base64)"""
+    rutas = [kwargs.get('attachment_path')]
+    # send_pdf_email(to, subject, body, filename) con filename relativo a static/pdfs
+    if metodo == 'send_pdf_email' and len(args) >= 4 and args[3]:
+        rutas.append(os.path.join(PDF_DIR, args[3]))
+    return [ruta for ruta in rutas if ruta]
+
+
+def _entregar(email_sender, mensaje):
+    """Ejecuta el envío; devuelve None si fue bien o el motivo del fallo"""
+    payload = json.loads(mensaje.payload or '{}')
+    manejador = MANEJADORES.get(mensaje.metodo)
+    try:
+        args, kwargs = payload.get('args', []), payload.get('kwargs', {})
+        with adjuntos_en_envio(_rutas_adjuntos(mensaje.metodo, args, kwargs)):
+            if manejador:
+                resultado = manejador(email_sender, *args, **kwargs)
+            else:
+                resultado = getattr(email_sender, mensaje.metodo)(*args, **kwargs)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return _motivo_fallo(resultado)
+
+
+def _motivo_fallo(resultado):
+    """None si el resultado de EmailSender indica envío correcto; si no, el motivo"""
+    if resultado is False:
+        return 'El servidor SMTP rechazó el envío'
+    if isinstance(resultado, tuple) and len(resultado) == 2 and resultado[0] is False:
+        return str(resultado[1]) or 'El servidor SMTP rechazó el envío'
+    return None
+
+
+def procesar_outbox(email_sender, lote=20):
+    """Entrega un lote de mensajes vencidos; devuelve contadores del ciclo"""
+    ahora = datetime.utcnow()
+    _liberar_bloqueos_caducados(ahora)
+    resumen = {'enviados': 0, 'reintentos': 0, 'fallidos': 0}
+
+    for mensaje_id in _reclamar(lote, ahora):
+        mensaje = db.session.get(EmailOutbox, mensaje_id)
+        if mensaje is None:
+            continue
+        error = _entregar(email_sender, mensaje)
+        mensaje.intentos += 1
+        if error is None:
+            mensaje.estado = ESTADO_ENVIADO
+            mensaje.enviado_at = datetime.utcnow()
+            mensaje.ultimo_error = None
+            mensaje.payload = '{}'
+            resumen['enviados'] += 1
+        elif mensaje.intentos >= mensaje.max_intentos:
+            mensaje.estado = ESTADO_FALLIDO
+            mensaje.ultimo_error = error
+            resumen['fallidos'] += 1
+        else:
+            mensaje.estado = ESTADO_PENDIENTE
+            mensaje.ultimo_error = error
+            mensaje.proximo_intento = datetime.utcnow() + timedelta(seconds=calcular_backoff(mensaje.intentos))
+            resumen['reintentos'] += 1
+        db.session.commit()
+
+    return resumen
+
+
+def reintentar(mensaje):
+    """
+    Devuelve a la cola un mensaje fallido (dead letter) con los intentos a cero.
+
+    Solo los 'fallido': un 'enviado' ya no tiene payload (y reenviar una
+    bienvenida cambiaría la contraseña del usuario) y un 'enviando' lo está
+    entregando un worker. El cambio es un UPDATE condicional, así que un
+    mensaje reclamado entre medias no se encola dos veces. ValueError si el
+    mensaje no está fallido.
+    """
+    actualizados = EmailOutbox.query.filter(
+        EmailOutbox.id == mensaje.id,
+        EmailOutbox.estado == ESTADO_FALLIDO
+    ).update({'estado': ESTADO_PENDIENTE, 'intentos': 0, 'proximo_intento': datetime.utcnow(),
+              'updated_at': datetime.utcnow()}, synchronize_session=False)
+    if actualizados != 1:
+        db.session.rollback()
+        raise ValueError(f"Solo se pueden reintentar mensajes en estado '{ESTADO_FALLIDO}' "
+                         f"(estado actual: '{db.session.get(EmailOutbox, mensaje.id).estado}')")
+    db.session.commit()
+    db.session.refresh(mensaje)
+    worker_outbox.despertar()
+    return mensaje
+
+
+def resumen_estados():
+    """Número de mensajes por estado"""
+    filas = db.session.query(EmailOutbox.estado, db.func.count(EmailOutbox.id)).group_by(EmailOutbox.estado).all()
+    return {estado: total for estado, total in filas}
+
+
+class WorkerOutbox:
+    """Hilo de entrega en segundo plano, uno por proceso (se arranca tras el fork)"""
+
+    def __init__(self, intervalo=None, lote=20):
+        self.intervalo = intervalo or int(os.environ.get('OUTBOX_INTERVALO', '5'))
+        self.lote = lote
+        self._app = None
+        self._email_sender = None
+        self._evento = threading.Event()
+        self._hilo = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configurar(self, app, email_sender):
+        self._app = app
+        self._email_sender = email_sender
+
+    def iniciar(self):
+        """Arranca el hilo si no está vivo en este proceso (idempotente)"""
+        if self._app is None:
+            return
+        if self._hilo is not None and self._pid == os.getpid() and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._hilo is not None and self._pid == os.getpid() and self._hilo.is_alive():
+                return
+            self._pid = os.getpid()
+            self._hilo = threading.Thread(target=self._bucle, name='outbox-worker', daemon=True)
+            self._hilo.start()
+
+    def despertar(self):
+        self._evento.set()
+
+    def ejecutar_ciclo(self):
+        with self._app.app_context():
+            try:
+                return procesar_outbox(self._email_sender, lote=self.lote)
+            except Exception as e:
+                db.session.rollback()
+                self._app.logger.error(f"Error procesando la cola de emails: {e}")
+                return None
+            finally:
+                db.session.remove()
+
+    def _bucle(self):
+        while True:
+            resumen = self.ejecutar_ciclo()
+            # Si el lote vino lleno probablemente quedan mensajes: no esperar
+            if resumen and sum(resumen.values()) >= self.lote:
+                continue
+            self._evento.wait(self.intervalo)
+            self._evento.clear()
+
+
+worker_outbox = WorkerOutbox()
@@ -0,0 +1,152 @@
+"""
+Exportación en streaming del catálogo de entidades financieras.
+
+Las filas se leen con un cursor de servidor como tuplas planas (sin objetos
+ORM), se escriben directamente en el formato pedido y se entregan al cliente
+trozo a trozo:
+
+- xlsx: XlsxWriter en modo ``constant_memory`` sobre un fichero temporal
+  que se envía y se borra al terminar.
+- csv / jsonl: se generan línea a línea sin fichero intermedio.
+
+La memoria usada no depende del número de entidades.
+"""
+
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime
+
+from models import db, EntidadFinanciera
+
+CHUNK_SIZE = 64 * 1024
+LOTE_CURSOR = 1000
+
+# (cabecera, columna, ancho en Excel)
+COLUMNAS = [
+    ('NOMBRE', EntidadFinanciera.nombre, 45),
+    ('NOMBRE_COMERCIAL', EntidadFinanciera.nombre_comercial, 30),
+    ('TIPO_ENTIDAD', EntidadFinanciera.tipo_entidad, 18),
+    ('CODIGO_ENTIDAD', EntidadFinanciera.codigo_entidad, 15),
+    ('DIRECCION', EntidadFinanciera.direccion, 40),
+    ('NUMERO', EntidadFinanciera.numero, 8),
+    ('CODIGO_POSTAL', EntidadFinanciera.codigo_postal, 13),
+    ('LOCALIDAD', EntidadFinanciera.localidad, 20),
+    ('PROVINCIA', EntidadFinanciera.provincia, 18),
+    ('CCAA', EntidadFinanciera.comunidad_autonoma, 20),
+    ('TELEFONO', EntidadFinanciera.telefono, 14),
+    ('WEB', EntidadFinanciera.web, 30),
+    ('EMAIL_DOC9', EntidadFinanciera.email_doc9, 30),
+    ('EMAIL_RGPD', EntidadFinanciera.email_rgpd, 30),
+    ('EMAIL_GENERAL', EntidadFinanciera.email_general, 30),
+    ('ESTADO', EntidadFinanciera.estado, 12),
+    ('SUPERVISOR', EntidadFinanciera.supervisor_principal, 15),
+]
+
+CABECERAS = [c[0] for c in COLUMNAS]
+
+FORMATOS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+
+def iterar_filas(lote=LOTE_CURSOR):
+    """Tuplas de las columnas exportadas, leídas por lotes con cursor de servidor"""
+    consulta = db.session.query(*[c[1] for c in COLUMNAS]).order_by(
+        EntidadFinanciera.nombre.asc(), EntidadFinanciera.id.asc()
+    ).execution_options(yield_per=lote)
+    for fila in consulta:
+        yield tuple(fila)
+
+
+def _leer_y_borrar(ruta, chunk_size=CHUNK_SIZE):
+    try:
+        with open(ruta, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+def stream_xlsx(filas, hoja='ENTIDADES'):
+    """Escribe el libro en modo constant_memory y lo entrega desde disco"""
+    import xlsxwriter
+
+    fd, ruta = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        wb = xlsxwriter.Workbook(ruta, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+        ws = wb.add_worksheet(hoja)
+        negrita = wb.add_format({'bold': True})
+        for i, (_, _, ancho) in enumerate(COLUMNAS):
+            ws.set_column(i, i, ancho)
+        ws.freeze_panes(1, 0)
+        # En constant_memory las filas deben escribirse en orden y de una en una
+        ws.write_row(0, 0, CABECERAS, negrita)
+        n = 0
+        for n, fila in enumerate(filas, start=1):
+            ws.write_row(n, 0, ['' if v is None else v for v in fila])
+        if n:
+            ws.autofilter(0, 0, n, len(COLUMNAS) - 1)
+        wb.close()
+    except Exception:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+        raise
+    yield from _leer_y_borrar(ruta)
+
+
+def stream_csv(filas, lineas_por_trozo=500):
+    """CSV UTF-8 con BOM (para que Excel respete los acentos)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(CABECERAS)
+    for n, fila in enumerate(filas, start=1):
+        writer.writerow(fila)
+        if n % lineas_por_trozo == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _json_default(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def stream_jsonl(filas, lineas_por_trozo=500):
+    """Un objeto JSON por entidad y línea"""
+    partes = []
+    for fila in filas:
+        partes.append(json.dumps(dict(zip(CABECERAS, fila)), ensure_ascii=False, default=_json_default))
+        if len(partes) >= lineas_por_trozo:
+            yield ('\n'.join(partes) + '\n').encode('utf-8')
+            partes = []
+    if partes:
+        yield ('\n'.join(partes) + '\n').encode('utf-8')
+
+
+def exportar(formato, filas=None):
+    """Devuelve (iterador_de_bytes, mimetype, extension) para ``formato``"""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+    filas = iterar_filas() if filas is None else filas
+    generador = {'xlsx': stream_xlsx, 'csv': stream_csv, 'jsonl': stream_jsonl}[formato]
+    mimetype, extension = FORMATOS[formato]
+    return generador(filas), mimetype, extension
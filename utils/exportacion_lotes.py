@@ -0,0 +1,132 @@
+"""
+Exportación en streaming de los documentos de FormularioRPC.
+
+Los registros se recorren de forma perezosa (``yield_per``), cada PDF se
+genera, se añade al paquete y se descarta, y el resultado se entrega al
+cliente trozo a trozo. En modo ZIP la memoria es constante sea cual sea el
+número de documentos.
+
+El PDF combinado no puede emitirse en streaming (PyPDF2 necesita todas las
+páginas antes de escribir) y además retrasa el primer byte hasta terminar la
+unión, así que solo se ofrece hasta ``LIMITE_PDF_COMBINADO`` documentos; por
+encima, la ruta entrega ZIP.
+
+Los PDF se regeneran en vez de reutilizar los de ``static/pdfs``:
+FormularioRPC no guarda el nombre del fichero generado y esos ficheros no se
+conservan de forma fiable, así que no hay forma segura de localizarlos.
+"""
+
+import io
+import os
+import tempfile
+import zipfile
+
+PDF_DIR = os.path.join("static", "pdfs")
+CHUNK_SIZE = 64 * 1024
+LIMITE_PDF_COMBINADO = 50
+
+
+def datos_formulario_rpc(formulario):
+    """Reconstruye los datos del formulario tal y como los recibe el generador"""
+    return {
+        "nombre": formulario.nombre,
+        "apellidos": formulario.apellidos,
+        "dni_nie": formulario.dni_nie,
+        "observaciones": formulario.observaciones or "",
+        "tipo_concurso": formulario.tipo_concurso or "",
+        "fecha_presentacion": formulario.fecha_presentacion.strftime("%Y-%m-%d") if formulario.fecha_presentacion else "",
+    }
+
+
+def iterar_pdfs(pdf_generator, query, lote=100, pdf_dir=PDF_DIR):
+    """
+    Genera el PDF de cada formulario de la consulta bajo demanda.
+
+    Produce tuplas (nombre_en_paquete, ruta, formulario_id); los formularios
+    que fallan se omiten.
+    """
+    for formulario in query.yield_per(lote):
+        try:
+            filename = pdf_generator.generate_form_rpc_pdf(datos_formulario_rpc(formulario))
+        except Exception:
+            continue
+        ruta = os.path.join(pdf_dir, filename)
+        if os.path.exists(ruta):
+            fecha = formulario.created_at.strftime("%Y%m%d") if formulario.created_at else "sin_fecha"
+            yield f"{fecha}_{formulario.id:06d}_{filename}", ruta, formulario.id
+
+
+class _SalidaStreaming(io.RawIOBase):
+    """Destino no posicionable para ZipFile que acumula bytes hasta vaciarse"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer.extend(data)
+        return len(data)
+
+    def vaciar(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except OSError:
+        pass
+
+
+def stream_zip(pdfs, limpiar=True):
+    """Genera el ZIP como iterador de bytes, un documento cada vez"""
+    salida = _SalidaStreaming()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nombre, ruta, _ in pdfs:
+            zf.write(ruta, arcname=nombre)
+            if limpiar:
+                _borrar(ruta)
+            data = salida.vaciar()
+            if data:
+                yield data
+    data = salida.vaciar()
+    if data:
+        yield data
+
+
+def stream_pdf_combinado(pdfs, limpiar=True, chunk_size=CHUNK_SIZE, limite=LIMITE_PDF_COMBINADO):
+    """
+    Une los documentos en un PDF y lo entrega en trozos.
+
+    PyPDF2 necesita el documento completo para escribir la tabla de
+    referencias, así que todas las páginas quedan en memoria hasta volcarlas a
+    un fichero temporal. Por eso no acepta más de ``limite`` documentos: los
+    lotes grandes deben ir en ZIP.
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    rutas = []
+    for _, ruta, _ in pdfs:
+        if len(rutas) >= limite:
+            raise ValueError(f"El PDF combinado admite como máximo {limite} documentos")
+        for page in PdfReader(ruta).pages:
+            writer.add_page(page)
+        rutas.append(ruta)
+
+    with tempfile.TemporaryFile() as tmp:
+        writer.write(tmp)
+        del writer
+        if limpiar:
+            for ruta in rutas:
+                _borrar(ruta)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
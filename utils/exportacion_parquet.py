@@ -0,0 +1,281 @@
+"""
+Exportación de tablas operativas a Parquet particionado por mes.
+
+Para análisis fuera de línea (``flask exportar-parquet``): los analistas leen
+ficheros columnares en lugar de consultar la base de datos de producción.
+
+Estructura en disco (particionado estilo Hive, legible con
+``pyarrow.dataset`` / ``pandas.read_parquet`` / DuckDB)::
+
+    <destino>/<tabla>/mes=AAAA-MM/part-<primer id>-<último id>.parquet
+    <destino>/<tabla>/mes=AAAA-MM/tardias-<primer id>-<último id>.parquet
+    <destino>/_marcas.json        {tabla: {ultimo_id, huecos, datos_personales, protegidas}}
+
+- Se lee por bloques ordenados por id (paginación por clave, nunca OFFSET),
+  así que la memoria no depende del tamaño de la tabla.
+- El esquema Arrow se deriva de las columnas del modelo (enteros, texto,
+  booleanos, fechas y marcas de tiempo con su tipo, no como texto).
+- Cada ejecución añade las filas con id mayor que la marca de agua de la
+  tabla; la marca se actualiza tras escribir cada bloque, de modo que una
+  ejecución interrumpida continúa donde se quedó. ``completo=True`` borra la
+  tabla exportada y empieza de cero.
+- En PostgreSQL y MySQL los ids se asignan al insertar, no al confirmar: una
+  transacción lenta puede confirmar un id menor que otro ya exportado. Los
+  ids que faltaban por debajo de la marca (hasta ``VENTANA_IDS`` por debajo)
+  se guardan como huecos y se vuelven a consultar en cada ejecución; las
+  filas que aparecen se escriben en ficheros ``tardias-*`` y dejan de ser
+  hueco, así que ninguna fila se exporta dos veces. Los huecos de
+  transacciones abortadas caducan al quedar fuera de la ventana.
+- Datos personales (``COLUMNAS_PERSONALES``: nombre, apellidos y DNI/NIE de
+  formulario_rpc; usuario, IP y ubicación de access_log): por defecto se
+  seudonimizan con HMAC-SHA256 si hay clave en ``PARQUET_SEUDONIMO_CLAVE``
+  (el mismo valor da el mismo seudónimo, así que se puede agrupar por persona
+  sin conocerla) y si no se excluyen del fichero. El texto libre
+  (``COLUMNAS_TEXTO_LIBRE``: observaciones de formulario_rpc) puede contener
+  cualquier dato personal y no se puede seudonimizar: se excluye siempre.
+  Cambiar el tratamiento o las columnas protegidas exige ``completo``.
+
+Las filas solo se añaden: los cambios posteriores sobre filas ya exportadas
+(p. ej. ``juzgado_id`` tras ``flask migrar-juzgados``) requieren una
+exportación completa.
+
+pyarrow se importa solo al exportar; no hace falta en los workers web.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import shutil
+
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, Float, Integer, Numeric, select
+
+from models import db, AccessLog, FormularioRPC, Procedimiento
+
+TAMANO_BLOQUE = 50000
+SIN_FECHA = 'sin_fecha'
+VENTANA_IDS = 1000  # ids por debajo de la marca que se vigilan por si se confirman tarde
+
+SEUDONIMIZAR = 'seudonimizar'
+EXCLUIR = 'excluir'
+CLAVE_SEUDONIMOS = os.environ.get('PARQUET_SEUDONIMO_CLAVE', '')
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORIO = os.environ.get('PARQUET_EXPORT_DIR', os.path.join(BASE_DIR, 'instance', 'exportaciones_parquet'))
+
+# Nombre de la exportación -> (modelo, columna fecha que define la partición mensual)
+TABLAS = {
+    'procedimiento': (Procedimiento, 'created_at'),
+    'formulario_rpc': (FormularioRPC, 'created_at'),
+    'access_log': (AccessLog, 'fecha'),
+}
+
+# Columnas con datos personales: se seudonimizan o se excluyen, nunca se exportan en claro
+COLUMNAS_PERSONALES = {
+    'formulario_rpc': ('nombre', 'apellidos', 'dni_nie'),
+    'access_log': ('username', 'ip_address', 'ubicacion'),
+}
+
+# Texto libre que puede contener datos personales: se excluye en cualquier tratamiento
+COLUMNAS_TEXTO_LIBRE = {
+    'formulario_rpc': ('observaciones',),
+}
+
+
+def tipo_arrow(columna):
+    """Tipo Arrow equivalente al tipo SQLAlchemy de la columna"""
+    import pyarrow as pa
+
+    tipo = columna.type
+    if isinstance(tipo, Boolean):
+        return pa.bool_()
+    if isinstance(tipo, (Integer, BigInteger)):
+        return pa.int64()
+    if isinstance(tipo, DateTime):
+        return pa.timestamp('us')
+    if isinstance(tipo, Date):
+        return pa.date32()
+    if isinstance(tipo, (Float, Numeric)):
+        return pa.float64()
+    return pa.string()
+
+
+def esquema_arrow(modelo, seudonimizadas=(), excluidas=()):
+    import pyarrow as pa
+
+    return pa.schema([pa.field(c.name, pa.string() if c.name in seudonimizadas else tipo_arrow(c),
+                               nullable=c.nullable)
+                      for c in modelo.__table__.columns if c.name not in excluidas])
+
+
+def seudonimo(valor, clave):
+    """HMAC-SHA256 (32 hex) del valor normalizado; None se mantiene"""
+    if valor is None:
+        return None
+    texto = str(valor).strip().casefold()
+    return hmac.new(clave.encode('utf-8'), texto.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+
+def tratamiento_datos_personales(datos_personales=None, clave=None):
+    """'seudonimizar' si hay clave, si no 'excluir' (o el indicado, validado)"""
+    clave = CLAVE_SEUDONIMOS if clave is None else clave
+    if datos_personales is None:
+        return SEUDONIMIZAR if clave else EXCLUIR
+    if datos_personales not in (SEUDONIMIZAR, EXCLUIR):
+        raise ValueError(f"Tratamiento de datos personales no válido: {datos_personales}")
+    if datos_personales == SEUDONIMIZAR and not clave:
+        raise ValueError("Seudonimizar requiere PARQUET_SEUDONIMO_CLAVE")
+    return datos_personales
+
+
+def _huecos(anterior, ids, ventana=VENTANA_IDS):
+    """Ids que faltan entre ``anterior`` y el último de ``ids`` (ordenados), dentro de la ventana"""
+    if not ids:
+        return []
+    minimo = max(anterior, ids[-1] - ventana)
+    presentes = set(ids)
+    return [i for i in range(minimo + 1, ids[-1]) if i not in presentes]
+
+
+class MarcasAgua:
+    """Último id exportado, huecos vigilados y tratamiento de datos personales por tabla"""
+
+    def __init__(self, directorio):
+        self.ruta = os.path.join(directorio, '_marcas.json')
+        try:
+            with open(self.ruta, encoding='utf-8') as f:
+                self.marcas = json.load(f)
+        except (OSError, ValueError):
+            self.marcas = {}
+
+    def obtener(self, tabla):
+        marca = self.marcas.get(tabla, 0)
+        if isinstance(marca, int):  # formato anterior: solo el último id
+            marca = {'ultimo_id': marca, 'huecos': []}
+        return marca
+
+    def guardar(self, tabla, ultimo_id, huecos=(), datos_personales=None, protegidas=()):
+        self.marcas[tabla] = {'ultimo_id': ultimo_id, 'huecos': sorted(huecos),
+                              'datos_personales': datos_personales, 'protegidas': sorted(protegidas)}
+        temporal = f"{self.ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(self.marcas, f, indent=2, sort_keys=True)
+        os.replace(temporal, self.ruta)
+
+
+def _particion(valor):
+    return f"{valor.year:04d}-{valor.month:02d}" if valor else SIN_FECHA
+
+
+def _escribir_bloque(directorio_tabla, filas, nombres, esquema, compresion, prefijo='part'):
+    """Agrupa un bloque por mes y escribe un fichero por partición; devuelve los ficheros"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    por_mes = {}
+    for mes, id_fila, fila in filas:
+        por_mes.setdefault(mes, []).append((id_fila, fila))
+
+    ficheros = []
+    for mes, filas_mes in por_mes.items():
+        columnas = {nombre: [fila[i] for _, fila in filas_mes] for i, nombre in enumerate(nombres)}
+        tabla = pa.Table.from_pydict(columnas, schema=esquema)
+        carpeta = os.path.join(directorio_tabla, f"mes={mes}")
+        os.makedirs(carpeta, exist_ok=True)
+        ruta = os.path.join(carpeta, f"{prefijo}-{filas_mes[0][0]:010d}-{filas_mes[-1][0]:010d}.parquet")
+        temporal = f"{ruta}.tmp"
+        pq.write_table(tabla, temporal, compression=compresion)
+        os.replace(temporal, ruta)
+        ficheros.append(ruta)
+    return ficheros
+
+
+def exportar_tabla(nombre, directorio=None, tamano_bloque=TAMANO_BLOQUE, completo=False, compresion='zstd',
+                   datos_personales=None, clave_seudonimos=None, ventana=VENTANA_IDS):
+    """
+    Exporta las filas nuevas de una tabla (y las confirmadas tarde por debajo
+    de la marca). Retorna {'tabla', 'filas', 'tardias', 'ficheros', 'desde_id',
+    'hasta_id', 'datos_personales'}.
+    """
+    if nombre not in TABLAS:
+        raise ValueError(f"Tabla no exportable: {nombre}. Opciones: {', '.join(TABLAS)}")
+    modelo, columna_mes = TABLAS[nombre]
+    directorio = directorio or DIRECTORIO
+    directorio_tabla = os.path.join(directorio, nombre)
+    os.makedirs(directorio, exist_ok=True)
+
+    clave_seudonimos = CLAVE_SEUDONIMOS if clave_seudonimos is None else clave_seudonimos
+    personales = COLUMNAS_PERSONALES.get(nombre, ())
+    texto_libre = COLUMNAS_TEXTO_LIBRE.get(nombre, ())
+    protegidas = personales + texto_libre
+    tratamiento = tratamiento_datos_personales(datos_personales, clave_seudonimos) if personales else None
+
+    marcas = MarcasAgua(directorio)
+    if completo:
+        shutil.rmtree(directorio_tabla, ignore_errors=True)
+        marcas.guardar(nombre, 0, datos_personales=tratamiento, protegidas=protegidas)
+    marca = marcas.obtener(nombre)
+    if marca['ultimo_id'] and marca.get('datos_personales') != tratamiento:
+        anterior = marca.get('datos_personales') or 'en claro'
+        raise ValueError(f"{nombre} se exportó con datos personales '{anterior}'; "
+                         f"para pasar a '{tratamiento}' hace falta una exportación completa (--completo)")
+    if marca['ultimo_id'] and marca.get('protegidas', []) != sorted(protegidas):
+        raise ValueError(f"{nombre} se exportó protegiendo otras columnas "
+                         f"({', '.join(marca.get('protegidas', [])) or 'ninguna'}); "
+                         f"para proteger {', '.join(protegidas)} hace falta una exportación completa (--completo)")
+
+    seudonimizadas = personales if tratamiento == SEUDONIMIZAR else ()
+    excluidas = (personales if tratamiento == EXCLUIR else ()) + texto_libre
+    esquema = esquema_arrow(modelo, seudonimizadas, excluidas)
+    columnas = [c for c in modelo.__table__.columns if c.name not in excluidas]
+    nombres = [c.name for c in columnas]
+    clave = modelo.__table__.c.id
+    indice_mes = nombres.index(columna_mes)
+    indice_id = nombres.index('id')
+    indices_seudonimo = [nombres.index(c) for c in seudonimizadas]
+
+    def preparar(fila):
+        fila = list(fila)
+        for i in indices_seudonimo:
+            fila[i] = seudonimo(fila[i], clave_seudonimos)
+        return _particion(fila[indice_mes]), fila[indice_id], tuple(fila)
+
+    desde = ultimo = marca['ultimo_id']
+    huecos = set(marca['huecos'])
+    filas_exportadas, tardias, ficheros = 0, 0, []
+
+    # Filas confirmadas tarde con id por debajo de la marca
+    pendientes = sorted(huecos)
+    for i in range(0, len(pendientes), tamano_bloque):
+        sentencia = select(*columnas).where(clave.in_(pendientes[i:i + tamano_bloque])).order_by(clave)
+        filas = db.session.execute(sentencia).all()
+        if not filas:
+            continue
+        ficheros += _escribir_bloque(directorio_tabla, [preparar(fila) for fila in filas], nombres, esquema,
+                                     compresion, prefijo='tardias')
+        huecos -= {fila[indice_id] for fila in filas}
+        marcas.guardar(nombre, ultimo, huecos, tratamiento, protegidas)
+        tardias += len(filas)
+
+    while True:
+        sentencia = select(*columnas).where(clave > ultimo).order_by(clave).limit(tamano_bloque)
+        filas = db.session.execute(sentencia).all()
+        if not filas:
+            break
+        ficheros += _escribir_bloque(directorio_tabla, [preparar(fila) for fila in filas], nombres, esquema,
+                                     compresion)
+        ids = [fila[indice_id] for fila in filas]
+        huecos.update(_huecos(ultimo, ids, ventana))
+        ultimo = ids[-1]
+        huecos = {i for i in huecos if i > ultimo - ventana}
+        marcas.guardar(nombre, ultimo, huecos, tratamiento, protegidas)
+        filas_exportadas += len(filas)
+
+    return {'tabla': nombre, 'filas': filas_exportadas, 'tardias': tardias, 'ficheros': len(ficheros),
+            'desde_id': desde, 'hasta_id': ultimo, 'datos_personales': tratamiento}
+
+
+def exportar(tablas=None, directorio=None, tamano_bloque=TAMANO_BLOQUE, completo=False, datos_personales=None):
+    """Exporta varias tablas (todas por defecto); devuelve un resultado por tabla"""
+    return [exportar_tabla(nombre, directorio, tamano_bloque, completo, datos_personales=datos_personales)
+            for nombre in (tablas or TABLAS)]
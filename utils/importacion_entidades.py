@@ -0,0 +1,211 @@
+"""
+Importación masiva de bancos / entidades financieras desde XLS(X) o CSV.
+
+En lugar de recorrer el fichero fila a fila con una consulta por fila:
+
+1. las columnas se localizan por alias y se normalizan con operaciones
+   vectorizadas de pandas (strip, vacíos, textos de búsqueda sin acentos);
+2. las claves ya existentes se cargan en un conjunto con una sola consulta;
+3. las filas nuevas se insertan con ``bulk_insert_mappings`` por bloques
+   dentro de una única transacción.
+
+Destinos: 'banco' (modelo legacy Banco, clave = nombre) y 'entidad'
+(EntidadFinanciera, clave = codigo_entidad en las filas que lo traen y nombre
+en las que no).
+"""
+
+from datetime import datetime
+
+import pandas as pd
+
+from models import db, Banco, EntidadFinanciera
+
+TAMANO_BLOQUE = 1000
+
+_ALIAS_COMUNES = {
+    'direccion': ['Dirección', 'DIRECCION', 'DIR', 'CALLE', 'DIRECCION_BANCO'],
+    'numero': ['Número', 'NUM', 'NUMERO', 'Nº', 'NUMERO_BANCO'],
+    'cp': ['CP', 'Código Postal', 'CODIGO_POSTAL', 'POSTAL', 'CP_BANCO'],
+    'localidad': ['Localidad', 'LOCALIDAD', 'CIUDAD', 'POBLACION', 'LOCALIDAD_BANCO'],
+    'provincia': ['Provincia', 'PROVINCIA', 'PROV', 'PROVINCIA_BANCO'],
+    'ccaa': ['CCAA', 'Comunidad Autónoma', 'COMUNIDAD', 'AUTONOMA', 'CCAA_BANCO'],
+}
+
+DESTINOS = {
+    'banco': {
+        'modelo': Banco,
+        # campo del modelo -> alias de columna en el fichero
+        'columnas': {
+            'nombre': ['Nombre', 'BANCO', 'ENTIDAD', 'NOMBRE_BANCO', 'BANCO_NOMBRE'],
+            'direccion': _ALIAS_COMUNES['direccion'],
+            'num': _ALIAS_COMUNES['numero'],
+            'cp': _ALIAS_COMUNES['cp'],
+            'localidad': _ALIAS_COMUNES['localidad'],
+            'provincia': _ALIAS_COMUNES['provincia'],
+            'ccaa': _ALIAS_COMUNES['ccaa'],
+        },
+    },
+    'entidad': {
+        'modelo': EntidadFinanciera,
+        'columnas': {
+            'nombre': ['Nombre', 'NOMBRE', 'BANCO', 'ENTIDAD', 'NOMBRE_BANCO', 'DENOMINACION', 'Denominación'],
+            'nombre_comercial': ['NOMBRE_COMERCIAL', 'Nombre comercial'],
+            'tipo_entidad': ['TIPO_ENTIDAD', 'Tipo', 'TIPO', 'Tipo de entidad'],
+            'codigo_entidad': ['CODIGO_ENTIDAD', 'Código', 'CODIGO', 'COD_BDE', 'Código BdE'],
+            'direccion': _ALIAS_COMUNES['direccion'],
+            'numero': _ALIAS_COMUNES['numero'],
+            'codigo_postal': _ALIAS_COMUNES['cp'],
+            'localidad': _ALIAS_COMUNES['localidad'],
+            'provincia': _ALIAS_COMUNES['provincia'],
+            'comunidad_autonoma': _ALIAS_COMUNES['ccaa'],
+            'telefono': ['TELEFONO', 'Teléfono'],
+            'web': ['WEB', 'Web', 'URL'],
+            'email_doc9': ['EMAIL_DOC9'],
+            'email_rgpd': ['EMAIL_RGPD', 'EMAIL_DPO'],
+            'email_general': ['EMAIL_GENERAL', 'EMAIL', 'Email'],
+            'cif_nif': ['CIF', 'NIF', 'CIF_NIF'],
+        },
+        'por_defecto': {'tipo_entidad': 'Banco', 'estado': 'Activo', 'pais': 'España'},
+    },
+}
+
+
+def leer_fichero(ruta):
+    if ruta.lower().endswith('.csv'):
+        return pd.read_csv(ruta, dtype=str, keep_default_na=False, encoding='utf-8', sep=None, engine='python')
+    return pd.read_excel(ruta, dtype=str)
+
+
+def mapear_columnas(df, columnas):
+    """campo del modelo -> columna del DataFrame, según los alias"""
+    disponibles = {str(c).strip(): c for c in df.columns}
+    encontradas = {}
+    for campo, alias in columnas.items():
+        for nombre in [campo.upper(), campo] + alias:
+            if nombre in disponibles:
+                encontradas[campo] = disponibles[nombre]
+                break
+    return encontradas
+
+
+def _texto(serie):
+    """Columna como texto recortado, con NaN/'nan' convertidos en ''"""
+    serie = serie.astype('string').fillna('').str.strip()
+    return serie.mask(serie.str.lower().isin(['nan', 'none', 'null']), '')
+
+
+def texto_busqueda(serie):
+    """Versión vectorizada de limpiar_texto: sin acentos, minúsculas y sin signos"""
+    return (serie.str.normalize('NFD')
+                 .str.encode('ascii', errors='ignore').str.decode('ascii')
+                 .str.lower()
+                 .str.replace(r'[^\w\s]', ' ', regex=True)
+                 .str.replace(r'\s+', ' ', regex=True)
+                 .str.strip())
+
+
+def normalizar(df, destino):
+    """DataFrame con las columnas del modelo, ya limpias"""
+    config = DESTINOS[destino]
+    mapa = mapear_columnas(df, config['columnas'])
+    if 'nombre' not in mapa:
+        raise ValueError(f"No se encontró columna de nombre. Columnas disponibles: {list(df.columns)}")
+
+    datos = pd.DataFrame({campo: _texto(df[columna]) for campo, columna in mapa.items()})
+    for campo, valor in config.get('por_defecto', {}).items():
+        if campo in datos:
+            datos[campo] = datos[campo].mask(datos[campo] == '', valor)
+        else:
+            datos[campo] = valor
+
+    if destino == 'entidad':
+        datos['nombre_busqueda'] = texto_busqueda(datos['nombre'])
+        if 'localidad' in datos:
+            datos['localidad_busqueda'] = texto_busqueda(datos['localidad'])
+        if 'provincia' in datos:
+            datos['provincia_busqueda'] = texto_busqueda(datos['provincia'])
+    return datos
+
+
+def _columna_clave(destino, datos):
+    if destino == 'entidad' and 'codigo_entidad' in datos and (datos['codigo_entidad'] != '').any():
+        return 'codigo_entidad'
+    return 'nombre'
+
+
+def _con_codigo(destino, datos):
+    """Filas que se identifican por codigo_entidad; el resto se identifica por nombre"""
+    if _columna_clave(destino, datos) == 'codigo_entidad':
+        return datos['codigo_entidad'] != ''
+    return pd.Series(False, index=datos.index)
+
+
+def claves_existentes(modelo, campo):
+    """Conjunto (en minúsculas) de los valores de ``campo`` ya guardados: una sola consulta"""
+    columna = getattr(modelo, campo)
+    return {str(v).strip().casefold() for (v,) in db.session.query(columna).filter(columna.isnot(None)).all()}
+
+
+def importar_dataframe(df, destino='banco', tamano_bloque=TAMANO_BLOQUE):
+    """
+    Inserta las filas nuevas de ``df`` en el modelo de ``destino``.
+
+    Retorna {'leidas', 'insertadas', 'existentes', 'duplicadas', 'sin_clave', 'clave',
+    'por_nombre'}; 'por_nombre' cuenta las filas sin código cotejadas por nombre
+    cuando la clave es codigo_entidad.
+    """
+    config = DESTINOS[destino]
+    modelo = config['modelo']
+    datos = normalizar(df, destino)
+    clave = _columna_clave(destino, datos)
+    leidas = len(datos)
+
+    # Clave por fila: el código si la fila lo trae, si no el nombre
+    con_codigo = _con_codigo(destino, datos)
+    nombres = datos['nombre'].str.casefold()
+    codigos = datos['codigo_entidad'].str.casefold() if clave == 'codigo_entidad' else nombres
+    claves = ('c:' + codigos).where(con_codigo, 'n:' + nombres)
+    sin_clave = nombres == ''
+    # Una fila sin código tampoco entra si su nombre ya viene en una fila con código
+    duplicadas = (claves.duplicated() | (~con_codigo & nombres.isin(set(nombres[con_codigo])))) & ~sin_clave
+
+    existentes = pd.Series(False, index=datos.index)
+    if con_codigo.any():
+        existentes |= con_codigo & codigos.isin(claves_existentes(modelo, 'codigo_entidad'))
+    if (~con_codigo).any():
+        existentes |= ~con_codigo & nombres.isin(claves_existentes(modelo, 'nombre'))
+    existentes &= ~sin_clave & ~duplicadas
+    nuevas = datos[~(sin_clave | duplicadas | existentes)]
+
+    # '' -> None para no guardar cadenas vacías; todas las filas con las mismas claves (executemany)
+    ahora = datetime.utcnow()
+    sellos = {'created_at': ahora, 'updated_at': ahora}
+    if destino == 'entidad':
+        sellos['fecha_ultima_actualizacion'] = ahora
+    registros = [{**{k: (v or None) for k, v in fila.items()}, **sellos} for fila in nuevas.to_dict('records')]
+
+    try:
+        for i in range(0, len(registros), tamano_bloque):
+            db.session.bulk_insert_mappings(modelo, registros[i:i + tamano_bloque])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if registros and modelo is EntidadFinanciera:
+        from utils.catalogo_entidades import catalogo_entidades
+        catalogo_entidades.invalidar()
+
+    return {
+        'leidas': leidas,
+        'insertadas': len(registros),
+        'existentes': int(existentes.sum()),
+        'duplicadas': int(duplicadas.sum()),
+        'sin_clave': int(sin_clave.sum()),
+        'clave': clave,
+        'por_nombre': int((~con_codigo).sum()) if clave == 'codigo_entidad' else 0,
+    }
+
+
+def importar_fichero(ruta, destino='banco', tamano_bloque=TAMANO_BLOQUE):
+    return importar_dataframe(leer_fichero(ruta), destino=destino, tamano_bloque=tamano_bloque)
@@ -0,0 +1,357 @@
+"""
+Alta masiva de lectores desde CSV/XLSX.
+
+Valida todos los DNI/NIE, detecta colisiones de usuario y DNI con consultas
+por conjuntos (IN por bloques), inserta User + DatosLector en una única
+transacción y deja los emails de bienvenida en la cola de envío.
+
+Las cuentas se crean sin contraseña utilizable: la temporal la genera (y
+hashea) el worker de la cola al entregar el email de bienvenida, así que el
+alta no calcula miles de hashes ni la cola guarda contraseñas. Por eso, con
+bienvenida, el email es obligatorio; sin bienvenida las cuentas se crean
+igualmente pero no cuentan como creadas: se devuelven en ``sin_acceso`` para
+que un administrador les asigne contraseña (editar usuario).
+
+La ruta web solo guarda el fichero en ``pendientes/`` y lo procesa un hilo en
+segundo plano (``procesar_pendientes``); ``flask importar-lectores`` procesa
+también lo que quede pendiente o atascado.
+"""
+
+import csv
+import io
+import json
+import os
+import shutil
+import threading
+import unicodedata
+import uuid
+from datetime import datetime, timedelta
+
+from models import db, User, DatosLector, EmailOutbox
+
+BLOQUE_IN = 500
+DIAS_EXPIRACION = 10
+FORMULARIOS_POR_DEFECTO = ["generico"]
+FORMULARIOS_VALIDOS = {"generico", "rpc", "doc9"}
+ASUNTO_BIENVENIDA = "Bienvenido - Credenciales de acceso"
+
+# Hash que check_password_hash nunca acepta: la cuenta no tiene contraseña hasta la bienvenida
+PASSWORD_SIN_DEFINIR = '!sin-definir'
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORIO = os.environ.get('IMPORTACION_LECTORES_DIR', os.path.join(BASE_DIR, 'instance', 'importaciones_lectores'))
+
+# Cabeceras aceptadas (normalizadas sin acentos ni mayúsculas) para cada campo
+COLUMNAS = {
+    'username': ['username', 'usuario', 'user'],
+    'dni_nie': ['dni_nie', 'dni', 'nie', 'dni/nie'],
+    'nombre': ['nombre'],
+    'apellidos': ['apellidos'],
+    'email': ['email', 'correo', 'e-mail'],
+    'telefono': ['telefono', 'movil'],
+    'direccion': ['direccion', 'domicilio'],
+    'fecha_expiracion': ['fecha_expiracion', 'expiracion'],
+    'formularios_permitidos': ['formularios_permitidos', 'formularios'],
+    'datos_adicionales': ['datos_adicionales'],
+}
+
+
+def _normalizar_cabecera(texto):
+    texto = unicodedata.normalize('NFD', str(texto or ''))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return texto.strip().lower().replace(' ', '_')
+
+
+def _mapear_cabeceras(cabeceras):
+    normalizadas = {_normalizar_cabecera(c): i for i, c in enumerate(cabeceras)}
+    mapa = {}
+    for campo, alias in COLUMNAS.items():
+        for nombre in alias:
+            if nombre in normalizadas:
+                mapa[campo] = normalizadas[nombre]
+                break
+    return mapa
+
+
+def leer_filas(fichero, nombre_fichero):
+    """Devuelve las filas como diccionarios con las claves de COLUMNAS"""
+    if nombre_fichero.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+        wb = load_workbook(fichero, read_only=True, data_only=True)
+        filas = wb.active.iter_rows(values_only=True)
+    else:
+        contenido = fichero.read()
+        if isinstance(contenido, bytes):
+            contenido = contenido.decode('utf-8-sig')
+        muestra = contenido[:4096]
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        filas = csv.reader(io.StringIO(contenido), dialecto)
+
+    filas = iter(filas)
+    try:
+        cabeceras = next(filas)
+    except StopIteration:
+        return []
+    mapa = _mapear_cabeceras(cabeceras)
+
+    resultado = []
+    for valores in filas:
+        if not valores or all(v in (None, '') for v in valores):
+            continue
+        fila = {}
+        for campo, indice in mapa.items():
+            valor = valores[indice] if indice < len(valores) else None
+            fila[campo] = valor if isinstance(valor, datetime) else ('' if valor is None else str(valor).strip())
+        resultado.append(fila)
+    return resultado
+
+
+def _existentes(columna, valores):
+    """Subconjunto de ``valores`` que ya existe en ``columna`` (consultas IN por bloques)"""
+    valores = list(valores)
+    encontrados = set()
+    for i in range(0, len(valores), BLOQUE_IN):
+        bloque = valores[i:i + BLOQUE_IN]
+        encontrados.update(v for (v,) in db.session.query(columna).filter(columna.in_(bloque)).all())
+    return encontrados
+
+
+def _fecha_expiracion(valor, por_defecto):
+    if isinstance(valor, datetime):
+        return valor
+    for fmt in ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(valor, fmt)
+        except (TypeError, ValueError):
+            continue
+    return por_defecto
+
+
+def _formularios(valor):
+    """
+    JSON normalizado de formularios permitidos a partir de 'rpc, doc9' o
+    '["rpc", "doc9"]'. Lanza ValueError si el valor no es válido.
+    """
+    if not valor:
+        return json.dumps(FORMULARIOS_POR_DEFECTO)
+    if valor.startswith('['):
+        try:
+            lista = json.loads(valor)
+        except ValueError:
+            raise ValueError('formularios_permitidos no es una lista JSON válida')
+        if not isinstance(lista, list) or not all(isinstance(f, str) for f in lista):
+            raise ValueError('formularios_permitidos debe ser una lista de nombres')
+    else:
+        lista = valor.replace(';', ',').split(',')
+    formularios = list(dict.fromkeys(f.strip().lower() for f in lista if f.strip()))
+    desconocidos = [f for f in formularios if f not in FORMULARIOS_VALIDOS]
+    if desconocidos:
+        raise ValueError(f"Formularios desconocidos: {', '.join(desconocidos)}")
+    return json.dumps(formularios or FORMULARIOS_POR_DEFECTO)
+
+
+def importar_lectores(filas, enviar_bienvenida=True):
+    """
+    Da de alta los lectores de ``filas`` en una sola transacción.
+
+    Retorna {'creados', 'datos_creados', 'emails_encolados', 'omitidos': [(fila, motivo)],
+    'sin_acceso': [(fila, username)]}. 'creados' solo cuenta las cuentas que
+    recibirán contraseña por email; las de 'sin_acceso' existen pero no pueden
+    iniciar sesión hasta que un administrador les asigne una.
+    """
+    from utils.dni_validator import validar_dni_nie, limpiar_dni_nie
+    from utils.email_outbox import datos_mensaje, worker_outbox
+
+    omitidos = []
+    candidatos = []
+    vistos_dni, vistos_username = set(), set()
+
+    # 1. Validación en memoria (DNI/NIE, obligatorios y duplicados dentro del fichero)
+    for numero, fila in enumerate(filas, start=2):
+        dni = limpiar_dni_nie(fila.get('dni_nie', ''))
+        if not dni or not fila.get('nombre') or not fila.get('apellidos'):
+            omitidos.append((numero, 'Faltan DNI/NIE, nombre o apellidos'))
+            continue
+        if enviar_bienvenida and not fila.get('email'):
+            omitidos.append((numero, 'Falta el email: la contraseña se envía en el email de bienvenida'))
+            continue
+        valido, mensaje = validar_dni_nie(dni)
+        if not valido:
+            omitidos.append((numero, f'DNI/NIE inválido: {mensaje}'))
+            continue
+        try:
+            formularios = _formularios(fila.get('formularios_permitidos'))
+        except ValueError as e:
+            omitidos.append((numero, str(e)))
+            continue
+        username = fila.get('username') or dni.lower()
+        if dni in vistos_dni or username in vistos_username:
+            omitidos.append((numero, 'Duplicado dentro del fichero'))
+            continue
+        vistos_dni.add(dni)
+        vistos_username.add(username)
+        candidatos.append((numero, {**fila, 'dni_nie': dni, 'username': username,
+                                    'formularios_permitidos': formularios}))
+
+    # 2. Colisiones con la base de datos: tres consultas por conjuntos
+    usernames_existentes = _existentes(User.username, vistos_username)
+    dnis_usuario_existentes = _existentes(User.dni_nie, vistos_dni)
+    dnis_datos_existentes = _existentes(DatosLector.dni_nie, vistos_dni)
+
+    aceptados = []
+    for numero, fila in candidatos:
+        if fila['username'] in usernames_existentes:
+            omitidos.append((numero, 'El nombre de usuario ya existe'))
+        elif fila['dni_nie'] in dnis_usuario_existentes:
+            omitidos.append((numero, 'El DNI/NIE ya está registrado'))
+        else:
+            aceptados.append((numero, fila))
+
+    if not aceptados:
+        return {'creados': 0, 'datos_creados': 0, 'emails_encolados': 0, 'omitidos': omitidos, 'sin_acceso': []}
+
+    # 3. Filas a insertar (sin contraseña: la genera la cola al enviar la bienvenida)
+    ahora = datetime.utcnow()
+    expiracion_defecto = ahora + timedelta(days=DIAS_EXPIRACION)
+    usuarios, datos_lectores, mensajes, sin_acceso = [], [], [], []
+    for numero, fila in aceptados:
+        usuarios.append({
+            'username': fila['username'],
+            'password_hash': PASSWORD_SIN_DEFINIR,
+            'role': 'lector',
+            'is_enabled': True,
+            'created_at': ahora,
+            'nombre': fila['nombre'],
+            'apellidos': fila['apellidos'],
+            'email': fila.get('email') or None,
+            'telefono': fila.get('telefono') or None,
+            'dni_nie': fila['dni_nie'],
+            'fecha_expiracion': _fecha_expiracion(fila.get('fecha_expiracion'), expiracion_defecto),
+            'formularios_permitidos': fila['formularios_permitidos'],
+        })
+        if fila['dni_nie'] not in dnis_datos_existentes:
+            datos_lectores.append({
+                'dni_nie': fila['dni_nie'],
+                'nombre': fila['nombre'],
+                'apellidos': fila['apellidos'],
+                'email': fila.get('email') or None,
+                'telefono': fila.get('telefono') or None,
+                'direccion': fila.get('direccion') or None,
+                'datos_adicionales': fila.get('datos_adicionales') or None,
+                'created_at': ahora,
+                'updated_at': ahora,
+            })
+        if enviar_bienvenida:
+            mensajes.append(datos_mensaje('bienvenida', fila['email'], fila['email'], fila['username'],
+                                          ASUNTO_BIENVENIDA, asunto=ASUNTO_BIENVENIDA))
+        else:
+            sin_acceso.append((numero, fila['username']))
+
+    # 4. Inserción en una única transacción
+    try:
+        db.session.bulk_insert_mappings(User, usuarios)
+        if datos_lectores:
+            db.session.bulk_insert_mappings(DatosLector, datos_lectores)
+        if mensajes:
+            db.session.bulk_insert_mappings(EmailOutbox, mensajes)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if mensajes:
+        worker_outbox.despertar()
+
+    return {
+        'creados': len(usuarios) - len(sin_acceso),
+        'datos_creados': len(datos_lectores),
+        'emails_encolados': len(mensajes),
+        'omitidos': omitidos,
+        'sin_acceso': sin_acceso,
+    }
+
+
+# ----- Importaciones diferidas (la ruta web solo recibe el fichero) -----
+
+def _carpeta(estado, directorio=None):
+    carpeta = os.path.join(directorio or DIRECTORIO, estado)
+    os.makedirs(carpeta, exist_ok=True)
+    return carpeta
+
+
+def guardar_pendiente(fichero, nombre_fichero, enviar_bienvenida=True, directorio=None):
+    """Guarda el fichero subido en ``pendientes/`` y devuelve su nombre"""
+    from werkzeug.utils import secure_filename
+
+    bienvenida = 'con-bienvenida' if enviar_bienvenida else 'sin-bienvenida'
+    nombre = (f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_{bienvenida}_"
+              f"{secure_filename(nombre_fichero) or 'lectores.csv'}")
+    temporal = os.path.join(_carpeta('pendientes', directorio), f".{nombre}.tmp")
+    with open(temporal, 'wb') as destino:
+        shutil.copyfileobj(fichero, destino)
+    os.replace(temporal, os.path.join(_carpeta('pendientes', directorio), nombre))
+    return nombre
+
+
+def _guardar_resultado(ruta, resultado):
+    with open(f"{ruta}.resultado.json", 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2, default=str)
+
+
+def procesar_pendientes(directorio=None, recuperar=False):
+    """
+    Importa los ficheros de ``pendientes/``. Cada fichero se reclama moviéndolo
+    a ``procesando/`` (un rename atómico: dos procesos no importan el mismo) y
+    acaba en ``procesados/`` o ``fallidos/`` con un ``.resultado.json``.
+    ``recuperar`` devuelve antes a pendientes lo que quedó en ``procesando/``
+    (p. ej. un worker reciclado a mitad). Retorna [(nombre, resumen | error)].
+    """
+    pendientes = _carpeta('pendientes', directorio)
+    procesando = _carpeta('procesando', directorio)
+    if recuperar:
+        for nombre in os.listdir(procesando):
+            os.replace(os.path.join(procesando, nombre), os.path.join(pendientes, nombre))
+
+    resultados = []
+    for nombre in sorted(os.listdir(pendientes)):
+        if nombre.startswith('.'):
+            continue
+        ruta = os.path.join(procesando, nombre)
+        try:
+            os.replace(os.path.join(pendientes, nombre), ruta)
+        except FileNotFoundError:
+            continue  # lo ha reclamado otro proceso
+        try:
+            with open(ruta, 'rb') as f:
+                filas = leer_filas(f, nombre)
+            resumen = importar_lectores(filas, enviar_bienvenida='_con-bienvenida_' in nombre)
+            destino = os.path.join(_carpeta('procesados', directorio), nombre)
+            resultados.append((nombre, resumen))
+        except Exception as e:
+            db.session.rollback()
+            resumen = {'error': f"{type(e).__name__}: {e}"}
+            destino = os.path.join(_carpeta('fallidos', directorio), nombre)
+            resultados.append((nombre, resumen['error']))
+        os.replace(ruta, destino)
+        _guardar_resultado(destino, resumen)
+    return resultados
+
+
+def procesar_en_segundo_plano(app, directorio=None):
+    """Lanza un hilo que procesa los pendientes fuera de la petición"""
+    def _procesar():
+        with app.app_context():
+            try:
+                for nombre, resultado in procesar_pendientes(directorio):
+                    app.logger.info(f"Importación de lectores {nombre}: {resultado}")
+            except Exception as e:
+                app.logger.error(f"Error importando lectores: {e}")
+            finally:
+                db.session.remove()
+
+    hilo = threading.Thread(target=_procesar, name='importacion-lectores', daemon=True)
+    hilo.start()
+    return hilo
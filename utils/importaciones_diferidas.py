@@ -0,0 +1,131 @@
+"""
+Importaciones diferidas de las pilas pesadas y opcionales.
+
+app.py no importa en el arranque librerías que solo usan algunas rutas
+(pandas, openpyxl, requests, consultas externas...). Se registran aquí y:
+
+- ``diferir(nombre)`` devuelve un sustituto que importa el módulo la primera
+  vez que se usa uno de sus atributos;
+- ``registro_importaciones.precalentar()`` las importa de antemano; gunicorn
+  lo llama en el proceso maestro (``when_ready`` en gunicorn.conf.py) para
+  que todos los workers, también los que se reciclan por ``max_requests``,
+  las hereden ya cargadas tras el fork;
+- ``perfil_importacion()`` mide con ``python -X importtime`` cuánto cuesta
+  importar un módulo y qué dependencias dominan.
+"""
+
+import importlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# Módulo -> motivo por el que es pesado / quién lo usa
+MODULOS_PESADOS = {
+    'pandas': 'scripts de importación (entidades, códigos postales, direcciones)',
+    'openpyxl': 'lectura de XLSX (alta masiva de lectores)',
+    'xlsxwriter': 'exportaciones XLSX',
+    'requests': 'geolocalización de IP en el registro de accesos',
+    'utils.external_queries': 'consultas RPC / BOE / Tablón Edictal',
+    'PyPDF2': 'combinación de PDF (exportación por lotes y cartas RGPD)',
+    'docxtpl': 'documentos del registro concursal',
+}
+
+
+class RegistroImportaciones:
+    """Registro de módulos diferidos con el tiempo que costó importar cada uno"""
+
+    def __init__(self, modulos=None):
+        self.modulos = dict(modulos or {})
+        self.tiempos = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nombre, motivo=''):
+        self.modulos[nombre] = motivo
+
+    def cargar(self, nombre):
+        modulo = sys.modules.get(nombre)
+        if modulo is not None:
+            return modulo
+        with self._lock:
+            inicio = time.perf_counter()
+            modulo = importlib.import_module(nombre)
+            self.tiempos.setdefault(nombre, (time.perf_counter() - inicio) * 1000)
+        return modulo
+
+    def precalentar(self, nombres=None):
+        """Importa ``nombres`` (por defecto todos los registrados); devuelve ms por módulo"""
+        resultado = {}
+        for nombre in (list(self.modulos) if nombres is None else nombres):
+            try:
+                inicio = time.perf_counter()
+                self.cargar(nombre)
+                resultado[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+            except ImportError as e:
+                resultado[nombre] = f'no disponible: {e}'
+        return resultado
+
+
+registro_importaciones = RegistroImportaciones(MODULOS_PESADOS)
+
+
+class _ModuloDiferido:
+    """Sustituto de un módulo que lo importa en el primer acceso a un atributo"""
+
+    def __init__(self, nombre):
+        self.__dict__['_nombre'] = nombre
+
+    def __getattr__(self, atributo):
+        modulo = registro_importaciones.cargar(self._nombre)
+        return getattr(modulo, atributo)
+
+    def __repr__(self):
+        cargado = 'cargado' if self._nombre in sys.modules else 'pendiente'
+        return f'<módulo diferido {self._nombre} ({cargado})>'
+
+
+def diferir(nombre):
+    """Referencia perezosa a ``nombre``; se registra para el precalentado"""
+    if nombre not in registro_importaciones.modulos:
+        registro_importaciones.registrar(nombre)
+    return _ModuloDiferido(nombre)
+
+
+def modulos_a_precalentar():
+    """Lista de PRELOAD_MODULES (separada por comas) o todos los registrados"""
+    valor = os.environ.get('PRELOAD_MODULES', '').strip()
+    if not valor:
+        return list(registro_importaciones.modulos)
+    if valor.lower() in ('none', 'ninguno', 'false'):
+        return []
+    return [m.strip() for m in valor.split(',') if m.strip()]
+
+
+_LINEA_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def perfil_importacion(objetivo='app', top=25, python=None, cwd=None):
+    """
+    Ejecuta ``python -X importtime -c "import <objetivo>"`` en un proceso nuevo.
+
+    Devuelve (total_ms, filas) con filas = [(modulo, propio_ms, acumulado_ms, nivel)]
+    ordenadas por tiempo acumulado.
+    """
+    proceso = subprocess.run(
+        [python or sys.executable, '-X', 'importtime', '-c', f'import {objetivo}'],
+        capture_output=True, text=True, cwd=cwd, timeout=300,
+    )
+    filas = []
+    for linea in proceso.stderr.splitlines():
+        m = _LINEA_IMPORTTIME.match(linea)
+        if m:
+            propio, acumulado, sangria, modulo = m.groups()
+            filas.append((modulo, int(propio) / 1000, int(acumulado) / 1000, (len(sangria) - 1) // 2))
+    if proceso.returncode != 0 and not filas:
+        raise RuntimeError(proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else 'error al importar')
+
+    total = next((f[2] for f in reversed(filas) if f[0] == objetivo), sum(f[1] for f in filas))
+    filas.sort(key=lambda f: f[2], reverse=True)
+    return total, filas[:top]
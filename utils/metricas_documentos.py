@@ -0,0 +1,317 @@
+"""
+Instrumentación de los generadores de documentos y del envío de emails.
+
+Cada llamada a un punto de entrada de PDFGenerator, DocxGenerator o
+EmailSender registra duración, bytes producidos, número de páginas,
+plantilla y motivo de fallo en un registro de histogramas en memoria.
+Cada proceso vuelca periódicamente su instantánea a disco para que el
+comando de resumen pueda combinar todos los workers de gunicorn.
+"""
+
+import bisect
+import builtins
+import errno
+import functools
+import json
+import os
+import re
+import smtplib
+import threading
+import time
+from collections import Counter
+
+# Límites superiores de los cubos (ms y bytes); el último cubo es +inf
+CUBOS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+CUBOS_BYTES = [1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216]
+
+DIRECTORIOS_SALIDA = [os.path.join("static", "pdfs"), os.path.join("static", "generated_docs")]
+PREFIJOS_ENTRADA = ("generate_", "send_", "render_", "convert_")
+
+_PATRON_PAGINA = re.compile(rb"/Type\s*/Page(?!s)")
+
+
+class Histograma:
+    """Histograma de cubos fijos, combinable entre procesos"""
+
+    def __init__(self, cubos):
+        self.cubos = list(cubos)
+        self.conteos = [0] * (len(self.cubos) + 1)
+        self.total = 0
+        self.suma = 0.0
+        self.minimo = None
+        self.maximo = None
+
+    def observar(self, valor):
+        self.conteos[bisect.bisect_left(self.cubos, valor)] += 1
+        self.total += 1
+        self.suma += valor
+        self.minimo = valor if self.minimo is None else min(self.minimo, valor)
+        self.maximo = valor if self.maximo is None else max(self.maximo, valor)
+
+    def percentil(self, p):
+        """Estimación del percentil p (0-100) por el límite superior del cubo"""
+        if not self.total:
+            return None
+        objetivo = self.total * p / 100.0
+        acumulado = 0
+        for i, conteo in enumerate(self.conteos):
+            acumulado += conteo
+            if acumulado >= objetivo:
+                return min(self.cubos[i], self.maximo) if i < len(self.cubos) else self.maximo
+        return self.maximo
+
+    def a_dict(self):
+        return {"cubos": self.cubos, "conteos": self.conteos, "total": self.total,
+                "suma": self.suma, "minimo": self.minimo, "maximo": self.maximo}
+
+    def combinar(self, datos):
+        if datos.get("cubos") != self.cubos:
+            return
+        self.conteos = [a + b for a, b in zip(self.conteos, datos["conteos"])]
+        self.total += datos["total"]
+        self.suma += datos["suma"]
+        for campo, fn in (("minimo", min), ("maximo", max)):
+            otro = datos.get(campo)
+            if otro is not None:
+                actual = getattr(self, campo)
+                setattr(self, campo, otro if actual is None else fn(actual, otro))
+
+
+class _Serie:
+    """Métricas agregadas de un (generador, método, plantilla)"""
+
+    def __init__(self):
+        self.duracion_ms = Histograma(CUBOS_MS)
+        self.bytes = Histograma(CUBOS_BYTES)
+        self.paginas = 0
+        self.exitos = 0
+        self.fallos = Counter()
+
+    def a_dict(self):
+        return {"duracion_ms": self.duracion_ms.a_dict(), "bytes": self.bytes.a_dict(),
+                "paginas": self.paginas, "exitos": self.exitos, "fallos": dict(self.fallos)}
+
+    def combinar(self, datos):
+        self.duracion_ms.combinar(datos["duracion_ms"])
+        self.bytes.combinar(datos["bytes"])
+        self.paginas += datos.get("paginas", 0)
+        self.exitos += datos.get("exitos", 0)
+        self.fallos.update(datos.get("fallos", {}))
+
+
+class RegistroMetricas:
+    """Registro en memoria de las métricas de generación de documentos"""
+
+    def __init__(self, directorio=None, intervalo_volcado=30):
+        self.directorio = directorio
+        self.intervalo_volcado = intervalo_volcado
+        self._series = {}
+        self._lock = threading.Lock()
+        self._ultimo_volcado = 0.0
+
+    def registrar(self, generador, metodo, plantilla, duracion_ms, bytes_producidos=None, paginas=None, fallo=None):
+        clave = (generador, metodo, plantilla)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = _Serie()
+            serie.duracion_ms.observar(duracion_ms)
+            if fallo:
+                serie.fallos[fallo] += 1
+            else:
+                serie.exitos += 1
+                if bytes_producidos is not None:
+                    serie.bytes.observar(bytes_producidos)
+                if paginas:
+                    serie.paginas += paginas
+        self._volcar_si_toca()
+
+    def instantanea(self):
+        with self._lock:
+            return [{"generador": g, "metodo": m, "plantilla": p, **s.a_dict()}
+                    for (g, m, p), s in self._series.items()]
+
+    def _volcar_si_toca(self):
+        if not self.directorio or time.monotonic() - self._ultimo_volcado < self.intervalo_volcado:
+            return
+        self._ultimo_volcado = time.monotonic()
+        try:
+            self.volcar()
+        except OSError:
+            pass
+
+    def volcar(self):
+        """Escribe la instantánea de este proceso en ``<directorio>/<pid>.json``"""
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = os.path.join(self.directorio, f"{os.getpid()}.json")
+        tmp = f"{ruta}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.instantanea(), f)
+        os.replace(tmp, ruta)
+
+
+def resumir(series):
+    """Convierte series (propias o combinadas) en filas ordenadas por p95 descendente"""
+    combinadas = {}
+    for s in series:
+        clave = (s["generador"], s["metodo"], s["plantilla"])
+        if clave not in combinadas:
+            combinadas[clave] = _Serie()
+        combinadas[clave].combinar(s)
+
+    filas = []
+    for (generador, metodo, plantilla), serie in combinadas.items():
+        d = serie.duracion_ms
+        filas.append({
+            "generador": generador,
+            "metodo": metodo,
+            "plantilla": plantilla,
+            "llamadas": d.total,
+            "exitos": serie.exitos,
+            "fallos": dict(serie.fallos),
+            "media_ms": round(d.suma / d.total, 2) if d.total else None,
+            "p50_ms": d.percentil(50),
+            "p95_ms": d.percentil(95),
+            "max_ms": round(d.maximo, 2) if d.maximo is not None else None,
+            "media_bytes": int(serie.bytes.suma / serie.bytes.total) if serie.bytes.total else None,
+            "paginas": serie.paginas,
+        })
+    filas.sort(key=lambda f: (f["p95_ms"] or 0, f["media_ms"] or 0), reverse=True)
+    return filas
+
+
+def cargar_directorio(directorio):
+    """Lee las instantáneas volcadas por todos los procesos"""
+    series = []
+    if not os.path.isdir(directorio):
+        return series
+    for nombre in os.listdir(directorio):
+        if not nombre.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directorio, nombre), encoding="utf-8") as f:
+                series.extend(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return series
+
+
+def _tamano_y_paginas(resultado):
+    """
+    Bytes y páginas del documento devuelto por un generador (nombre de
+    fichero, contenido o tupla de ellos). Los textos que no son un fichero de
+    salida (p. ej. el mensaje de ``(True, "Enviado")`` de EmailSender) no
+    cuentan como bytes producidos.
+    """
+    if resultado is None:
+        return None, None
+    if isinstance(resultado, (tuple, list)):
+        total_bytes, total_paginas = None, 0
+        for elemento in resultado:
+            b, p = _tamano_y_paginas(elemento)
+            if b is not None:
+                total_bytes = (total_bytes or 0) + b
+            total_paginas += p or 0
+        return total_bytes, total_paginas or None
+    if isinstance(resultado, bytes):
+        return len(resultado), len(_PATRON_PAGINA.findall(resultado)) or None
+    if isinstance(resultado, str):
+        if resultado.lower().endswith((".pdf", ".docx")):
+            for directorio in DIRECTORIOS_SALIDA:
+                ruta = resultado if os.path.isabs(resultado) else os.path.join(directorio, resultado)
+                if os.path.exists(ruta):
+                    if ruta.lower().endswith(".pdf"):
+                        with open(ruta, "rb") as f:
+                            data = f.read()
+                        return len(data), len(_PATRON_PAGINA.findall(data)) or None
+                    return os.path.getsize(ruta), None
+        return None, None
+    return None, None
+
+
+def _plantilla(metodo, args, kwargs):
+    """Identificador de plantilla: fichero DOCX, modelo/destino del payload o el método"""
+    for valor in list(args) + list(kwargs.values()):
+        if isinstance(valor, str) and valor.lower().endswith(".docx"):
+            return os.path.basename(valor)
+        if isinstance(valor, dict):
+            destinatario = valor.get("destinatario")
+            if isinstance(destinatario, dict) and destinatario.get("clave"):
+                return f"{metodo}:{destinatario['clave']}"
+            if valor.get("modelo_destino"):
+                return f"{metodo}:{valor['modelo_destino']}"
+    return metodo
+
+
+# Errores que pueden aparecer por nombre en el mensaje de fallo de EmailSender
+_ERRORES_CONOCIDOS = {
+    nombre for nombre, valor in list(vars(smtplib).items()) + list(vars(builtins).items())
+    if isinstance(valor, type) and issubclass(valor, OSError)
+}
+_PATRON_CODIGO_SMTP = re.compile(r"(?<!\d)([245]\d\d)(?!\d)")
+_PATRON_NOMBRE_ERROR = re.compile(r"\b([A-Z]\w+)\b")
+_PATRON_ERRNO = re.compile(r"\[Errno (\d+)\]")
+
+
+def clave_fallo(mensaje):
+    """
+    Motivo de fallo acotado a partir del texto de EmailSender: la clase de
+    excepción (smtplib / OSError), el errno o el código SMTP que aparezca en
+    él. Nunca el texto libre, que trae direcciones de destinatarios.
+    """
+    texto = str(mensaje or "")
+    for nombre in _PATRON_NOMBRE_ERROR.findall(texto):
+        if nombre in _ERRORES_CONOCIDOS:
+            return nombre
+    numero = _PATRON_ERRNO.search(texto)
+    if numero:
+        return errno.errorcode.get(int(numero.group(1)), "OSError")
+    codigo = _PATRON_CODIGO_SMTP.search(texto)
+    return f"smtp_{codigo.group(1)}" if codigo else "resultado_false"
+
+
+def _fallo_en_resultado(resultado):
+    """Los métodos de EmailSender señalan fallos devolviendo False o (False, mensaje)"""
+    if resultado is False:
+        return "resultado_false"
+    if isinstance(resultado, tuple) and len(resultado) == 2 and resultado[0] is False:
+        return clave_fallo(resultado[1])
+    return None
+
+
+def envolver(funcion, generador, metodo, registro):
+    """Devuelve ``funcion`` instrumentada contra ``registro``"""
+    @functools.wraps(funcion)
+    def _instrumentada(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(*args, **kwargs)
+        except Exception as e:
+            registro.registrar(generador, metodo, _plantilla(metodo, args, kwargs),
+                               (time.perf_counter() - inicio) * 1000, fallo=type(e).__name__)
+            raise
+        duracion_ms = (time.perf_counter() - inicio) * 1000
+        fallo = _fallo_en_resultado(resultado)
+        bytes_producidos, paginas = (None, None) if fallo else _tamano_y_paginas(resultado)
+        registro.registrar(generador, metodo, _plantilla(metodo, args, kwargs), duracion_ms,
+                           bytes_producidos=bytes_producidos, paginas=paginas, fallo=fallo)
+        return resultado
+
+    _instrumentada.__instrumentada__ = True
+    return _instrumentada
+
+
+def instrumentar(objeto, generador=None, registro=None, metodos=None):
+    """Sustituye en la instancia los puntos de entrada públicos por versiones instrumentadas"""
+    registro = registro or registro_metricas
+    generador = generador or type(objeto).__name__
+    if metodos is None:
+        metodos = [n for n in dir(objeto) if n.startswith(PREFIJOS_ENTRADA)]
+    for nombre in metodos:
+        funcion = getattr(objeto, nombre, None)
+        if callable(funcion) and not getattr(funcion, "__instrumentada__", False):
+            setattr(objeto, nombre, envolver(funcion, generador, nombre, registro))
+    return objeto
+
+
+registro_metricas = RegistroMetricas()
@@ -0,0 +1,125 @@
+"""
+Migración de Procedimiento.juzgado (texto libre) a la dimensión JuzgadoMercantil.
+
+Pasos, todos idempotentes (``flask migrar-juzgados``):
+
+1. ``asegurar_esquema``: crea la tabla ``juzgado_mercantil``, añade la
+   columna ``procedimiento.juzgado_id`` si falta (ALTER TABLE; la app no usa
+   Alembic) y crea el índice compuesto (juzgado_id, fecha_presentacion_demanda,
+   fecha_admision).
+2. ``sincronizar_juzgados``: vuelca el directorio de juzgados_mercantil_2025 en
+   la tabla emparejando por código ('madrid-3'); los ids los asigna la base de
+   datos y no cambian aunque se reordene o amplíe la lista.
+3. ``rellenar_juzgado_id``: empareja cada texto distinto una sola vez
+   (``emparejar_juzgado``: nombre exacto, índice de tokens y similitud para
+   erratas) y actualiza por bloques todas las filas con ese texto.
+"""
+
+from sqlalchemy import inspect, text
+
+from models import db, JuzgadoMercantil, Procedimiento
+
+TAMANO_BLOQUE = 500
+
+
+def asegurar_esquema():
+    """Crea tabla, columna e índice que falten; devuelve la lista de cambios aplicados"""
+    cambios = []
+    motor = db.engine
+    inspector = inspect(motor)
+    if not inspector.has_table(JuzgadoMercantil.__tablename__):
+        JuzgadoMercantil.__table__.create(motor)
+        cambios.append('tabla juzgado_mercantil')
+
+    tabla = Procedimiento.__table__
+    if not inspector.has_table(tabla.name):
+        tabla.create(motor)
+        return cambios + ['tabla procedimiento']
+
+    columnas = {c['name'] for c in inspector.get_columns(tabla.name)}
+    if 'juzgado_id' not in columnas:
+        with motor.begin() as conexion:
+            conexion.execute(text(
+                f"ALTER TABLE {tabla.name} ADD COLUMN juzgado_id INTEGER REFERENCES juzgado_mercantil(id)"
+            ))
+        cambios.append('columna procedimiento.juzgado_id')
+
+    existentes = {i['name'] for i in inspect(motor).get_indexes(tabla.name)}
+    for indice in tabla.indexes:
+        if indice.name not in existentes:
+            indice.create(motor)
+            cambios.append(f'índice {indice.name}')
+    return cambios
+
+
+def sincronizar_juzgados():
+    """Inserta o actualiza las filas de la dimensión a partir del directorio"""
+
+    from juzgados_mercantil_2025 import JUZGADOS, recargar_ids
+
+    actuales = {j.codigo: j for j in JuzgadoMercantil.query.all()}
+    nuevos = actualizados = 0
+    for juzgado in JUZGADOS:
+        datos = {'numero': juzgado.numero, 'sede': juzgado.sede,
+                 'provincia': juzgado.provincia, 'nombre': juzgado.nombre}
+        fila = actuales.get(juzgado.codigo)
+        if fila is None:
+            db.session.add(JuzgadoMercantil(codigo=juzgado.codigo, **datos))
+            nuevos += 1
+        elif any(getattr(fila, k) != v for k, v in datos.items()):
+            for k, v in datos.items():
+                setattr(fila, k, v)
+            actualizados += 1
+    db.session.commit()
+    recargar_ids()
+    return {'nuevos': nuevos, 'actualizados': actualizados, 'total': len(JUZGADOS)}
+
+
+def rellenar_juzgado_id(tamano_bloque=TAMANO_BLOQUE, todos=False):
+    """
+    Asigna juzgado_id a los procedimientos que no lo tienen (o a todos con
+    ``todos``). Retorna {'textos', 'emparejados', 'filas_actualizadas', 'sin_emparejar'}.
+    """
+    from juzgados_mercantil_2025 import emparejar_juzgado, id_juzgado
+
+    consulta = db.session.query(Procedimiento.juzgado, db.func.count(Procedimiento.id)).group_by(Procedimiento.juzgado)
+    if not todos:
+        consulta = consulta.filter(Procedimiento.juzgado_id.is_(None))
+    textos = consulta.all()
+
+    asignaciones, sin_emparejar = [], {}
+    for texto, filas in textos:
+        juzgado = emparejar_juzgado(texto)
+        juzgado_id = id_juzgado(juzgado.codigo) if juzgado else None
+        if juzgado_id:
+            asignaciones.append({'texto': texto, 'juzgado_id': juzgado_id})
+        else:
+            sin_emparejar[texto] = filas
+
+    sentencia = text(
+        f"UPDATE {Procedimiento.__tablename__} SET juzgado_id = :juzgado_id WHERE juzgado = :texto"
+        + ("" if todos else " AND juzgado_id IS NULL")
+    )
+    actualizadas = 0
+    try:
+        for i in range(0, len(asignaciones), tamano_bloque):
+            resultado = db.session.execute(sentencia, asignaciones[i:i + tamano_bloque])
+            actualizadas += resultado.rowcount if resultado.rowcount and resultado.rowcount > 0 else 0
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'textos': len(textos),
+        'emparejados': len(asignaciones),
+        'filas_actualizadas': actualizadas,
+        'sin_emparejar': sin_emparejar,
+    }
+
+
+def migrar(tamano_bloque=TAMANO_BLOQUE, todos=False):
+    cambios = asegurar_esquema()
+    dimension = sincronizar_juzgados()
+    relleno = rellenar_juzgado_id(tamano_bloque, todos=todos)
+    return {'esquema': cambios, 'dimension': dimension, 'relleno': relleno}
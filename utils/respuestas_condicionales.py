@@ -0,0 +1,185 @@
+"""
+Respuestas condicionales (ETag / Last-Modified) para las páginas que dependen
+del catálogo de entidades.
+
+El ETag es fuerte y se calcula sin renderizar nada: versión del catálogo,
+usuario y rol, versión (mtime) de la plantilla y cualquier dato de sesión u
+otro catálogo (p. ej. ``version_tipos_via()``) que cambie el HTML. Si el navegador envía ``If-None-Match`` con ese valor se
+responde 304 directamente.
+
+Las exportaciones del catálogo se guardan en disco por (versión del catálogo,
+formato): la primera descarga tras un cambio las genera y las siguientes, de
+cualquier worker, se sirven desde el fichero.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app, make_response, request, send_file, session
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIR_CACHE_EXPORTACIONES = os.environ.get(
+    'EXPORT_CACHE_DIR', os.path.join(BASE_DIR, 'instance', 'cache_exportaciones')
+)
+
+# Un .tmp de una versión anterior con más antigüedad que esto es de un proceso muerto
+MAX_EDAD_TMP = 3600
+
+_PATRON_FICHERO = re.compile(r'^entidades_(\d+)\.')
+
+# Páginas personalizadas por usuario: la caché del navegador sí, las compartidas no
+CACHE_CONTROL = 'private, no-cache'
+
+
+def version_plantilla(nombre):
+    """mtime (ns) de la plantilla; 0 si no se encuentra en la carpeta de plantillas"""
+    carpeta = os.path.join(current_app.root_path, current_app.template_folder or 'templates')
+    try:
+        return os.stat(os.path.join(carpeta, nombre)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def calcular_etag(*partes):
+    """Huella estable de las partes (cualquier valor serializable a JSON)"""
+    datos = json.dumps(partes, default=str, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(datos.encode('utf-8')).hexdigest()
+
+
+def etag_catalogo(usuario, plantilla, *extra):
+    from utils.catalogo_entidades import catalogo_entidades
+
+    return calcular_etag(
+        catalogo_entidades.version(), getattr(usuario, 'id', None), getattr(usuario, 'role', None),
+        plantilla, version_plantilla(plantilla), *extra
+    )
+
+
+def version_tipos_via():
+    """(número de tipos de vía, último updated_at): cambia al crear, editar o borrar uno"""
+    from models import db, TipoVia
+
+    total, ultima = db.session.query(db.func.count(TipoVia.id), db.func.max(TipoVia.updated_at)).one()
+    return total, ultima
+
+
+def ultima_modificacion():
+    """Fecha de la versión publicada del catálogo (None si aún no hay marcador)"""
+    from utils.catalogo_entidades import catalogo_entidades
+
+    version = catalogo_entidades.version()
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc) if version else None
+
+
+def hay_mensajes_pendientes():
+    """Con mensajes flash pendientes el HTML cambia: no se puede responder 304"""
+    return bool(session.get('_flashes'))
+
+
+def respuesta_condicional(etag, generar, last_modified=None):
+    """
+    304 si ``If-None-Match`` coincide con ``etag``; si no, ``generar()`` con
+    las cabeceras de validación. Solo aplica a GET/HEAD sin flashes pendientes.
+    """
+    if request.method not in ('GET', 'HEAD') or hay_mensajes_pendientes():
+        return generar()
+
+    if request.if_none_match.contains(etag):
+        respuesta = current_app.response_class(status=304)
+    else:
+        respuesta = make_response(generar())
+        if respuesta.status_code != 200:
+            return respuesta
+        if last_modified is not None:
+            respuesta.last_modified = last_modified
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = CACHE_CONTROL
+    return respuesta
+
+
+def _version_de(nombre):
+    coincidencia = _PATRON_FICHERO.match(nombre)
+    return int(coincidencia.group(1)) if coincidencia else None
+
+
+class CacheExportaciones:
+    """Ficheros de exportación por versión del catálogo, compartidos entre workers"""
+
+    def __init__(self, directorio=DIR_CACHE_EXPORTACIONES):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+
+    def ruta(self, version, extension):
+        return os.path.join(self.directorio, f"entidades_{version}.{extension}")
+
+    def _purgar(self, vigente):
+        """
+        Borra las exportaciones de versiones anteriores a ``vigente``. Las
+        versiones son mtimes en ns, así que las posteriores (de otro worker que
+        ya vio un catálogo más nuevo) y sus ``.tmp`` se respetan; los ``.tmp``
+        antiguos solo se borran si llevan más de ``MAX_EDAD_TMP`` sin tocarse.
+        """
+        ahora = time.time()
+        for nombre in os.listdir(self.directorio):
+            version = _version_de(nombre)
+            if version is None or version >= vigente:
+                continue
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if nombre.endswith('.tmp') and ahora - os.stat(ruta).st_mtime < MAX_EDAD_TMP:
+                    continue
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def obtener(self, version, extension, generar):
+        """Ruta del fichero para (versión, extensión); ``generar()`` devuelve los trozos si falta"""
+        ruta = self.ruta(version, extension)
+        if os.path.exists(ruta):
+            return ruta
+        with self._lock:
+            if os.path.exists(ruta):
+                return ruta
+            os.makedirs(self.directorio, exist_ok=True)
+            tmp = f"{ruta}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, 'wb') as f:
+                    for trozo in generar():
+                        f.write(trozo.encode('utf-8') if isinstance(trozo, str) else trozo)
+                os.replace(tmp, ruta)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            self._purgar(version)
+        return ruta
+
+
+cache_exportaciones = CacheExportaciones()
+
+
+def enviar_exportacion(formato, nombre_descarga):
+    """Exportación del catálogo con ETag por versión y fichero cacheado"""
+    from utils.catalogo_entidades import catalogo_entidades
+    from utils.exportacion_entidades import FORMATOS, exportar
+
+    version = catalogo_entidades.version()
+    mimetype, extension = FORMATOS[formato]
+    etag = calcular_etag('exportacion', version, formato)
+
+    def generar():
+        # Otro worker puede purgar el fichero entre obtener() y abrirlo: se regenera una vez
+        for intento in range(2):
+            ruta = cache_exportaciones.obtener(version, extension, lambda: exportar(formato)[0])
+            try:
+                return send_file(ruta, mimetype=mimetype, as_attachment=True,
+                                 download_name=f"{nombre_descarga}.{extension}", etag=False, conditional=False)
+            except FileNotFoundError:
+                if intento:
+                    raise
+
+    return respuesta_condicional(etag, generar, last_modified=ultima_modificacion())
@@ -0,0 +1,157 @@
+"""
+Generación en lote de solicitudes RGPD (acceso / supresión).
+
+Un mismo solicitante y N destinatarios: las cartas se renderizan en un pool
+de procesos (ReportLab es Python puro y ligado a CPU, así que los hilos no
+ganan nada con el GIL), cada proceso con su propia instancia de PDFGenerator,
+y se devuelven en el orden de los destinatarios en un único ZIP o PDF.
+
+Cada carta se renombra en cuanto se genera con el índice del lote. Nada
+garantiza que PDFGenerator dé nombres distintos a dos cartas del mismo
+solicitante generadas a la vez en procesos distintos: las cartas cuyo nombre
+original se repite se vuelven a generar una tras otra en el proceso que
+atiende la petición.
+"""
+
+import io
+import os
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+PDF_DIR = os.path.join("static", "pdfs")
+PROCESOS = int(os.environ.get("RGPD_LOTE_PROCESOS", "0")) or None  # None: os.cpu_count()
+
+TIPOS_LOTE = {
+    "acceso": "generate_rgpd_acceso_pdf",
+    "supresion": "generate_rgpd_supresion_pdf",
+}
+
+
+def destinatario_desde_entidad(entidad):
+    """Construye el diccionario de destinatario a partir de una EntidadFinanciera"""
+    return {
+        "clave": "banco",
+        "nombre": entidad.nombre,
+        "email": entidad.email_rgpd or entidad.email_general or "",
+        "tipo_via": "",
+        "via": entidad.direccion or entidad.direccion_completa or "",
+        "numero": entidad.numero or "",
+        "extras": "",
+        "cp": entidad.codigo_postal or "",
+        "localidad": entidad.localidad or "",
+        "provincia": entidad.provincia or "",
+        "ccaa": entidad.comunidad_autonoma or "",
+    }
+
+
+def _renombrar_en_lote(filename, indice, pdf_dir):
+    """Mueve la carta recién generada a un nombre propio de su posición en el lote"""
+    base, extension = os.path.splitext(filename)
+    nuevo = f"{base}_lote{indice:03d}{extension}"
+    os.replace(os.path.join(pdf_dir, filename), os.path.join(pdf_dir, nuevo))
+    return nuevo
+
+
+_generador = None  # instancia de PDFGenerator de cada proceso del pool
+
+
+def _iniciar_proceso(clase_generador):
+    global _generador
+    _generador = clase_generador()
+
+
+def _generar_carta(generador, tarea):
+    """(nombre original, nombre en el lote, error) de una carta"""
+    indice, metodo, payload, pdf_dir = tarea
+    try:
+        original = getattr(generador, metodo)(payload)
+    except Exception as e:
+        return None, None, str(e)
+    try:
+        return original, _renombrar_en_lote(original, indice, pdf_dir), None
+    except OSError as e:  # otro proceso ya movió el fichero con ese nombre
+        return original, None, str(e)
+
+
+def _generar_carta_en_proceso(tarea):
+    return _generar_carta(_generador, tarea)
+
+
+def generar_lote_rgpd(pdf_generator, solicitante, destinos, tipo="acceso", pdf_dir=PDF_DIR, procesos=PROCESOS):
+    """
+    Genera una carta RGPD por destino; ``destinos`` es una lista de
+    (destino_tipo, destinatario) con los mismos valores que usa la carta
+    individual ('equifax_asnef', 'badexcug', 'banco'...).
+
+    Retorna una lista de (destinatario, pdf_filename, error) en el mismo orden
+    que ``destinos``; ``error`` es None si la carta se generó.
+    """
+    if tipo not in TIPOS_LOTE:
+        raise ValueError(f"Tipo de lote no soportado: {tipo}")
+    metodo = TIPOS_LOTE[tipo]
+    tareas = [
+        (indice, metodo, {**solicitante, "motivo": tipo, "destino_tipo": destino_tipo, "destinatario": destinatario},
+         pdf_dir)
+        for indice, (destino_tipo, destinatario) in enumerate(destinos, start=1)
+    ]
+
+    procesos = min(procesos or os.cpu_count() or 1, len(tareas))
+    if procesos <= 1:
+        salidas = [_generar_carta(pdf_generator, tarea) for tarea in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso,
+                                 initargs=(type(pdf_generator),)) as pool:
+            salidas = list(pool.map(_generar_carta_en_proceso, tareas))
+
+        # Dos procesos pudieron escribir el mismo nombre a la vez: se regeneran en serie
+        repetidos = Counter(original for original, _, _ in salidas if original)
+        for posicion, (original, filename, error) in enumerate(salidas):
+            if original and repetidos[original] > 1:
+                if filename and os.path.exists(os.path.join(pdf_dir, filename)):
+                    os.remove(os.path.join(pdf_dir, filename))
+                salidas[posicion] = _generar_carta(pdf_generator, tareas[posicion])
+
+    return [(destinatario, filename, error)
+            for (_, destinatario), (_, filename, error) in zip(destinos, salidas)]
+
+
+def _nombre_en_lote(indice, destinatario, filename):
+    """Nombre único y legible de cada carta dentro del paquete"""
+    nombre = (destinatario.get("nombre") or "destinatario").strip()
+    nombre = "".join(c if c.isalnum() else "_" for c in nombre)[:60].strip("_")
+    return f"{indice:03d}_{nombre or 'destinatario'}_{filename}"
+
+
+def empaquetar_zip(resultados, pdf_dir=PDF_DIR):
+    """Empaqueta las cartas generadas en un ZIP en memoria"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for indice, (destinatario, filename, error) in enumerate(resultados, start=1):
+            if not filename:
+                continue
+            ruta = os.path.join(pdf_dir, filename)
+            if os.path.exists(ruta):
+                zf.write(ruta, arcname=_nombre_en_lote(indice, destinatario, filename))
+    buffer.seek(0)
+    return buffer
+
+
+def combinar_pdfs(resultados, pdf_dir=PDF_DIR):
+    """Une las cartas generadas en un único PDF en memoria"""
+    from PyPDF2 import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    for destinatario, filename, error in resultados:
+        if not filename:
+            continue
+        ruta = os.path.join(pdf_dir, filename)
+        if not os.path.exists(ruta):
+            continue
+        for page in PdfReader(ruta).pages:
+            writer.add_page(page)
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,239 @@
+"""
+Rollup incremental de tiempos de admisión por (juzgado, mes, tipo de concurso).
+
+Cada fila de ``RollupJuzgadoMes`` guarda contadores (total, muestras, suma de
+días, suma de cuadrados) y un histograma disperso {días: procedimientos}. Los
+días son enteros, así que el histograma es exacto y la mediana / p90 de
+cualquier rango de meses sale de sumar unas decenas de histogramas.
+
+- ``registrar_procedimiento``: se llama tras añadir (flush) un Procedimiento y
+  antes del commit, en la misma transacción: el procedimiento y su rollup se
+  guardan juntos o no se guarda ninguno. Primero incrementa los contadores con
+  un UPDATE atómico (que bloquea la fila hasta el commit) y después reescribe
+  el histograma, de modo que dos workers no se pisan.
+- ``reconstruir``: recalcula todo desde Procedimiento con una consulta
+  agrupada (``flask rollup-juzgados``).
+- ``resumen_desde_rollups``: mismo formato que
+  ``analitica_juzgados.resumen_por_juzgado`` para rangos de meses completos.
+
+El mes es el de ``fecha_presentacion_demanda``. Hasta la primera
+reconstrucción (que deja el marcador ``instance/rollup_juzgados.construido``)
+no se registra nada y la analítica sigue consultando Procedimiento.
+"""
+
+import json
+import math
+import os
+import time
+from calendar import monthrange
+from collections import Counter, defaultdict
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Procedimiento, RollupJuzgadoMes
+from utils.analitica_juzgados import PERCENTILES, condiciones_base, expresion_dias
+
+TAMANO_BLOQUE = 500
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_MARCADOR = os.environ.get(
+    'ROLLUP_JUZGADOS_MARKER', os.path.join(BASE_DIR, 'instance', 'rollup_juzgados.construido')
+)
+
+
+def rollup_construido():
+    """True si el rollup se ha reconstruido al menos una vez (y se mantiene al día)"""
+    return os.path.exists(RUTA_MARCADOR)
+
+
+def clave_mes(fecha):
+    return f"{fecha.year:04d}-{fecha.month:02d}"
+
+
+def clave_juzgado(juzgado_id, juzgado_texto):
+    """(juzgado_id, juzgado_texto) tal como se guardan: 0 + texto si no está emparejado"""
+    if juzgado_id:
+        return juzgado_id, ''
+    return 0, (juzgado_texto or '')[:200]
+
+
+def expresion_mes(dialecto=None):
+    dialecto = dialecto or db.engine.dialect.name
+    fecha = Procedimiento.fecha_presentacion_demanda
+    if dialecto == 'sqlite':
+        return func.strftime('%Y-%m', fecha)
+    if dialecto in ('mysql', 'mariadb'):
+        return func.date_format(fecha, '%Y-%m')
+    return func.to_char(fecha, 'YYYY-MM')
+
+
+def _leer_histograma(texto):
+    return Counter({int(k): v for k, v in json.loads(texto or '{}').items()})
+
+
+def _escribir_histograma(histograma):
+    return json.dumps({str(k): v for k, v in sorted(histograma.items()) if v}, separators=(',', ':'))
+
+
+def registrar_procedimiento(proc):
+    """
+    Suma un procedimiento a su fila de rollup (no hace nada si le faltan fechas).
+    No hace commit: el llamador confirma el procedimiento y el rollup a la vez.
+    """
+    if not rollup_construido():
+        return False
+    if not proc.fecha_presentacion_demanda or not proc.fecha_admision or proc.juzgado is None:
+        return False
+    juzgado_id, juzgado_texto = clave_juzgado(proc.juzgado_id, proc.juzgado)
+    clave = {
+        'juzgado_id': juzgado_id,
+        'juzgado_texto': juzgado_texto,
+        'mes': clave_mes(proc.fecha_presentacion_demanda),
+        'tipo_concurso': proc.tipo_concurso or '',
+    }
+    dias = (proc.fecha_admision - proc.fecha_presentacion_demanda).days
+    valido = dias >= 0
+
+    if not RollupJuzgadoMes.query.filter_by(**clave).count():
+        try:
+            with db.session.begin_nested():
+                db.session.add(RollupJuzgadoMes(**clave))
+        except IntegrityError:
+            pass  # la ha creado otro worker a la vez
+
+    tabla = RollupJuzgadoMes
+    db.session.execute(
+        update(tabla).filter_by(**clave).values(
+            total=tabla.total + 1,
+            muestras=tabla.muestras + (1 if valido else 0),
+            suma_dias=tabla.suma_dias + (dias if valido else 0),
+            suma_cuadrados=tabla.suma_cuadrados + (dias * dias if valido else 0),
+        )
+    )
+    if valido:
+        # La fila ya está bloqueada por el UPDATE anterior hasta el commit
+        fila = RollupJuzgadoMes.query.filter_by(**clave).populate_existing().one()
+        histograma = _leer_histograma(fila.histograma)
+        histograma[dias] += 1
+        fila.histograma = _escribir_histograma(histograma)
+    return True
+
+
+def reconstruir(tamano_bloque=TAMANO_BLOQUE):
+    """Vacía y recalcula el rollup completo; devuelve {'filas', 'procedimientos'}"""
+    dias = expresion_dias()
+    mes = expresion_mes()
+    consulta = db.session.query(
+        Procedimiento.juzgado_id, Procedimiento.juzgado, mes.label('mes'),
+        Procedimiento.tipo_concurso, dias.label('dias'), func.count(Procedimiento.id),
+    ).filter(*condiciones_base()).group_by(
+        Procedimiento.juzgado_id, Procedimiento.juzgado, mes, Procedimiento.tipo_concurso, dias,
+    )
+
+    filas = defaultdict(lambda: {'total': 0, 'muestras': 0, 'suma_dias': 0, 'suma_cuadrados': 0,
+                                 'histograma': Counter()})
+    procedimientos = 0
+    for juzgado_id, juzgado, mes_valor, tipo, dias_valor, n in consulta:
+        juzgado_id, juzgado_texto = clave_juzgado(juzgado_id, juzgado)
+        fila = filas[(juzgado_id, juzgado_texto, mes_valor, tipo or '')]
+        dias_valor = int(round(dias_valor))
+        fila['total'] += n
+        procedimientos += n
+        if dias_valor >= 0:
+            fila['muestras'] += n
+            fila['suma_dias'] += n * dias_valor
+            fila['suma_cuadrados'] += n * dias_valor * dias_valor
+            fila['histograma'][dias_valor] += n
+
+    registros = [
+        {'juzgado_id': k[0], 'juzgado_texto': k[1], 'mes': k[2], 'tipo_concurso': k[3],
+         **{c: v for c, v in datos.items() if c != 'histograma'},
+         'histograma': _escribir_histograma(datos['histograma'])}
+        for k, datos in filas.items()
+    ]
+    try:
+        db.session.query(RollupJuzgadoMes).delete(synchronize_session=False)
+        for i in range(0, len(registros), tamano_bloque):
+            db.session.bulk_insert_mappings(RollupJuzgadoMes, registros[i:i + tamano_bloque])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    os.makedirs(os.path.dirname(RUTA_MARCADOR), exist_ok=True)
+    with open(RUTA_MARCADOR, 'w') as f:
+        f.write(str(time.time()))
+    return {'filas': len(registros), 'procedimientos': procedimientos}
+
+
+def rango_en_meses(desde=None, hasta=None):
+    """
+    ('AAAA-MM' | None, 'AAAA-MM' | None) si [desde, hasta] cubre meses completos;
+    None si algún extremo cae a mitad de mes (el rollup no puede responder).
+    """
+    if desde and desde.day != 1:
+        return None
+    if hasta and hasta.day != monthrange(hasta.year, hasta.month)[1]:
+        return None
+    return (clave_mes(desde) if desde else None, clave_mes(hasta) if hasta else None)
+
+
+def percentil_histograma(histograma, n, p):
+    """Percentil con interpolación lineal (como percentile_cont) sobre {valor: frecuencia}"""
+    if not n:
+        return None
+    posicion = 1 + p * (n - 1)
+    rangos = (math.floor(posicion), math.ceil(posicion))
+    valores, acumulado = [], 0
+    for valor in sorted(histograma):
+        acumulado += histograma[valor]
+        while len(valores) < 2 and acumulado >= rangos[len(valores)]:
+            valores.append(valor)
+        if len(valores) == 2:
+            break
+    bajo, alto = valores
+    return bajo + (posicion - rangos[0]) * (alto - bajo)
+
+
+def resumen_desde_rollups(desde_mes=None, hasta_mes=None, tipo_concurso=None):
+    """Resumen por juzgado combinando las filas de rollup del rango de meses"""
+    from juzgados_mercantil_2025 import obtener_juzgado
+
+    consulta = RollupJuzgadoMes.query
+    if desde_mes:
+        consulta = consulta.filter(RollupJuzgadoMes.mes >= desde_mes)
+    if hasta_mes:
+        consulta = consulta.filter(RollupJuzgadoMes.mes <= hasta_mes)
+    if tipo_concurso is not None:
+        consulta = consulta.filter(RollupJuzgadoMes.tipo_concurso == tipo_concurso)
+
+    grupos = defaultdict(lambda: {'total': 0, 'muestras': 0, 'suma_dias': 0, 'suma_cuadrados': 0,
+                                  'histograma': Counter()})
+    for fila in consulta:
+        grupo = grupos[(fila.juzgado_id, fila.juzgado_texto)]
+        grupo['total'] += fila.total
+        grupo['muestras'] += fila.muestras
+        grupo['suma_dias'] += fila.suma_dias
+        grupo['suma_cuadrados'] += fila.suma_cuadrados
+        grupo['histograma'].update(_leer_histograma(fila.histograma))
+
+    resumen, total = [], 0
+    for (juzgado_id, juzgado_texto), grupo in grupos.items():
+        total += grupo['total']
+        n = grupo['muestras']
+        if not n:
+            continue
+        media = grupo['suma_dias'] / n
+        juzgado = obtener_juzgado(juzgado_id) if juzgado_id else None
+        fila = {
+            'juzgado': juzgado.nombre if juzgado else juzgado_texto,
+            'juzgado_id': juzgado_id or None,
+            'muestras': n,
+            'promedio_dias': round(media, 1),
+            'desviacion_dias': round(math.sqrt(max(grupo['suma_cuadrados'] / n - media * media, 0)), 1),
+        }
+        for nombre, p in PERCENTILES.items():
+            fila[f'{nombre}_dias'] = round(percentil_histograma(grupo['histograma'], n, p), 1)
+        resumen.append(fila)
+    return resumen, total
@@ -0,0 +1,253 @@
+"""
+Separación masiva de direcciones españolas en sus componentes.
+
+Formato esperado (listados de entidades): "CL MAYOR 12, 29120. Alhaurín de
+la Torre. Málaga."  -> tipo de vía, nombre de vía, número, CP, población y
+provincia.
+
+- Todas las expresiones regulares se compilan una sola vez.
+- El tipo de vía se busca en un trie de prefijos (prefijo más largo que
+  termina en frontera de palabra) en lugar de probar ~40 variantes con
+  ``startswith``.
+- CP, número, población y provincia se extraen por bloques con
+  ``Series.str.extract``; solo las filas sin el patrón "CP. Población.
+  Provincia." pasan por el método alternativo fila a fila.
+- Los bloques se reparten en un pool de procesos y los resultados se
+  escriben en orden a CSV o XLSX (XlsxWriter ``constant_memory``) a medida
+  que llegan, sin acumular todo el resultado en memoria.
+"""
+
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+TAMANO_BLOQUE = 5000
+
+TIPOS_VIA = {
+    'CALLE': ['CL', 'CALLE', 'C/'],
+    'AVENIDA': ['AV', 'AVENIDA', 'AVDA', 'AVDA.'],
+    'PASEO': ['PS', 'PASEO', 'PSEO'],
+    'PLAZA': ['PL', 'PLAZA'],
+    'TRAVESÍA': ['TRV', 'TRAVESÍA', 'TRAV'],
+    'CARRETERA': ['CTRA', 'CARRETERA'],
+    'CAMINO': ['CM', 'CAMINO'],
+    'RONDA': ['RDA', 'RONDA'],
+    'BULEVAR': ['BLVD', 'BULEVAR'],
+    'JARDINES': ['JARD', 'JARDINES'],
+    'URBANIZACIÓN': ['URB', 'URBANIZACIÓN'],
+    'POLÍGONO': ['POL', 'POLÍGONO'],
+    'PARCELA': ['PARC', 'PARCELA'],
+    'EDIFICIO': ['EDIF', 'EDIFICIO'],
+    'TORRE': ['TORR', 'TORRE'],
+    'BLOQUE': ['BLOQ', 'BLOQUE'],
+    'PORTAL': ['PORT', 'PORTAL'],
+    'ACCESO': ['ACCES', 'ACCESO'],
+    'ZONA': ['ZZ', 'ZONA'],
+}
+
+CAMPOS = ['tipo_via', 'nombre_via', 'numero', 'cp', 'poblacion', 'provincia']
+COLUMNAS_SALIDA = ['Nombre', 'Tipo_Via', 'Nombre_Via', 'Numero', 'CP', 'Poblacion', 'Provincia', 'Direccion_Original']
+
+PATRON_CP = r'\b(\d{5})\b'
+PATRON_NUMERO = r'\b(\d{1,4}[A-Z]?)\b'
+PATRON_POBLACION_PROVINCIA = r'(\d{5})\.\s*([^.]+)\.\s*([^.]+)\.?'
+
+_RE_CP = re.compile(PATRON_CP)
+_RE_NUMERO = re.compile(PATRON_NUMERO)
+_RE_POBLACION_PROVINCIA = re.compile(PATRON_POBLACION_PROVINCIA)
+_RE_RESTO_NUMERO = re.compile(r'\b\d{1,4}[A-Z]?\b.*')
+_RE_RESTO_CP = re.compile(r'\b\d{5}\b.*')
+
+
+class TriePrefijos:
+    """Trie de variantes de tipo de vía; devuelve el prefijo más largo válido"""
+
+    def __init__(self, tipos):
+        self._raiz = {}
+        for tipo, variantes in tipos.items():
+            for variante in variantes:
+                nodo = self._raiz
+                for caracter in variante.upper():
+                    nodo = nodo.setdefault(caracter, {})
+                nodo[None] = tipo
+
+    def buscar(self, texto):
+        """(tipo, longitud_prefijo) o ('', 0)"""
+        nodo = self._raiz
+        encontrado = ('', 0)
+        for i, caracter in enumerate(texto.upper()):
+            nodo = nodo.get(caracter)
+            if nodo is None:
+                break
+            if None in nodo:
+                # Frontera: la variante acaba en signo (C/, AVDA.) o le sigue algo que no es letra/dígito
+                siguiente = texto[i + 1:i + 2]
+                if not caracter.isalnum() or not siguiente or not siguiente.isalnum():
+                    encontrado = (nodo[None], i + 1)
+        return encontrado
+
+
+trie_tipos_via = TriePrefijos(TIPOS_VIA)
+
+
+def _texto(valor):
+    if valor is None or (isinstance(valor, float) and pd.isna(valor)):
+        return ''
+    return str(valor).strip()
+
+
+def _limpiar_nombre_via(nombre_via):
+    nombre_via = _RE_RESTO_NUMERO.sub('', nombre_via).strip()
+    nombre_via = _RE_RESTO_CP.sub('', nombre_via).strip()
+    return nombre_via.rstrip(',').strip().rstrip('.').strip()
+
+
+def _poblacion_por_partes(direccion):
+    """Método alternativo: la parte siguiente a la que lleva el CP es la población"""
+    partes = [p.strip() for p in direccion.split('.')]
+    if len(partes) >= 3:
+        for idx, parte in enumerate(partes):
+            if _RE_CP.search(parte):
+                poblacion = partes[idx + 1] if idx + 1 < len(partes) else ''
+                provincia = partes[idx + 2] if idx + 2 < len(partes) else ''
+                return poblacion, provincia
+    return '', ''
+
+
+def separar_direccion(direccion_completa):
+    """Componentes de una sola dirección (misma lógica que la versión por bloques)"""
+    direccion = _texto(direccion_completa)
+    if not direccion:
+        return dict.fromkeys(CAMPOS, '')
+
+    cp = _RE_CP.search(direccion)
+    numero = _RE_NUMERO.search(direccion)
+    tipo_via, longitud = trie_tipos_via.buscar(direccion)
+    nombre_via = _limpiar_nombre_via(direccion[longitud:].strip()) if tipo_via else ''
+
+    match = _RE_POBLACION_PROVINCIA.search(direccion)
+    if match:
+        poblacion, provincia = match.group(2).strip(), match.group(3).strip()
+    else:
+        poblacion, provincia = _poblacion_por_partes(direccion)
+
+    return {
+        'tipo_via': tipo_via,
+        'nombre_via': nombre_via,
+        'numero': numero.group(1) if numero else '',
+        'cp': cp.group(1) if cp else '',
+        'poblacion': poblacion,
+        'provincia': provincia,
+    }
+
+
+def separar_serie(direcciones):
+    """DataFrame con CAMPOS para una Serie de direcciones (extracción vectorizada)"""
+    direcciones = direcciones.astype('string').fillna('').str.strip()
+    resultado = pd.DataFrame(index=direcciones.index)
+    resultado['cp'] = direcciones.str.extract(PATRON_CP, expand=False).fillna('')
+    resultado['numero'] = direcciones.str.extract(PATRON_NUMERO, expand=False).fillna('')
+
+    encontrados = [trie_tipos_via.buscar(d) for d in direcciones]
+    resultado['tipo_via'] = [tipo for tipo, _ in encontrados]
+    restos = pd.Series([d[n:] if n else '' for d, (_, n) in zip(direcciones, encontrados)],
+                       index=direcciones.index, dtype='string')
+    resultado['nombre_via'] = (restos.str.strip()
+                               .str.replace(_RE_RESTO_NUMERO, '', regex=True).str.strip()
+                               .str.replace(_RE_RESTO_CP, '', regex=True).str.strip()
+                               .str.rstrip(',').str.strip().str.rstrip('.').str.strip())
+
+    pob_prov = direcciones.str.extract(PATRON_POBLACION_PROVINCIA)
+    resultado['poblacion'] = pob_prov[1].str.strip()
+    resultado['provincia'] = pob_prov[2].str.strip()
+    sin_patron = pob_prov[0].isna() & (direcciones != '')
+    if sin_patron.any():
+        alternativos = [_poblacion_por_partes(d) for d in direcciones[sin_patron]]
+        resultado.loc[sin_patron, 'poblacion'] = [p for p, _ in alternativos]
+        resultado.loc[sin_patron, 'provincia'] = [p for _, p in alternativos]
+    resultado[['poblacion', 'provincia']] = resultado[['poblacion', 'provincia']].fillna('')
+    return resultado[CAMPOS]
+
+
+def procesar_bloque(bloque):
+    """``bloque`` con columnas 'nombre' y 'direccion' -> filas en el formato de salida"""
+    componentes = separar_serie(bloque['direccion'])
+    return pd.DataFrame({
+        'Nombre': bloque['nombre'],
+        'Tipo_Via': componentes['tipo_via'],
+        'Nombre_Via': componentes['nombre_via'],
+        'Numero': componentes['numero'],
+        'CP': componentes['cp'],
+        'Poblacion': componentes['poblacion'],
+        'Provincia': componentes['provincia'],
+        'Direccion_Original': bloque['direccion'],
+    }, columns=COLUMNAS_SALIDA)
+
+
+def _bloques(df, columna_nombre, columna_direccion, tamano_bloque):
+    for inicio in range(0, len(df), tamano_bloque):
+        parte = df.iloc[inicio:inicio + tamano_bloque]
+        yield pd.DataFrame({'nombre': parte[columna_nombre].values, 'direccion': parte[columna_direccion].values},
+                           index=parte.index)
+
+
+def separar_en_paralelo(df, columna_nombre, columna_direccion, procesos=None, tamano_bloque=TAMANO_BLOQUE):
+    """Genera los bloques procesados en el orden original"""
+    bloques = _bloques(df, columna_nombre, columna_direccion, tamano_bloque)
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1 or len(df) <= tamano_bloque:
+        for bloque in bloques:
+            yield procesar_bloque(bloque)
+        return
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        yield from pool.map(procesar_bloque, bloques)
+
+
+def _celda(valor):
+    if valor is None or (isinstance(valor, float) and pd.isna(valor)) or valor is pd.NA:
+        return ''
+    return valor
+
+
+def escribir_resultados(bloques, archivo_salida):
+    """Vuelca los bloques a CSV o XLSX según la extensión; devuelve estadísticas"""
+    filas = 0
+    tipos, provincias = Counter(), Counter()
+    primera = None
+
+    if archivo_salida.lower().endswith('.csv'):
+        with open(archivo_salida, 'w', encoding='utf-8-sig', newline='') as f:
+            for n, bloque in enumerate(bloques):
+                bloque.to_csv(f, index=False, header=(n == 0))
+                filas += len(bloque)
+                tipos.update(bloque['Tipo_Via'])
+                provincias.update(bloque['Provincia'])
+                if primera is None and len(bloque):
+                    primera = bloque.iloc[0].to_dict()
+    else:
+        import xlsxwriter
+        wb = xlsxwriter.Workbook(archivo_salida, {'constant_memory': True})
+        ws = wb.add_worksheet('Sheet1')
+        ws.write_row(0, 0, COLUMNAS_SALIDA, wb.add_format({'bold': True}))
+        for bloque in bloques:
+            for fila in bloque.itertuples(index=False, name=None):
+                filas += 1
+                ws.write_row(filas, 0, [_celda(v) for v in fila])
+            tipos.update(bloque['Tipo_Via'])
+            provincias.update(bloque['Provincia'])
+            if primera is None and len(bloque):
+                primera = bloque.iloc[0].to_dict()
+        wb.close()
+
+    tipos.pop('', None)
+    provincias.pop('', None)
+    return {'filas': filas, 'tipos_via': tipos, 'provincias': provincias, 'ejemplo': primera}
+
+
+def leer_entrada(archivo_entrada):
+    if archivo_entrada.lower().endswith('.csv'):
+        return pd.read_csv(archivo_entrada, dtype=str, keep_default_na=False, sep=None, engine='python')
+    return pd.read_excel(archivo_entrada, dtype=str)
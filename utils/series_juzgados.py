@@ -0,0 +1,253 @@
+"""
+Series temporales de tiempos de admisión y volumen por juzgado.
+
+Las series se agregan en la base de datos al grano más fino necesario
+(semana, o mes) y se reducen aquí a la resolución pedida sumando contadores:
+volumen, muestras y suma de días, de modo que la media de un trimestre es
+exacta. Para meses y trimestres con rango de meses completos se leen las filas
+de rollup (``utils.rollup_juzgados``) en lugar de Procedimiento.
+
+Si el rango pedido tiene más periodos que ``max_puntos`` la resolución sube
+sola (semana -> mes -> trimestre).
+
+La respuesta es columnar: un eje ``periodos`` y, por juzgado, listas alineadas
+con él (``volumen``, ``muestras``, ``media_dias``). Las respuestas se guardan
+en una LRU por huella de filtros más la versión de los datos (último id de
+Procedimiento), con caducidad para recoger cambios de asignación de juzgados.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date, timedelta
+
+from sqlalchemy import Date, case, cast, func
+
+from models import db, Procedimiento, RollupJuzgadoMes
+from utils.analitica_juzgados import condiciones_base, expresion_dias
+
+RESOLUCIONES = ('semana', 'mes', 'trimestre')
+ALIAS_RESOLUCION = {'week': 'semana', 'month': 'mes', 'quarter': 'trimestre'}
+MAX_PUNTOS = 120
+CACHE_ENTRADAS = 256
+CACHE_TTL = 300
+
+
+def _lunes(fecha):
+    return fecha - timedelta(days=fecha.weekday())
+
+
+def clave_periodo(fecha, resolucion):
+    """'AAAA-MM-DD' (lunes de la semana), 'AAAA-MM' o 'AAAA-Tn'"""
+    if resolucion == 'semana':
+        return _lunes(fecha).isoformat()
+    if resolucion == 'mes':
+        return f"{fecha.year:04d}-{fecha.month:02d}"
+    return f"{fecha.year:04d}-T{(fecha.month - 1) // 3 + 1}"
+
+
+def _inicio_periodo(clave, resolucion):
+    if resolucion == 'semana':
+        return date.fromisoformat(clave)
+    anio = int(clave[:4])
+    if resolucion == 'mes':
+        return date(anio, int(clave[5:7]), 1)
+    return date(anio, (int(clave[-1]) - 1) * 3 + 1, 1)
+
+
+def _siguiente(inicio, resolucion):
+    if resolucion == 'semana':
+        return inicio + timedelta(days=7)
+    meses = 1 if resolucion == 'mes' else 3
+    mes = inicio.month - 1 + meses
+    return date(inicio.year + mes // 12, mes % 12 + 1, 1)
+
+
+def eje_periodos(desde, hasta, resolucion):
+    """Claves consecutivas de todos los periodos entre dos fechas (ambos incluidos)"""
+    inicio = _inicio_periodo(clave_periodo(desde, resolucion), resolucion)
+    claves = []
+    while inicio <= hasta:
+        claves.append(clave_periodo(inicio, resolucion))
+        inicio = _siguiente(inicio, resolucion)
+    return claves
+
+
+def resolucion_efectiva(desde, hasta, resolucion, max_puntos=MAX_PUNTOS):
+    """Sube de resolución mientras el eje tenga más de ``max_puntos`` periodos"""
+    for candidata in RESOLUCIONES[RESOLUCIONES.index(resolucion):]:
+        if len(eje_periodos(desde, hasta, candidata)) <= max_puntos:
+            return candidata
+    return RESOLUCIONES[-1]
+
+
+def _expresion_semana(dialecto=None):
+    dialecto = dialecto or db.engine.dialect.name
+    fecha = Procedimiento.fecha_presentacion_demanda
+    if dialecto == 'sqlite':
+        return func.date(fecha, 'weekday 0', '-6 days')
+    if dialecto in ('mysql', 'mariadb'):
+        return func.subdate(fecha, func.weekday(fecha))
+    return cast(func.date_trunc('week', fecha), Date)
+
+
+def _filas_sql(grano, desde, hasta, juzgado_ids, tipo_concurso):
+    """(juzgado_id, texto, clave de grano, volumen, muestras, suma_dias) agregadas en SQL"""
+    from utils.rollup_juzgados import expresion_mes
+
+    dias = expresion_dias()
+    periodo = _expresion_semana() if grano == 'semana' else expresion_mes()
+    valido = dias >= 0
+    consulta = db.session.query(
+        Procedimiento.juzgado_id,
+        case((Procedimiento.juzgado_id.is_(None), Procedimiento.juzgado), else_='').label('texto'),
+        periodo.label('periodo'),
+        func.count(Procedimiento.id),
+        func.sum(case((valido, 1), else_=0)),
+        func.sum(case((valido, dias), else_=0)),
+    ).filter(*condiciones_base())
+    if desde:
+        consulta = consulta.filter(Procedimiento.fecha_presentacion_demanda >= desde)
+    if hasta:
+        consulta = consulta.filter(Procedimiento.fecha_presentacion_demanda <= hasta)
+    if juzgado_ids:
+        consulta = consulta.filter(Procedimiento.juzgado_id.in_(juzgado_ids))
+    if tipo_concurso is not None:
+        consulta = consulta.filter(func.coalesce(Procedimiento.tipo_concurso, '') == tipo_concurso)
+    consulta = consulta.group_by(Procedimiento.juzgado_id, 'texto', periodo)
+    for juzgado_id, texto, clave, volumen, muestras, suma in consulta:
+        clave = clave.isoformat() if isinstance(clave, date) else str(clave)
+        yield juzgado_id or 0, texto or '', clave, volumen, int(muestras or 0), float(suma or 0)
+
+
+def _filas_rollup(desde, hasta, juzgado_ids, tipo_concurso):
+    consulta = RollupJuzgadoMes.query
+    if desde:
+        consulta = consulta.filter(RollupJuzgadoMes.mes >= clave_periodo(desde, 'mes'))
+    if hasta:
+        consulta = consulta.filter(RollupJuzgadoMes.mes <= clave_periodo(hasta, 'mes'))
+    if juzgado_ids:
+        consulta = consulta.filter(RollupJuzgadoMes.juzgado_id.in_(juzgado_ids))
+    if tipo_concurso is not None:
+        consulta = consulta.filter(RollupJuzgadoMes.tipo_concurso == tipo_concurso)
+    for fila in consulta:
+        yield fila.juzgado_id, fila.juzgado_texto, fila.mes, fila.total, fila.muestras, float(fila.suma_dias)
+
+
+def _rango_datos():
+    minimo, maximo = db.session.query(
+        func.min(Procedimiento.fecha_presentacion_demanda), func.max(Procedimiento.fecha_presentacion_demanda)
+    ).filter(*condiciones_base()).one()
+    return minimo, maximo
+
+
+def calcular_series(resolucion='mes', desde=None, hasta=None, juzgado_ids=None, tipo_concurso=None,
+                    max_puntos=MAX_PUNTOS):
+    from juzgados_mercantil_2025 import obtener_juzgado
+    from utils.rollup_juzgados import rango_en_meses, rollup_construido
+
+    resolucion = ALIAS_RESOLUCION.get(resolucion, resolucion)
+    if resolucion not in RESOLUCIONES:
+        raise ValueError(f"Resolución no soportada: {resolucion}")
+
+    minimo, maximo = _rango_datos()
+    if minimo is None:
+        return {'resolucion': resolucion, 'periodos': [], 'series': []}
+    inicio, fin = max(desde or minimo, minimo), min(hasta or maximo, maximo)
+    if inicio > fin:
+        return {'resolucion': resolucion, 'periodos': [], 'series': []}
+    resolucion = resolucion_efectiva(inicio, fin, resolucion, max_puntos)
+
+    grano = 'semana' if resolucion == 'semana' else 'mes'
+    if grano == 'mes' and rollup_construido() and rango_en_meses(desde, hasta):
+        filas = _filas_rollup(desde, hasta, juzgado_ids, tipo_concurso)
+    else:
+        filas = _filas_sql(grano, desde, hasta, juzgado_ids, tipo_concurso)
+
+    periodos = eje_periodos(inicio, fin, resolucion)
+    posicion = {clave: i for i, clave in enumerate(periodos)}
+    acumulado = defaultdict(lambda: [[0] * len(periodos), [0] * len(periodos), [0.0] * len(periodos)])
+    for juzgado_id, texto, clave, volumen, muestras, suma in filas:
+        i = posicion.get(clave_periodo(_inicio_periodo(clave, grano), resolucion))
+        if i is None:
+            continue
+        serie = acumulado[(juzgado_id, texto)]
+        serie[0][i] += volumen
+        serie[1][i] += muestras
+        serie[2][i] += suma
+
+    series = []
+    for (juzgado_id, texto), (volumen, muestras, sumas) in acumulado.items():
+        juzgado = obtener_juzgado(juzgado_id) if juzgado_id else None
+        series.append({
+            'juzgado_id': juzgado_id or None,
+            'juzgado': juzgado.nombre if juzgado else texto,
+            'volumen': volumen,
+            'muestras': muestras,
+            'media_dias': [round(s / m, 1) if m else None for s, m in zip(sumas, muestras)],
+        })
+    series.sort(key=lambda s: -sum(s['volumen']))
+    return {'resolucion': resolucion, 'periodos': periodos, 'series': series}
+
+
+class CacheSeries:
+    """LRU con caducidad: huella de filtros + versión de datos -> respuesta"""
+
+    def __init__(self, max_entradas=CACHE_ENTRADAS, ttl=CACHE_TTL):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave, calcular):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and ahora - entrada[0] < self.ttl:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[1]
+        valor = calcular()
+        with self._lock:
+            self.fallos += 1
+            self._entradas[clave] = (ahora, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return valor
+
+
+cache_series = CacheSeries()
+
+
+def huella_filtros(**filtros):
+    datos = json.dumps(filtros, default=str, sort_keys=True)
+    return hashlib.sha1(datos.encode('utf-8')).hexdigest()
+
+
+def version_datos():
+    """Cambia con cada procedimiento nuevo (y con cada reconstrucción del rollup)"""
+    from utils.rollup_juzgados import RUTA_MARCADOR
+
+    ultimo = db.session.query(func.max(Procedimiento.id)).scalar() or 0
+    try:
+        rollup = os.stat(RUTA_MARCADOR).st_mtime_ns
+    except OSError:
+        rollup = 0
+    return ultimo, rollup
+
+
+def series_juzgados(resolucion='mes', desde=None, hasta=None, juzgado_ids=None, tipo_concurso=None,
+                    max_puntos=MAX_PUNTOS):
+    """``calcular_series`` con caché por huella de filtros"""
+    filtros = {'resolucion': resolucion, 'desde': desde, 'hasta': hasta,
+               'juzgado_ids': sorted(juzgado_ids or []), 'tipo_concurso': tipo_concurso, 'max_puntos': max_puntos}
+    clave = (huella_filtros(**filtros), version_datos())
+    return cache_series.obtener(clave, lambda: calcular_series(
+        resolucion, desde, hasta, juzgado_ids, tipo_concurso, max_puntos
+    ))
@@ -0,0 +1,283 @@
+"""
+Pool de conexiones SMTP persistentes para EmailSender.
+
+Mantiene unas pocas sesiones SMTP ya autenticadas (EHLO + STARTTLS + AUTH
+se hacen una sola vez), comprueba con NOOP las que llevan un rato inactivas,
+reconecta ante fallos y envía varios mensajes seguidos por la misma sesión.
+
+EmailSender usa ``smtplib.SMTP`` directamente; ``activar_pool_smtp`` sustituye
+la referencia a ``smtplib`` de su módulo por una fachada compatible cuyas
+clases SMTP/SMTP_SSL toman la sesión del pool y la devuelven en ``quit()``.
+"""
+
+import atexit
+import hashlib
+import os
+import queue
+import smtplib
+import threading
+import time
+import types
+
+TAMANO_POOL = 3
+NOOP_TRAS_INACTIVIDAD = 30    # segundos sin uso antes de comprobar con NOOP
+CERRAR_TRAS_INACTIVIDAD = 300  # segundos sin uso tras los que se descarta la sesión
+
+ESPERA_SESION = 30             # segundos máximos esperando una sesión libre
+
+# Sal por proceso para no usar la contraseña en claro como clave del pool
+_SAL_CLAVE = os.urandom(16)
+
+
+def error_de_conexion(error):
+    """
+    True si ``error`` indica que la sesión ya no sirve (hay que reconectar).
+
+    SMTPException hereda de OSError, así que primero se separan los errores
+    SMTP: solo la desconexión y el fallo al conectar invalidan la sesión; el
+    resto (destinatario rechazado, error en DATA...) son del mensaje.
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    return isinstance(error, OSError)
+
+
+class _Sesion:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.ultimo_uso = time.monotonic()
+
+
+class PoolSMTP:
+    """Pool de sesiones SMTP autenticadas hacia un mismo servidor y usuario"""
+
+    def __init__(self, host, port, usuario=None, password=None, usar_tls=False, usar_ssl=False,
+                 tamano=TAMANO_POOL, timeout=30, contexto_tls=None, espera=ESPERA_SESION):
+        self.host = host
+        self.port = port
+        self.usuario = usuario
+        self.password = password
+        self.usar_tls = usar_tls
+        self.usar_ssl = usar_ssl
+        self.timeout = timeout
+        self.contexto_tls = contexto_tls
+        self.espera = espera
+        self._libres = queue.LifoQueue()
+        self._semaforo = threading.BoundedSemaphore(tamano)
+
+    def _conectar(self):
+        if self.usar_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=self.contexto_tls)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        smtp.ehlo()
+        if self.usar_tls and not self.usar_ssl:
+            smtp.starttls(context=self.contexto_tls)
+            smtp.ehlo()
+        if self.usuario:
+            smtp.login(self.usuario, self.password or "")
+        return _Sesion(smtp)
+
+    @staticmethod
+    def _descartar(sesion):
+        try:
+            sesion.smtp.quit()
+        except Exception:
+            try:
+                sesion.smtp.close()
+            except Exception:
+                pass
+
+    def _sesion_valida(self, sesion):
+        inactiva = time.monotonic() - sesion.ultimo_uso
+        if inactiva > CERRAR_TRAS_INACTIVIDAD:
+            return False
+        if inactiva > NOOP_TRAS_INACTIVIDAD:
+            try:
+                return sesion.smtp.noop()[0] == 250
+            except Exception:
+                return False
+        return True
+
+    def adquirir(self):
+        """Sesión lista para enviar (reutilizada si sigue viva, nueva si no)"""
+        if not self._semaforo.acquire(timeout=self.espera):
+            raise TimeoutError(f"Sin sesiones SMTP libres hacia {self.host} tras {self.espera} s")
+        try:
+            while True:
+                try:
+                    sesion = self._libres.get_nowait()
+                except queue.Empty:
+                    return self._conectar()
+                if self._sesion_valida(sesion):
+                    return sesion
+                self._descartar(sesion)
+        except Exception:
+            self._semaforo.release()
+            raise
+
+    def liberar(self, sesion, rota=False):
+        if rota:
+            self._descartar(sesion)
+        else:
+            sesion.ultimo_uso = time.monotonic()
+            self._libres.put(sesion)
+        self._semaforo.release()
+
+    def enviar(self, envio):
+        """Ejecuta ``envio(smtp)`` en una sesión del pool; reintenta una vez si la sesión cayó"""
+        for intento in (1, 2):
+            sesion = self.adquirir()
+            try:
+                resultado = envio(sesion.smtp)
+            except Exception as e:
+                if error_de_conexion(e):
+                    self.liberar(sesion, rota=True)
+                    if intento == 2:
+                        raise
+                    continue
+                # Error del mensaje (destinatario rechazado...): la sesión sigue siendo útil
+                # y no se reintenta, que el servidor pudo aceptar parte del envío
+                try:
+                    sesion.smtp.rset()
+                    self.liberar(sesion)
+                except Exception:
+                    self.liberar(sesion, rota=True)
+                raise
+            self.liberar(sesion)
+            return resultado
+
+    def cerrar(self):
+        while True:
+            try:
+                self._descartar(self._libres.get_nowait())
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _huella_contexto(contexto):
+    """Configuración relevante de un SSLContext (EmailSender puede crear uno por envío)"""
+    if contexto is None:
+        return None
+    return (contexto.verify_mode, contexto.check_hostname, contexto.minimum_version, contexto.maximum_version,
+            int(contexto.options), tuple(sorted(contexto.cert_store_stats().items())))
+
+
+def obtener_pool(host, port, usuario=None, password=None, usar_tls=False, usar_ssl=False, contexto_tls=None):
+    huella_password = hashlib.sha256(_SAL_CLAVE + (password or "").encode("utf-8")).hexdigest()
+    clave = (host, int(port or 0), usuario, huella_password, bool(usar_tls), bool(usar_ssl),
+             _huella_contexto(contexto_tls))
+    pool = _pools.get(clave)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(clave)
+            if pool is None:
+                pool = _pools[clave] = PoolSMTP(host, port, usuario, password, usar_tls, usar_ssl,
+                                                contexto_tls=contexto_tls)
+    return pool
+
+
+@atexit.register
+def cerrar_pools():
+    for pool in list(_pools.values()):
+        pool.cerrar()
+
+
+class SMTPAgrupado:
+    """
+    Sustituto de ``smtplib.SMTP`` respaldado por el pool.
+
+    EHLO, STARTTLS y LOGIN solo registran la configuración; la sesión real se
+    toma del pool al enviar y ``quit()``/``close()`` no cierran la conexión.
+    """
+
+    usar_ssl = False
+
+    def __init__(self, host="", port=0, local_hostname=None, timeout=None, context=None, **kwargs):
+        self.host = host
+        self.port = port or (smtplib.SMTP_SSL_PORT if self.usar_ssl else smtplib.SMTP_PORT)
+        self._tls = False
+        self._contexto = context  # SMTP_SSL(context=...)
+        self._usuario = None
+        self._password = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.quit()
+
+    def set_debuglevel(self, nivel):
+        pass
+
+    def connect(self, host="localhost", port=0, source_address=None):
+        self.host = host or self.host
+        self.port = port or self.port
+        return 220, b"pool"
+
+    def ehlo(self, name=""):
+        return 250, b"pool"
+
+    helo = ehlo
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def starttls(self, keyfile=None, certfile=None, context=None):
+        self._tls = True
+        if context is not None:
+            self._contexto = context
+        return 220, b"pool"
+
+    def login(self, user, password, **kwargs):
+        self._usuario = user
+        self._password = password
+        return 235, b"pool"
+
+    def noop(self):
+        return 250, b"pool"
+
+    def _pool(self):
+        return obtener_pool(self.host, self.port, self._usuario, self._password, self._tls, self.usar_ssl,
+                            contexto_tls=self._contexto)
+
+    def send_message(self, msg, from_addr=None, to_addrs=None, mail_options=(), rcpt_options=()):
+        return self._pool().enviar(lambda smtp: smtp.send_message(msg, from_addr, to_addrs, mail_options, rcpt_options))
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        return self._pool().enviar(lambda smtp: smtp.sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options))
+
+    def quit(self):
+        return 221, b"pool"
+
+    def close(self):
+        pass
+
+
+class SMTPAgrupadoSSL(SMTPAgrupado):
+    usar_ssl = True
+
+
+def _crear_fachada_smtplib():
+    fachada = types.ModuleType("smtplib")
+    fachada.__dict__.update({k: v for k, v in vars(smtplib).items() if not k.startswith("__")})
+    fachada.SMTP = SMTPAgrupado
+    fachada.SMTP_SSL = SMTPAgrupadoSSL
+    return fachada
+
+
+smtplib_agrupado = _crear_fachada_smtplib()
+
+
+def activar_pool_smtp(modulo):
+    """Hace que ``modulo`` (p. ej. utils.email_sender) use el pool; devuelve si se aplicó"""
+    if getattr(modulo, "smtplib", None) is smtplib:
+        modulo.smtplib = smtplib_agrupado
+        return True
+    return False
@@ -0,0 +1,219 @@
+"""
+Upsert por conjuntos de EntidadFinanciera con clave ``codigo_entidad``.
+
+- Los hashes de las filas existentes se leen con una consulta por bloque de
+  códigos; las entradas cuyo hash coincide no se envían a la base de datos.
+- Al actualizar solo se escriben los campos que trae la fuente: un campo
+  vacío o ausente en la entrada conserva lo guardado (p. ej. email_rgpd o
+  email_doc9 rellenados a mano, que el Banco de España no publica). Los
+  valores por defecto (tipo, estado, país, supervisor) solo se usan al
+  insertar.
+- En SQLite y PostgreSQL cada bloque se escribe con una sola sentencia
+  ``INSERT ... ON CONFLICT (codigo_entidad) DO UPDATE`` con
+  ``COALESCE(excluded.campo, campo)`` y un WHERE que compara columna a columna
+  (IS DISTINCT FROM) los campos presentes: aunque otra ejecución haya escrito
+  entre medias, una fila igual no se reescribe y su ``updated_at`` no cambia.
+- En otros motores (MySQL) se usa bulk_insert_mappings / bulk_update_mappings,
+  con solo los campos presentes en cada actualización.
+
+No hace falta columna nueva para el hash: se calcula sobre los campos que trae
+la entrada, tanto en la entrada como en lo guardado.
+"""
+
+import hashlib
+import json
+import re
+import unicodedata
+from datetime import date, datetime
+
+from sqlalchemy import and_, func, or_
+
+from models import db, EntidadFinanciera
+
+TAMANO_BLOQUE = 500
+
+# Campos que vienen de la fuente y se comparan / actualizan
+CAMPOS_SINCRONIZADOS = [
+    'nombre', 'nombre_comercial', 'tipo_entidad', 'estado', 'fecha_autorizacion',
+    'direccion_completa', 'direccion', 'numero', 'codigo_postal', 'localidad', 'provincia',
+    'comunidad_autonoma', 'pais', 'telefono', 'fax', 'web', 'email_doc9', 'email_rgpd',
+    'email_general', 'cif_nif', 'registro_mercantil', 'numero_registro', 'supervisor_principal',
+    'codigo_supervisor', 'nombre_busqueda', 'localidad_busqueda', 'provincia_busqueda',
+]
+# Se escriben al insertar/actualizar pero no cuentan como cambio
+CAMPOS_METADATOS = ['fuente_datos', 'version_datos']
+CAMPOS_OBLIGATORIOS = [c for c in CAMPOS_SINCRONIZADOS if not EntidadFinanciera.__table__.c[c].nullable]
+# Solo al insertar, si la fuente no trae el campo
+POR_DEFECTO = {
+    'tipo_entidad': 'Banco', 'estado': 'Activo', 'pais': 'España', 'supervisor_principal': 'Banco de España',
+}
+
+
+def limpiar_texto(texto):
+    """Limpia y normaliza texto para búsquedas"""
+    if not texto:
+        return ""
+    texto = unicodedata.normalize('NFD', texto)
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.lower().strip()
+    texto = re.sub(r'[^\w\s]', ' ', texto)
+    return re.sub(r'\s+', ' ', texto)
+
+
+def _valor(v):
+    if isinstance(v, str):
+        v = v.strip()
+        return v or None
+    return v
+
+
+def _fecha(v):
+    if not v or isinstance(v, date):
+        return v or None
+    try:
+        return datetime.strptime(str(v), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def normalizar_entidad(datos, fuente='Banco de España', version=None):
+    """
+    Diccionario de columnas de EntidadFinanciera a partir de los datos de la
+    fuente; los campos que la fuente no trae quedan a None (se conserva lo
+    guardado). Los valores por defecto se añaden con ``con_valores_por_defecto``.
+    """
+    fila = {campo: _valor(datos.get(campo)) for campo in CAMPOS_SINCRONIZADOS}
+    fila['codigo_entidad'] = _valor(datos.get('codigo_entidad'))
+    fila['fecha_autorizacion'] = _fecha(datos.get('fecha_autorizacion'))
+    # Algunas fuentes traen un único 'email'
+    fila['email_general'] = fila['email_general'] or _valor(datos.get('email'))
+    fila['nombre_busqueda'] = limpiar_texto(fila['nombre'] or '') or None
+    fila['localidad_busqueda'] = limpiar_texto(fila['localidad'] or '') or None
+    fila['provincia_busqueda'] = limpiar_texto(fila['provincia'] or '') or None
+    fila['fuente_datos'] = fuente
+    fila['version_datos'] = version or datetime.now().strftime('%Y%m%d')
+    return fila
+
+
+def con_valores_por_defecto(fila):
+    """Copia de ``fila`` lista para insertar: los campos obligatorios sin valor toman el defecto"""
+    return {**fila, **{campo: valor for campo, valor in POR_DEFECTO.items() if fila.get(campo) is None}}
+
+
+def campos_presentes(fila):
+    """Campos sincronizados que trae la entrada (los únicos que se comparan y escriben)"""
+    return [campo for campo in CAMPOS_SINCRONIZADOS if fila.get(campo) is not None]
+
+
+def hash_fila(fila, campos=CAMPOS_SINCRONIZADOS):
+    """Huella de ``campos`` (por defecto todos los sincronizados; los metadatos no cuentan)"""
+    valores = [[campo, fila.get(campo)] for campo in campos]
+    return hashlib.sha1(json.dumps(valores, default=str, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def estado_existente(codigos, tamano_bloque=TAMANO_BLOQUE):
+    """codigo_entidad -> (id, campos sincronizados) de las entidades ya guardadas"""
+    columnas = [EntidadFinanciera.id, EntidadFinanciera.codigo_entidad] + \
+               [getattr(EntidadFinanciera, c) for c in CAMPOS_SINCRONIZADOS]
+    codigos = list(codigos)
+    resultado = {}
+    for i in range(0, len(codigos), tamano_bloque):
+        bloque = codigos[i:i + tamano_bloque]
+        for fila in db.session.query(*columnas).filter(EntidadFinanciera.codigo_entidad.in_(bloque)):
+            resultado[fila[1]] = (fila[0], dict(zip(CAMPOS_SINCRONIZADOS, fila[2:])))
+    return resultado
+
+
+def _sentencia_on_conflict(dialecto, actualizar, ahora):
+    if dialecto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    tabla = EntidadFinanciera.__table__
+    stmt = insert(tabla)
+    if not actualizar:
+        return stmt.on_conflict_do_nothing(index_elements=['codigo_entidad'])
+    # Un campo a NULL en la entrada es un campo que la fuente no trae: se conserva lo guardado
+    cambios = {c: func.coalesce(stmt.excluded[c], tabla.c[c]) for c in CAMPOS_SINCRONIZADOS}
+    cambios.update({c: stmt.excluded[c] for c in CAMPOS_METADATOS})
+    cambios.update(updated_at=ahora, fecha_ultima_actualizacion=ahora)
+    return stmt.on_conflict_do_update(
+        index_elements=['codigo_entidad'],
+        set_=cambios,
+        where=or_(*[and_(stmt.excluded[c].isnot(None), tabla.c[c].is_distinct_from(stmt.excluded[c]))
+                    for c in CAMPOS_SINCRONIZADOS]),
+    )
+
+
+def upsert_entidades(entradas, actualizar=True, tamano_bloque=TAMANO_BLOQUE, fuente='Banco de España'):
+    """
+    Inserta las entidades nuevas y, si ``actualizar``, actualiza solo las que cambiaron.
+
+    Retorna {'procesadas', 'nuevas', 'actualizadas', 'sin_cambios', 'omitidas'}.
+    """
+    version = datetime.now().strftime('%Y%m%d')
+    filas, omitidas = {}, 0
+    for datos in entradas:
+        fila = normalizar_entidad(datos, fuente=fuente, version=version)
+        if not fila['codigo_entidad'] or not fila['nombre']:
+            omitidas += 1
+            continue
+        filas[fila['codigo_entidad']] = fila  # si se repite el código gana la última
+
+    existentes = estado_existente(filas.keys(), tamano_bloque)
+    nuevas, cambiadas, sin_cambios = [], [], 0
+    for codigo, fila in filas.items():
+        if codigo not in existentes:
+            nuevas.append(con_valores_por_defecto(fila))
+            continue
+        campos = campos_presentes(fila)
+        if hash_fila(fila, campos) == hash_fila(existentes[codigo][1], campos):
+            sin_cambios += 1
+        elif actualizar:
+            # Las columnas NOT NULL se comprueban antes del ON CONFLICT: si la fuente no
+            # trae el campo se envía lo ya guardado, que el COALESCE dejaría igual
+            guardado = existentes[codigo][1]
+            cambiadas.append({**fila, **{c: guardado[c] for c in CAMPOS_OBLIGATORIOS if fila.get(c) is None}})
+        else:
+            sin_cambios += 1
+
+    ahora = datetime.utcnow()
+    for fila in nuevas + cambiadas:
+        fila.update(created_at=ahora, updated_at=ahora, fecha_ultima_actualizacion=ahora)
+
+    dialecto = db.engine.dialect.name
+    try:
+        if dialecto in ('sqlite', 'postgresql'):
+            # Nuevas y cambiadas van en la misma sentencia (created_at solo se usa al insertar)
+            pendientes = nuevas + cambiadas
+            stmt = _sentencia_on_conflict(dialecto, actualizar, ahora)
+            for i in range(0, len(pendientes), tamano_bloque):
+                db.session.execute(stmt, pendientes[i:i + tamano_bloque])
+        else:
+            for i in range(0, len(nuevas), tamano_bloque):
+                db.session.bulk_insert_mappings(EntidadFinanciera, nuevas[i:i + tamano_bloque])
+            # Solo los campos que trae la entrada (mismo criterio que el COALESCE de ON CONFLICT)
+            actualizaciones = []
+            for fila in cambiadas:
+                cambios = {k: v for k, v in fila.items() if k != 'created_at' and k not in CAMPOS_SINCRONIZADOS}
+                cambios.update({campo: fila[campo] for campo in campos_presentes(fila)})
+                actualizaciones.append({**cambios, 'id': existentes[fila['codigo_entidad']][0]})
+            for i in range(0, len(actualizaciones), tamano_bloque):
+                db.session.bulk_update_mappings(EntidadFinanciera, actualizaciones[i:i + tamano_bloque])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if nuevas or cambiadas:
+        from utils.catalogo_entidades import catalogo_entidades
+        catalogo_entidades.invalidar()
+
+    return {
+        'procesadas': len(filas) + omitidas,
+        'nuevas': len(nuevas),
+        'actualizadas': len(cambiadas),
+        'sin_cambios': sin_cambios,
+        'omitidas': omitidas,
+    }